@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""
+Compare running many small commands with `Batch` against looping over `Shell.__call__`.
+
+::
+
+    python benchmarks/bench_batch.py [count]
+
+"""
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'src'))
+
+from clom import clom
+from clom.batch import Batch
+
+
+def main(count=500):
+    ops = [clom.echo('line', i) for i in range(count)]
+
+    start = time.time()
+    for op in ops:
+        op.shell()
+    loop = time.time() - start
+
+    start = time.time()
+    Batch(ops).run()
+    batch = time.time() - start
+
+    print('%d commands' % count)
+    print('shell loop: %.3fs (%.0f/s)' % (loop, count / loop))
+    print('batch:      %.3fs (%.0f/s)' % (batch, count / batch))
+    print('speedup:    %.1fx' % (loop / batch))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Compare running commands with environment variables rendered as an `env` prefix
+against passing them to the process directly.
+
+::
+
+    python benchmarks/bench_env.py [count]
+
+"""
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'src'))
+
+from clom import clom
+from clom.backend import get_default_backend
+
+
+def main(count=500):
+    op = clom.true.with_env(LANG='C', TZ='UTC', APP_ENV='production', APP_DEBUG='')
+    backend = get_default_backend()
+
+    start = time.time()
+    for _ in range(count):
+        backend.run(str(op))
+    rendered = time.time() - start
+
+    start = time.time()
+    for _ in range(count):
+        op.shell()
+    passthrough = time.time() - start
+
+    print('%d commands' % count)
+    print('env prefix:  %.3fs (%.2fms each)' % (rendered, rendered * 1000 / count))
+    print('passthrough: %.3fs (%.2fms each)' % (passthrough, passthrough * 1000 / count))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Time `import clom` with `python -X importtime`, against importing everything needed
+to run commands.
+
+::
+
+    python benchmarks/bench_import.py [runs]
+
+"""
+import subprocess
+import sys
+from os import path
+
+src = path.join(path.dirname(path.dirname(path.realpath(__file__))), 'src')
+
+STATEMENTS = [
+    ('import clom', 'clom'),
+    ('import clom.shell', 'clom.shell'),
+]
+
+
+def import_time(statement, module):
+    """
+    Microseconds `module` took to import, including its own imports.
+    """
+    p = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', statement],
+                         cwd=src, stderr=subprocess.PIPE, universal_newlines=True)
+    _, stderr = p.communicate()
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Top level modules only, their imports are in their cumulative time
+        if not name.startswith('  ') and name.strip() in ('clom', module):
+            try:
+                total += int(cumulative)
+            except ValueError:
+                pass
+    return total
+
+
+def main(runs=20):
+    # Warm the bytecode cache
+    for statement, module in STATEMENTS:
+        import_time(statement, module)
+
+    for statement, module in STATEMENTS:
+        times = sorted(import_time(statement, module) for _ in range(runs))
+        print('%-20s median %6.2fms  min %6.2fms' % (
+            statement, times[len(times) // 2] / 1000.0, times[0] / 1000.0))
+
+    p = subprocess.Popen([sys.executable, '-c', 'import sys, clom; print(" ".join(sorted(m for m in sys.modules if m.startswith("clom"))))'],
+                         cwd=src, stdout=subprocess.PIPE, universal_newlines=True)
+    print('loaded by import clom: %s' % p.communicate()[0].strip())
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""
+Time repeated line access on a large `CommandResult`.
+
+::
+
+    python benchmarks/bench_lines.py [lines] [repeats]
+
+"""
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'src'))
+
+from clom.shell import CommandResult
+
+
+def main(lines=1000000, repeats=100):
+    stdout = ''.join('%d some output on this line\n' % i for i in range(lines))
+    r = CommandResult(0, stdout)
+
+    start = time.time()
+    len(r)
+    print('index %d lines:  %.3fs' % (lines, time.time() - start))
+
+    start = time.time()
+    r.all()
+    print('all():           %.3fs' % (time.time() - start))
+
+    start = time.time()
+    for i in range(repeats):
+        r.first(), r.last(), r[i * (lines // repeats)], len(r)
+    print('%d x first, last, [i], len: %.6fs' % (repeats, time.time() - start))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
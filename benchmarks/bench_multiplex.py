@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Compare running many concurrent commands with a thread per command against the
+single-threaded `Multiplexer`.
+
+::
+
+    python benchmarks/bench_multiplex.py [count]
+
+"""
+import resource
+import sys
+import threading
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'src'))
+
+from clom import clom
+from clom.multiplex import Multiplexer
+from clom._pool import imap_unordered
+
+
+def main(count=1000):
+    ops = [clom.sh(c='sleep 0.5; echo %d' % i) for i in range(count)]
+    peak = [threading.active_count()]
+
+    def run(op):
+        peak[0] = max(peak[0], threading.active_count())
+        return op.shell()
+
+    start = time.time()
+    list(imap_unordered(run, ops, count))
+    threaded = time.time() - start
+    threads = peak[0]
+
+    start = time.time()
+    list(Multiplexer(max_running=None).run(ops))
+    multiplexed = time.time() - start
+
+    print('%d commands sleeping 0.5s, max open files %d' % (count, resource.getrlimit(resource.RLIMIT_NOFILE)[0]))
+    print('threads:     %.3fs, %d threads' % (threaded, threads))
+    print('multiplexer: %.3fs, %d thread' % (multiplexed, threading.active_count()))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
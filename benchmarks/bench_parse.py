@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Parse throughput for a large set of config command lines, with and without the cache.
+
+::
+
+    python benchmarks/bench_parse.py [lines] [distinct]
+
+"""
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'src'))
+
+from clom import clom, parser
+
+TEMPLATES = [
+    "rsync -az --delete --exclude='*.pyc' /srv/app/{i}/ deploy@web{i}:/srv/app/",
+    "env DJANGO_SETTINGS_MODULE=app.settings{i} python manage.py migrate --noinput",
+    "tar czf /backups/db{i}.tgz -C /var/lib/postgresql data 2> /dev/null",
+    "( pg_dump app{i} || echo 'dump failed' ) | gzip > /backups/app{i}.sql.gz",
+    "find /var/log/app{i} -name '*.log' -mtime +7 | xargs rm -f",
+    "curl -fsS --retry 3 -H 'X-Host: web{i}' http://localhost:80{i}/health && touch /tmp/ok{i}",
+]
+
+
+def main(lines=100000, distinct=1000):
+    configs = [TEMPLATES[i % len(TEMPLATES)].format(i=i % distinct) for i in range(lines)]
+    unique = sorted(set(configs))
+
+    # Uncached: parse every line from scratch
+    start = time.time()
+    for line in configs:
+        parser._Parser(line, clom).parse()
+    uncached = time.time() - start
+
+    parser._cache.clear()
+    start = time.time()
+    for line in configs:
+        parser.parse(line)
+    cached = time.time() - start
+
+    print('%d lines, %d distinct' % (lines, len(unique)))
+    print('uncached: %.3fs (%.0f lines/s)' % (uncached, lines / uncached))
+    print('cached:   %.3fs (%.0f lines/s)' % (cached, lines / cached))
+    print(parser.parse_cache_info())
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Compare running a burst of small commands with a new process each against a
+`ShellPool` of warm shells.
+
+::
+
+    python benchmarks/bench_shellpool.py [count] [size]
+
+"""
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'src'))
+
+from clom import clom
+from clom.shellpool import ShellPool
+from clom._pool import imap_unordered
+
+
+def main(count=2000, size=8):
+    ops = [clom.echo(i) for i in range(count)]
+
+    start = time.time()
+    list(imap_unordered(lambda op: op.shell(), ops, size))
+    spawned = time.time() - start
+
+    with ShellPool(size=size) as pool:
+        start = time.time()
+        pool.map(ops)
+        pooled = time.time() - start
+
+    print('%d commands, %d at a time' % (count, size))
+    print('spawn each: %.3fs' % spawned)
+    print('shell pool: %.3fs' % pooled)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Process start latency against the parent's resident memory, for each spawner.
+
+The parent grows its RSS by touching a ballast buffer, then starts `true` with each
+spawner. `fork` forces `subprocess.Popen` to fork by giving it a `preexec_fn`, which
+is what Popen does on Pythons that can't vfork. `server` is a `SpawnServer` started
+before the parent grows.
+
+::
+
+    python benchmarks/bench_spawn.py [count] [max MB]
+
+"""
+import subprocess
+import sys
+import time
+from os import path
+
+sys.path.insert(0, path.join(path.dirname(path.dirname(path.realpath(__file__))), 'src'))
+
+from clom.forkserver import SpawnServer
+from clom.spawn import PopenSpawner, PosixSpawner
+
+
+class ForkSpawner(PopenSpawner):
+    def spawn(self, cmd, **kwargs):
+        return super(ForkSpawner, self).spawn(cmd, preexec_fn=lambda: None, **kwargs)
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * 4096 // (1024 * 1024)
+
+
+def latency(spawner, count):
+    start = time.time()
+    for _ in range(count):
+        spawner.spawn(['true'], stdout=subprocess.DEVNULL).wait()
+    return (time.time() - start) * 1000 / count
+
+
+def main(count=200, max_mb=2048):
+    spawners = [
+        ('fork', ForkSpawner()),
+        ('popen', PopenSpawner()),
+        ('posix_spawn', PosixSpawner()),
+        ('server', SpawnServer()),
+    ]
+    ballast = []
+    print('%8s  %s' % ('RSS MB', '  '.join('%12s' % name for name, _ in spawners)))
+    size = 0
+    while True:
+        row = [latency(spawner, count) for _, spawner in spawners]
+        print('%8d  %s' % (rss_mb(), '  '.join('%10.3fms' % ms for ms in row)))
+        if size >= max_mb:
+            break
+        step = 256 if size < 512 else 512
+        ballast.append(bytearray(b'x' * (step * 1024 * 1024)))
+        size += step
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -1,6 +1,8 @@
+import sys
+
 from clom.arg import NOTSET, STDIN, STDOUT, STDERR
 from clom.command import Command, AND, OR
-from clom.fabric import FabCommand
+from clom._cache import LRUCache
 
 __all__ = [
     'clom',
@@ -10,32 +12,96 @@ __all__ = [
     'NOTSET',
     'AND',
     'OR',
+    'parse',
 ]
 
+# Loaded on first use so scripts that only render commands start quickly
+_LAZY = {
+    'parse': 'clom.parser',
+    'FabCommand': 'clom.fabric',
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(__import__(module, fromlist=[name]), name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ (PEP 562) is new in 3.7, import everything up front before it
+    from clom.parser import parse
+    from clom.fabric import FabCommand
+
+
 class Clom(object):
     """
     Manager for generating commands.
     """
     NOTSET = NOTSET
 
-    def __init__(self):
-        self._commands = {
-            'fab' : FabCommand(self, 'fab')
+    def __init__(self, backend=None, cache_size=1024, resolver=None):
+        """
+        :param backend: `clom.backend.Backend` to run this clom's commands with,
+                        defaults to the default backend
+        :param cache_size: Maximum number of commands to keep built, `None` for no limit
+        :param resolver: `clom.resolver.Resolver` used to render commands with the absolute
+                         path of their executable, `True` to use one that searches `PATH`
+        """
+        self._backend = backend
+        if resolver is True:
+            from clom.resolver import Resolver
+            resolver = Resolver()
+        self._resolver = resolver
+        self._commands = LRUCache(cache_size)
+
+    def __getstate__(self):
+        # The cache holds a lock, pickle the settings and build a new one
+        return {
+            'backend': self._backend,
+            'cache_size': self._commands.maxsize,
+            'resolver': self._resolver,
         }
 
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _create(self, name):
+        if name == 'fab':
+            from clom.fabric import FabCommand
+            return FabCommand(self, name)
+        return Command(self, name)
+
     def __getattr__(self, name):
         """
         Get a command.
 
+        Commands are built once and shared. This is safe since every method that
+        changes a command returns a changed copy instead.
+
         ::
 
             >>> clom.cat
             'cat'
+            >>> clom.cat is clom.cat
+            True
+
+        """
+        commands = self.__dict__.get('_commands')
+        if commands is None or name.startswith('__'):
+            raise AttributeError(name)
+        return commands.get(name, lambda: self._create(name))
+
+    def cache_info(self):
+        """
+        Statistics for the cache of built commands.
 
+        :returns: dict - `hits`, `misses`, `evictions`, `size` and `maxsize`
         """
-        if name not in self._commands:
-            self._commands[name] = Command(self, name)
-        return self._commands[name]._clone()
+        return self._commands.info()
 
     def __getitem__(self, name):
         """
@@ -0,0 +1,87 @@
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread-safe mapping that holds at most `maxsize` items, evicting the least
+    recently used.
+
+    ::
+
+        >>> cache = LRUCache(2)
+        >>> cache.get('a', lambda: 1)
+        1
+        >>> cache.get('a', lambda: 2)
+        1
+        >>> cache.get('b', lambda: 2), cache.get('c', lambda: 3)
+        (2, 3)
+        >>> 'a' in cache
+        False
+        >>> cache.info()
+        {'hits': 1, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2}
+
+    """
+    def __init__(self, maxsize=128):
+        """
+        :param maxsize: Maximum number of items, `None` for no limit
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, factory):
+        """
+        Get the item for `key`, creating it with `factory()` if it isn't cached.
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                pass
+            else:
+                self._data[key] = value
+                self.hits += 1
+                return value
+
+            self.misses += 1
+
+        # Create outside the lock so a slow factory doesn't block other keys. If
+        # another thread created the same key meanwhile, theirs wins.
+        value = factory()
+
+        with self._lock:
+            if key in self._data:
+                return self._data[key]
+            self._data[key] = value
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        """
+        Dictionary of hit, miss and eviction counts and the current and maximum size.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+            }
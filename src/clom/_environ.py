@@ -0,0 +1,72 @@
+import os
+import threading
+
+from clom._cache import LRUCache
+
+
+class EnvironSnapshot(object):
+    """
+    A copy of `os.environ` that's only taken again when the environment changes,
+    and the environments made by merging variables into it.
+
+    The dictionaries returned are shared between callers and must not be changed.
+
+    ::
+
+        >>> snapshot = EnvironSnapshot()
+        >>> env = snapshot.merged({'CLOM_TEST': '1'})
+        >>> env['CLOM_TEST'], env is snapshot.merged({'CLOM_TEST': '1'})
+        ('1', True)
+        >>> 'CLOM_TEST' in os.environ
+        False
+
+    """
+    def __init__(self, maxsize=128):
+        """
+        :param maxsize: Maximum number of merged environments to keep
+        """
+        self._raw = None
+        self._environ = None
+        self._merged = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def environ(self):
+        """
+        The current environment as a dictionary.
+        """
+        # os.environ keeps the encoded environment in _data, comparing it is much
+        # cheaper than decoding every variable again
+        raw = getattr(os.environ, '_data', None)
+        with self._lock:
+            if raw is None or self._environ is None or raw != self._raw:
+                self._raw = dict(raw) if raw is not None else None
+                self._environ = dict(os.environ)
+                self._merged.clear()
+            return self._environ
+
+    def merged(self, variables):
+        """
+        The current environment with `variables` added.
+
+        :param variables: dict - Variable names to string values
+        """
+        environ = self.environ()
+        if not variables:
+            return environ
+
+        def merge():
+            env = environ.copy()
+            env.update(variables)
+            return env
+
+        return self._merged.get(tuple(sorted(variables.items())), merge)
+
+
+_snapshot = EnvironSnapshot()
+
+
+def merged_environ(variables):
+    """
+    The current environment with `variables` added, see `EnvironSnapshot.merged`.
+    """
+    return _snapshot.merged(variables)
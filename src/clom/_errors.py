@@ -0,0 +1,11 @@
+class CommandError(Exception):
+    """
+    An error returned from a shell command.
+    """
+    def __init__(self, return_code, stdout, stderr, message):
+        super(CommandError, self).__init__(message)
+
+        self.stdout = stdout
+        self.stderr = stderr
+        self.code = return_code
+        self.return_code = return_code
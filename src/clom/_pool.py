@@ -0,0 +1,54 @@
+import threading
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+_DONE = object()
+
+
+def imap_unordered(func, items, workers):
+    """
+    Call `func` on each item with at most `workers` threads, yielding
+    `(item, return value)` as each call finishes.
+
+    If `func` raises, the remaining items still run and the first exception is
+    re-raised once they have.
+    """
+    items = list(items)
+    if not items:
+        return
+
+    todo = Queue()
+    for item in items:
+        todo.put(item)
+
+    done = Queue()
+
+    def worker():
+        while True:
+            item = todo.get()
+            if item is _DONE:
+                return
+            try:
+                done.put((item, func(item), None))
+            except Exception as e:
+                done.put((item, None, e))
+
+    for i in range(max(1, min(workers, len(items)))):
+        todo.put(_DONE)
+        t = threading.Thread(target=worker)
+        t.daemon = True
+        t.start()
+
+    error = None
+    for i in range(len(items)):
+        item, value, e = done.get()
+        if e is None:
+            yield item, value
+        elif error is None:
+            error = e
+
+    if error is not None:
+        raise error
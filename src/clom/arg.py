@@ -9,6 +9,7 @@ __all__ = [
     'STDERR',
     'RawArg',
     'LiteralArg',
+    'QuotedArg',
 ]
 
 #: Represents an argument that is not set as opposed to `None` which is a valid value
@@ -73,6 +74,27 @@ class LiteralArg(BaseArg):
         d = "'" + d.replace("'", "'\\''") + "'"
         return d
 
+class QuotedArg(LiteralArg):
+    """
+    A literal argument that keeps the quoting it was written with.
+
+    Created when parsing command lines so that they render back the way they
+    were written. The value is still available as `data`.
+
+    ::
+
+        >>> a = QuotedArg('hello world', '"hello world"')
+        >>> str(a), a.data
+        ('"hello world"', 'hello world')
+
+    """
+    def __init__(self, data, text):
+        super(QuotedArg, self).__init__(data)
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
 class Arg(BaseArg):
     """
     A command line argument that is minimally escaped.
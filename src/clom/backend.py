@@ -0,0 +1,289 @@
+import copy
+import errno
+import os
+import subprocess
+import tempfile
+import logging
+
+from clom import arg
+from clom._compat import string_types
+from clom.spawn import get_default_spawner
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'Backend',
+    'LocalBackend',
+    'SSHBackend',
+    'FakeBackend',
+    'get_default_backend',
+    'set_default_backend',
+]
+
+
+class Backend(object):
+    """
+    Executes commands for a `Shell`.
+
+    Subclasses implement `popen`, and may override `run` if they don't start real processes.
+    """
+
+    #: `True` if argument lists are executed directly instead of through a shell
+    direct = False
+
+    #: `clom.spawn.Spawner` used to start local processes, `None` for the default
+    spawner = None
+
+    def with_spawner(self, spawner):
+        """
+        A copy of this backend that starts processes with `spawner`.
+
+        :param spawner: `clom.spawn.Spawner`
+        """
+        if spawner is self.spawner:
+            return self
+        backend = copy.copy(self)
+        backend.spawner = spawner
+        return backend
+
+    def _spawn(self, cmd, **kwargs):
+        return (self.spawner or get_default_spawner()).spawn(cmd, **kwargs)
+
+    def popen(self, cmd, **kwargs):
+        """
+        Start a command.
+
+        :param cmd: Command string, or argument list
+        :param kwargs: Passed on to `subprocess.Popen`
+        :returns: `subprocess.Popen`
+        """
+        raise NotImplementedError('%s can not start processes' % self.__class__.__name__)
+
+    def run(self, cmd, capture=True, encoding=None, env=None):
+        """
+        Run a command to completion.
+
+        :param cmd: Command string, or argument list
+        :param capture: Capture the output instead of letting it go to this process's stdout and stderr
+        :param encoding: Encoding to decode captured output with
+        :param env: Complete environment to run the command with instead of this process's.
+                    Only passed by `Shell` to backends that are `direct`.
+        :returns: tuple - `(status, stdout, stderr)`
+        """
+        pipe = subprocess.PIPE if capture else None
+        kwargs = {} if env is None else {'env': env}
+        try:
+            p = self.popen(cmd, stdout=pipe, stderr=pipe, **kwargs)
+        except OSError as e:
+            if isinstance(cmd, string_types):
+                raise
+            # Report a missing or unusable program the way the shell would
+            status = 127 if e.errno == errno.ENOENT else 126
+            return status, '', '%s: %s\n' % (cmd[0], e.strerror)
+
+        (stdout, stderr) = p.communicate()
+        if not capture:
+            return p.returncode, '', ''
+        if encoding:
+            stdout = stdout.decode(encoding)
+            stderr = stderr.decode(encoding)
+        return p.returncode, stdout, stderr
+
+
+class LocalBackend(Backend):
+    """
+    Runs commands on this machine. Strings are run by `sh`, argument lists are executed directly.
+    """
+    direct = True
+
+    def popen(self, cmd, **kwargs):
+        return self._spawn(cmd, **kwargs)
+
+    def __repr__(self):
+        return '<LocalBackend>'
+
+
+class SSHBackend(Backend):
+    """
+    Runs commands on a remote host over SSH.
+
+    Every command to the same host shares one connection through OpenSSH's
+    `ControlMaster` multiplexing. The first command opens the master connection
+    and it is kept open for `persist` seconds after the last one, so only the
+    first command pays for the handshake.
+
+    ::
+
+        >>> web = SSHBackend('web1.example.com', user='deploy')
+        >>> web.ssh_argv('uptime')[-2:]
+        ['deploy@web1.example.com', 'uptime']
+        >>> clom.uptime.with_backend(web).shell()     # doctest: +SKIP
+        <CommandResult return_code=0, stdout=69 bytes, stderr=0 bytes>
+
+    """
+    def __init__(self, host, user=None, port=None, ssh='ssh', options=None, control_dir=None, persist=60):
+        """
+        :param host: Host to connect to
+        :param user: User to log in as
+        :param port: Port to connect to
+        :param ssh: ssh program, or argument list to start it with. Any program that
+                    accepts ssh's arguments can stand in as the transport.
+        :param options: Dictionary of extra `-o` options
+        :param control_dir: Directory for the control sockets, defaults to the temp directory
+        :param persist: Seconds to keep the master connection open after the last command
+        """
+        self.host = host
+        self.user = user
+        self.port = port
+        self.ssh = [ssh] if isinstance(ssh, string_types) else list(ssh)
+        self.options = dict(options or {})
+        self.control_dir = control_dir or tempfile.gettempdir()
+        self.persist = persist
+
+    def __repr__(self):
+        return '<SSHBackend %s>' % self.target
+
+    @property
+    def target(self):
+        if self.user:
+            return '%s@%s' % (self.user, self.host)
+        return self.host
+
+    @property
+    def control_path(self):
+        """
+        Path of the control socket shared by connections to this host.
+        """
+        # %C is a hash of the local host, remote host, port and user
+        return os.path.join(self.control_dir, 'clom-ssh-%C')
+
+    def _base_argv(self):
+        argv = list(self.ssh)
+        options = {
+            'ControlMaster': 'auto',
+            'ControlPath': self.control_path,
+            'ControlPersist': str(self.persist),
+        }
+        options.update(self.options)
+        for name, value in sorted(options.items()):
+            argv.extend(('-o', '%s=%s' % (name, value)))
+        if self.port:
+            argv.extend(('-p', str(self.port)))
+        return argv
+
+    def ssh_argv(self, cmd):
+        """
+        Argument list for running `cmd` on the host.
+
+        :param cmd: Command string, or argument list which is escaped for the remote shell
+        """
+        if not isinstance(cmd, string_types):
+            cmd = ' '.join(str(arg.LiteralArg(a)) for a in cmd)
+        return self._base_argv() + [self.target, cmd]
+
+    def popen(self, cmd, **kwargs):
+        argv = self.ssh_argv(cmd)
+        log.debug('SSH: %s' % ' '.join(argv))
+        return self._spawn(argv, **kwargs)
+
+    def _control(self, command):
+        argv = self._base_argv() + ['-O', command, self.target]
+        devnull = open(os.devnull, 'r+b')
+        try:
+            return subprocess.call(argv, stdin=devnull, stdout=devnull, stderr=devnull)
+        finally:
+            devnull.close()
+
+    def is_connected(self):
+        """
+        Is there an open master connection to the host.
+        """
+        return self._control('check') == 0
+
+    def close(self):
+        """
+        Close the master connection to the host.
+        """
+        if self.is_connected():
+            self._control('exit')
+
+
+class FakeBackend(Backend):
+    """
+    Records commands instead of running them. Useful for tests.
+
+    ::
+
+        >>> import re
+        >>> fake = FakeBackend()
+        >>> fake.respond('whoami', stdout='root\\n')
+        >>> fake.respond(re.compile('^rm '), return_code=1, stderr='rm: denied\\n')
+        >>> str(clom.whoami.with_backend(fake).shell())
+        'root'
+        >>> clom.rm('/etc/passwd').with_backend(fake).shell()    # doctest:+IGNORE_EXCEPTION_DETAIL
+        Traceback (most recent call last):
+            ...
+        CommandError: Error while executing "rm /etc/passwd" (1):
+        rm: denied
+        >>> fake.calls
+        ['whoami', 'rm /etc/passwd']
+
+    """
+    def __init__(self, return_code=0, stdout='', stderr=''):
+        """
+        Arguments are the response to commands that don't match any added with `respond`.
+        """
+        #: Command strings that were run, in order
+        self.calls = []
+        self._default = (return_code, stdout, stderr)
+        self._responses = []
+
+    def respond(self, cmd, return_code=0, stdout='', stderr=''):
+        """
+        Set the response for a command.
+
+        :param cmd: Command string, or compiled regular expression to search command strings with
+        """
+        self._responses.append((cmd, (return_code, stdout, stderr)))
+
+    def _match(self, cmd):
+        for pattern, response in reversed(self._responses):
+            if isinstance(pattern, string_types):
+                if pattern == cmd:
+                    return response
+            elif pattern.search(cmd):
+                return response
+        return self._default
+
+    def run(self, cmd, capture=True, encoding=None, env=None):
+        if not isinstance(cmd, string_types):
+            cmd = ' '.join(str(arg.LiteralArg(a)) for a in cmd)
+        self.calls.append(cmd)
+        status, stdout, stderr = self._match(cmd)
+        if not capture:
+            return status, '', ''
+        return status, stdout, stderr
+
+    def __repr__(self):
+        return '<FakeBackend calls=%d>' % len(self.calls)
+
+
+_default_backend = LocalBackend()
+
+
+def get_default_backend():
+    """
+    The backend used by operations that don't have one set with `Operation.with_backend`.
+    """
+    return _default_backend
+
+
+def set_default_backend(backend):
+    """
+    Change the backend used by operations that don't have one set.
+
+    :returns: Backend - The previous default
+    """
+    global _default_backend
+    previous, _default_backend = _default_backend, backend
+    return previous
@@ -0,0 +1,105 @@
+import subprocess
+import uuid
+import logging
+
+from clom.backend import get_default_backend
+from clom.shell import CommandError, CommandResult
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'Batch',
+]
+
+
+class Batch(object):
+    """
+    Run many independent operations with a single shell process.
+
+    The operations are rendered into one script that is fed to the shell on stdin.
+    After each operation a marker line carrying its exit code is written to stdout
+    and stderr so the output can be split back up into one `CommandResult` per
+    operation, in order.
+
+    ::
+
+        >>> results = Batch([clom.echo('foo'), clom.false, clom.echo('bar')]).run()
+        >>> [(r.return_code, str(r)) for r in results]
+        [(0, 'foo'), (1, ''), (0, 'bar')]
+
+    """
+
+    #: Shell the script is run with
+    shell = '/bin/sh'
+
+    def __init__(self, operations, isolate=False, backend=None):
+        """
+        :param operations: List of Operations to run
+        :param isolate: Run each operation in its own subshell so that `cd`, `exit`,
+                        variable assignments and so on can't affect the others.
+                        Costs a fork per operation.
+        :param backend: `clom.backend.Backend` to run the script with, defaults to the default backend
+        """
+        self.operations = list(operations)
+        self.isolate = isolate
+        self.backend = backend or get_default_backend()
+        self._marker = '__clom_batch_%s' % uuid.uuid4().hex
+
+    def __len__(self):
+        return len(self.operations)
+
+    def script(self):
+        """
+        Render the script that runs the batch.
+
+        Each operation's stdin is `/dev/null` since the script itself is read from stdin.
+        """
+        open_, close = ('(', ')') if self.isolate else ('{', '}')
+        lines = []
+        for operation in self.operations:
+            lines.append('%s %s\n%s </dev/null' % (open_, operation, close))
+            lines.append("printf '\\n%%s %%d\\n' %s $?" % self._marker)
+            lines.append("printf '\\n%%s\\n' %s >&2" % self._marker)
+        lines.append('')
+        return '\n'.join(lines)
+
+    def run(self):
+        """
+        Run the batch.
+
+        :raises: CommandError if the script stopped before every operation ran, for
+                 example if one of them called `exit` without `isolate`. The results of the
+                 operations that did run are in the error's `results`.
+        :returns: list - `CommandResult` for each operation, in order. Results are
+                  returned for failed operations too, check their `return_code`.
+        """
+        script = self.script()
+        log.info('Executing batch of %d commands' % len(self))
+
+        p = self.backend.popen([self.shell, '-s'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = p.communicate(script.encode('UTF-8'))
+
+        marker = self._marker.encode('ascii')
+        out_chunks = stdout.split(b'\n' + marker + b' ')
+        err_chunks = stderr.split(b'\n' + marker + b'\n')
+
+        results = []
+        out = out_chunks[0]
+        for operation, chunk, err in zip(self.operations, out_chunks[1:], err_chunks):
+            status, _, next_out = chunk.partition(b'\n')
+            encoding = operation._encoding
+            if encoding:
+                results.append(CommandResult(int(status), out.decode(encoding), err.decode(encoding)))
+            else:
+                results.append(CommandResult(int(status), out, err))
+            out = next_out
+
+        if len(results) != len(self):
+            error = CommandError(p.returncode, stdout, stderr,
+                                 'Batch stopped after %d of %d commands (%s)' % (
+                                     len(results), len(self), p.returncode))
+            error.results = results
+            raise error
+
+        return results
@@ -0,0 +1,251 @@
+import base64
+import json
+import os
+import threading
+import logging
+
+from clom import arg
+from clom._compat import string_types
+from clom.backend import Backend, get_default_backend, set_default_backend
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'CassetteBackend',
+    'CassetteError',
+]
+
+# Layout of cassette files, bumped whenever it changes
+_VERSION = 1
+
+
+class CassetteError(Exception):
+    """
+    A command was run that isn't in the cassette, and the cassette can't record it.
+    """
+    def __init__(self, cmd, env, message):
+        super(CassetteError, self).__init__(message)
+        self.cmd = cmd
+        self.env = env
+
+
+def _encode(data):
+    if isinstance(data, bytes):
+        return {'base64': base64.b64encode(data).decode('ascii')}
+    return data
+
+
+def _decode(data):
+    if isinstance(data, dict):
+        return base64.b64decode(data['base64'].encode('ascii'))
+    return data
+
+
+class CassetteBackend(Backend):
+    """
+    Records the commands run through another backend, and their results, to a
+    file and serves them from it later without starting anything.
+
+    Each interaction stores the command string, the environment variables it
+    was given that differ from this process's, and its return code, stdout and
+    stderr, so failed commands replay as the same `CommandError`.
+
+    Recorded interactions are kept in memory and written when the cassette is
+    closed, in one go to a temporary file that replaces the cassette, so a crash
+    while recording leaves the previous cassette as it was.
+
+    ::
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'cassette.json')
+        >>> cassette = CassetteBackend(path, mode='record')
+        >>> str(clom.echo('hi').with_backend(cassette).shell())
+        'hi'
+        >>> cassette.close()
+        >>> replay = CassetteBackend(path, mode='replay')
+        >>> str(clom.echo('hi').with_backend(replay).shell())
+        'hi'
+        >>> clom.echo('bye').with_backend(replay).shell()    # doctest:+IGNORE_EXCEPTION_DETAIL
+        Traceback (most recent call last):
+            ...
+        CassetteError: 'echo bye' is not in the cassette
+
+    Use it as a context manager to make it the default backend for everything
+    run inside and close it at the end::
+
+        with CassetteBackend('tests/cassettes/deploy.json'):
+            deploy()
+
+    Processes are never started through a cassette, so `popen` isn't available
+    and streaming falls back to buffered results.
+    """
+    #: Ways of using the cassette
+    modes = ('auto', 'record', 'replay')
+    #: Ways of matching commands to recorded interactions
+    matches = ('strict', 'lenient')
+
+    def __init__(self, path, mode='auto', match='strict', backend=None):
+        """
+        :param path: File to store interactions in
+        :param mode: `'replay'` only serves recorded interactions, `'record'` runs every
+                     command and replaces what was recorded, `'auto'` serves recorded
+                     interactions and records the rest
+        :param match: `'strict'` matches the command and its environment variables and
+                      serves each recorded interaction once, in the order recorded.
+                      `'lenient'` matches the command alone and serves the most recent
+                      matching interaction as often as it's asked for.
+        :param backend: `clom.backend.Backend` that runs commands being recorded,
+                        defaults to the default backend
+        """
+        if mode not in self.modes:
+            raise ValueError('Unknown mode %r, expected one of %r' % (mode, self.modes))
+        if match not in self.matches:
+            raise ValueError('Unknown match %r, expected one of %r' % (match, self.matches))
+        self.path = path
+        self.mode = mode
+        self.match = match
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._previous = None
+        self._direct = None
+        #: Recorded interactions, dictionaries of `command`, `env`, `return_code`, `stdout` and `stderr`
+        self.interactions = []
+        self._played = set()
+        # Interactions recorded since the file was written
+        self._unsaved = False
+        if mode != 'record':
+            self.load()
+
+    def __repr__(self):
+        return '<CassetteBackend %s mode=%s match=%s>' % (self.path, self.mode, self.match)
+
+    def _inner(self):
+        """
+        The backend commands are recorded from.
+        """
+        backend = self.backend or get_default_backend()
+        if backend is self:
+            # Installed as the default with `with`
+            backend = self._previous
+        return backend
+
+    @property
+    def direct(self):
+        # Commands are rendered differently for direct backends, replay them the
+        # way they were recorded whatever backend is around now
+        if self.mode == 'replay' and self._direct is not None:
+            return self._direct
+        return self._inner().direct
+
+    def load(self):
+        """
+        Read the interactions from the file, if it exists.
+        """
+        if not os.path.exists(self.path):
+            if self.mode == 'replay':
+                raise IOError('Cassette %s does not exist' % self.path)
+            return
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get('version') != _VERSION:
+            raise ValueError('Unsupported cassette version %r in %s' % (data.get('version'), self.path))
+        self.interactions = data['interactions']
+        self._direct = data.get('direct')
+        self._played = set()
+
+    def save(self):
+        """
+        Write the interactions to the file, replacing it at once.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'version': _VERSION, 'direct': self.direct, 'interactions': self.interactions},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.rename(tmp, self.path)
+
+    @property
+    def unplayed(self):
+        """
+        Recorded interactions that haven't been served, in strict matching.
+        """
+        return [i for n, i in enumerate(self.interactions) if n not in self._played]
+
+    def _find(self, cmd, env):
+        if self.match == 'lenient':
+            for interaction in reversed(self.interactions):
+                if interaction['command'] == cmd:
+                    return interaction
+            return None
+
+        for n, interaction in enumerate(self.interactions):
+            if n not in self._played and interaction['command'] == cmd and interaction['env'] == env:
+                self._played.add(n)
+                return interaction
+        return None
+
+    def run(self, cmd, capture=True, encoding=None, env=None):
+        key = cmd
+        if not isinstance(key, string_types):
+            key = ' '.join(str(arg.LiteralArg(a)) for a in cmd)
+        # Only what the command was given, not the whole environment of whoever recorded it
+        variables = dict((k, v) for k, v in (env or {}).items() if os.environ.get(k) != v)
+
+        with self._lock:
+            interaction = None if self.mode == 'record' else self._find(key, variables)
+        if interaction is None:
+            if self.mode == 'replay':
+                raise CassetteError(key, variables, '%r is not in the cassette %s' % (key, self.path))
+            return self._record(cmd, key, capture, encoding, env, variables)
+
+        log.debug('Replaying %s' % key)
+        if not capture:
+            return interaction['return_code'], '', ''
+        stdout = _decode(interaction['stdout'])
+        stderr = _decode(interaction['stderr'])
+        if encoding and isinstance(stdout, bytes):
+            stdout = stdout.decode(encoding)
+            stderr = stderr.decode(encoding)
+        elif not encoding and not isinstance(stdout, bytes):
+            stdout = stdout.encode('UTF-8')
+            stderr = stderr.encode('UTF-8')
+        return interaction['return_code'], stdout, stderr
+
+    def _record(self, cmd, key, capture, encoding, env, variables):
+        log.debug('Recording %s' % key)
+        status, stdout, stderr = self._inner().run(cmd, capture=capture, encoding=encoding, env=env)
+        with self._lock:
+            self.interactions.append({
+                'command': key,
+                'env': variables,
+                'return_code': status,
+                'stdout': _encode(stdout),
+                'stderr': _encode(stderr),
+            })
+            self._played.add(len(self.interactions) - 1)
+            self._unsaved = True
+        return status, stdout, stderr
+
+    def close(self):
+        """
+        Write the interactions recorded since the cassette was opened, if any.
+        """
+        with self._lock:
+            if self._unsaved:
+                self.save()
+                self._unsaved = False
+
+    def __enter__(self):
+        """
+        Make this the default backend until the block exits.
+        """
+        self._previous = set_default_backend(self)
+        return self
+
+    def __exit__(self, *exc):
+        set_default_backend(self._previous)
+        self._previous = None
+        self.close()
@@ -1,7 +1,7 @@
 from functools import wraps
 
 from clom import arg
-from clom.shell import Shell
+from clom.priority import Priority
 from clom._compat import string_types, integer_types, PY3
 
 __all__ = [
@@ -21,6 +21,29 @@ def decorator(decoration):
     return new_decorator
 
 
+class _NeedsShell(Exception):
+    """
+    Raised while building an argument list for a value only a shell can interpret.
+    """
+
+
+def _raw_arg(val):
+    """
+    The value a shell would pass to a program for an escaped argument.
+    """
+    if isinstance(val, Command):
+        # Command substitution
+        raise _NeedsShell()
+    elif isinstance(val, arg.LiteralArg):
+        val = val.data
+    elif isinstance(val, arg.BaseArg):
+        raise _NeedsShell()
+
+    if val is None:
+        return ''
+    return str(val)
+
+
 @decorator
 def _makes_clone(_func, *args, **kw):
     """
@@ -41,6 +64,8 @@ class Operation(object):
         self._env = {}
         self._background = False
         self._shell = None
+        self._backend = None
+        self._priority = None
         if PY3:
             self._encoding = 'UTF-8'
         else:
@@ -58,6 +83,8 @@ class Operation(object):
             >>> clom.ls.background()
             'nohup ls &> /dev/null &'
 
+        To track the background process instead, use `Shell.spawn`.
+
         """
         self._background = True
 
@@ -70,7 +97,9 @@ class Operation(object):
         """
         Pipe this command to another.
 
-        :param to_cmd: Operation or Command to pipe to
+        :param to_cmd: Operation or Command to pipe to, or a Python callable that
+                       takes an iterator of lines and returns an iterable of strings,
+                       see `clom.pipeline.Pipeline`
         :returns: Operation
 
         .. seealso:: http://tldp.org/LDP/abs/html/io-redirection.html
@@ -81,9 +110,101 @@ class Operation(object):
             >>> clom.ls.pipe_to(clom.grep)
             'ls | grep'
 
+        Pipelines with Python stages can only be run with `shell`, not rendered::
+
+            >>> def errors(lines):
+            ...     return (line for line in lines if 'ERROR' in line)
+            >>> clom.cat('big.log') | errors | clom.gzip
+            'cat big.log' | <errors> | 'gzip'
+
         """
+        if not isinstance(to_cmd, Operation) and not callable(to_cmd):
+            raise TypeError('Can not pipe to %r' % (to_cmd,))
         self._pipe_to.append(to_cmd)
 
+    def _has_python_stages(self):
+        """
+        Is this operation piped to a Python callable anywhere in its pipeline.
+        """
+        return any(
+            not isinstance(c, Operation) or c._has_python_stages()
+            for c in self._pipe_to
+        )
+
+    def _env_values(self):
+        """
+        The environment variables as the strings the program would see.
+
+        :returns: dict or `None` if a value needs a shell to evaluate
+        """
+        try:
+            return dict((k, _raw_arg(v)) for k, v in self._env.items())
+        except _NeedsShell:
+            return None
+
+    def _without_env(self):
+        """
+        Split the environment variables from the operation so they can be passed to
+        the process directly instead of rendered as an `env` prefix.
+
+        Operations whose variables need a shell, or that pipe to other commands
+        which shouldn't get the variables, are returned unchanged.
+
+        :returns: tuple - `(operation, dict of variables or None)`
+
+        ::
+
+            >>> clom.make('test', DEBUG=1)._without_env()
+            ('make test', {'DEBUG': '1'})
+            >>> clom.make('test', DEBUG=1).pipe_to(clom.tail)._without_env()
+            ('env DEBUG=1 make test | tail', None)
+
+        """
+        if not self._env or self._pipe_to or self._background:
+            return self, None
+        env = self._env_values()
+        if env is None:
+            return self, None
+        operation = self._clone()
+        operation._env = {}
+        return operation, env
+
+    def _without_priority(self):
+        """
+        Split the priority from the operation so it can be applied to the process as
+        it starts instead of rendered as a prefix.
+
+        Operations whose priority can't be applied on this platform are returned unchanged.
+
+        :returns: tuple - `(operation, Priority or None)`
+
+        ::
+
+            >>> op, priority = clom.gzip('big.log').with_priority(nice=10)._without_priority()
+            >>> op, priority
+            ('gzip big.log', <Priority nice -n 10>)
+
+        """
+        if self._priority is None or not self._priority.is_native():
+            return self, None
+        operation = self._clone()
+        operation._priority = None
+        return operation, self._priority
+
+    def _stages(self):
+        """
+        The pipeline as a flat list of operations without pipes, and Python callables.
+        """
+        head = self._clone()
+        head._pipe_to = []
+        stages = [head]
+        for c in self._pipe_to:
+            if isinstance(c, Operation):
+                stages.extend(c._stages())
+            else:
+                stages.append(c)
+        return stages
+
     # | is shorthand for pipe_to
     __or__ = pipe_to
 
@@ -233,6 +354,8 @@ class Operation(object):
                 s.append(self._escape_arg(output))
 
         for c in self._pipe_to:
+            if not isinstance(c, Operation):
+                raise ValueError('%r is a Python stage, the pipeline can only be run with `shell`' % (c,))
             s.append('|')
             s.append(str(c))
 
@@ -247,14 +370,24 @@ class Operation(object):
 
         if self._background:
             s.append('nohup')
-            
-        if self._env:
-            s.append('env')
-            for k, v in self._env.items():
-                s.append('%s=%s' % (k, arg.LiteralArg(v)))
 
-        self._build_command(s)
-        self._build_redirects(s)
+        if self._priority is not None:
+            s.extend(self._priority.prefix())
+
+        if self._priority is not None and (self._pipe_to or isinstance(self, BaseConjunction)):
+            # The prefix only covers one program, put a shell under it for the rest
+            operation = self._clone()
+            operation._priority = None
+            operation._background = False
+            s.extend(['sh', '-c', str(arg.LiteralArg(str(operation)))])
+        else:
+            if self._env:
+                s.append('env')
+                for k, v in self._env.items():
+                    s.append('%s=%s' % (k, self._escape_arg(v)))
+
+            self._build_command(s)
+            self._build_redirects(s)
 
         if self._background:
             s.append('&> /dev/null &')
@@ -263,6 +396,11 @@ class Operation(object):
 
 
     def __repr__(self):
+        if self._has_python_stages():
+            return ' | '.join(
+                repr(c) if isinstance(c, Operation) else '<%s>' % getattr(c, '__name__', c)
+                for c in self._stages()
+            )
         return repr(str(self))
 
 
@@ -289,6 +427,9 @@ class Operation(object):
         q.__dict__ = self.__dict__.copy()
         q._redirects = self._redirects.copy()
         q._env = self._env.copy()
+        q._pipe_to = self._pipe_to[:]
+        # The shell is bound to the original operation
+        q._shell = None
 
         return q
 
@@ -309,6 +450,55 @@ class Operation(object):
         """
         self._env.update(kwargs)
 
+    @_makes_clone
+    def with_priority(self, nice=None, ionice=None, cpu_affinity=None):
+        """
+        Run the operation with a lower or higher CPU and IO priority, or on some CPUs only.
+
+        Local shells apply these to the process as it starts, without starting
+        `nice`, `ionice` or `taskset`, so everything the operation starts gets them.
+        As a string, or where they can't be applied directly, the operation is
+        prefixed with those commands instead.
+
+        :param nice: Niceness to add, like `nice -n`
+        :param ionice: IO scheduling class `'idle'`, `'best-effort'` or `'realtime'`,
+                       or a tuple of the class and a level from `0` to `7`
+        :param cpu_affinity: List of CPUs the process may run on
+        :returns: Operation
+
+        ::
+
+            >>> clom.gzip('big.log').with_priority(nice=10, ionice='idle', cpu_affinity=[2, 3])
+            'taskset -c 2,3 ionice -c 3 nice -n 10 gzip big.log'
+
+        Pipelines and `AND` / `OR` are run by a shell under the prefix so all of
+        them get the priority::
+
+            >>> (clom.tar('c', '.') | clom.gzip).with_priority(nice=19)
+            "nice -n 19 sh -c 'tar c . | gzip'"
+
+        Applying it directly uses `preexec_fn`, which Python warns isn't safe while
+        other threads are running, as the child can deadlock on a lock one of them
+        held at the fork. From threaded programs, render it with the prefix and
+        run that instead, e.g. `clom.sh(c=str(operation))`.
+
+        """
+        self._priority = Priority(nice, ionice, cpu_affinity)
+
+    @_makes_clone
+    def with_backend(self, backend):
+        """
+        Run the operation with a `clom.backend.Backend` instead of the default.
+
+        ::
+
+            >>> from clom.backend import FakeBackend
+            >>> clom.ls.with_backend(FakeBackend()).shell()
+            <CommandResult return_code=0, stdout=0 bytes, stderr=0 bytes>
+
+        """
+        self._backend = backend
+
     @property
     def shell(self):
         """
@@ -316,6 +506,8 @@ class Operation(object):
         shell.
         """
         if not self._shell:
+            # Imported here so rendering commands doesn't load the execution machinery
+            from clom.shell import Shell
             self._shell = Shell(self)
         return self._shell
 
@@ -325,6 +517,15 @@ class Operation(object):
         """
         return str(self)
 
+    def _argv(self):
+        """
+        Build the operation as an argument list that can be executed directly,
+        without a shell.
+
+        :returns: list or `None` if the operation needs a shell to run
+        """
+        return None
+
 
 class Command(Operation):
     """
@@ -346,6 +547,12 @@ class Command(Operation):
 
         self._clom = clom        
 
+        # Sub commands inherit their parent's backend, other commands their clom's
+        if parent is not None:
+            self._backend = parent._backend
+        else:
+            self._backend = getattr(clom, '_backend', None)
+
         # Parent command
         self._parent = parent
 
@@ -418,8 +625,14 @@ class Command(Operation):
             'git status'
 
         """
+        if name.startswith('__'):
+            raise AttributeError(name)
         parent = self._clone()
-        return Command(self._clom, name, parent=parent)
+        # The priority is for the whole command line, not the parent's part of it
+        priority, parent._priority = parent._priority, None
+        command = Command(self._clom, name, parent=parent)
+        command._priority = priority
+        return command
 
     def __getitem__(self, name):
         """
@@ -439,12 +652,18 @@ class Command(Operation):
         """
         Builds the raw command parts without any redirects, pipes, etc.
         """
-        e = self._escape_arg
-
         if self._parent:
             s.append(str(self._parent))
 
-        self._build_action(s)
+        self._build_parts(s, self._escape_arg)
+
+    def _build_parts(self, s, e):
+        """
+        Builds this command's own action, options and arguments.
+
+        :param e: Function used to turn each value into a command line part
+        """
+        self._build_action(s, e)
 
         for opt in self._listopts:
             if opt is not arg.NOTSET:
@@ -477,15 +696,67 @@ class Command(Operation):
                 else:  # --ex=1
                     s.append('%s=%s' % pair)
 
-        self._build_args(s)
-
-    def _build_action(self, s):
-        s.append(self._escape_arg(self.name))
-
-    def _build_args(self, s):
+        self._build_args(s, e)
+
+    def _build_action(self, s, e):
+        name = self.name
+        resolver = getattr(self._clom, '_resolver', None)
+        if resolver is not None and self._parent is None and isinstance(name, string_types):
+            from clom.resolver import ExecutableNotFound
+            try:
+                name = resolver.resolve(name)
+            except ExecutableNotFound:
+                # Rendering doesn't fail, `Shell` reports it when it's run
+                pass
+        s.append(e(name))
+
+    def _build_args(self, s, e):
         for val in self._args:
             if val is not arg.NOTSET:
-                s.append(self._escape_arg(val))
+                s.append(e(val))
+
+    def _is_builtin(self):
+        """
+        Is this command a shell builtin, such as `cd` or `export`.
+        """
+        from clom.resolver import SHELL_BUILTINS
+        root = self
+        while root._parent is not None:
+            root = root._parent
+        return root.name in SHELL_BUILTINS
+
+    def _argv(self):
+        """
+        Build the command as an argument list that can be executed directly.
+
+        ::
+
+            >>> clom.echo("don't", n=True)._argv()
+            ['echo', '-n', "don't"]
+            >>> clom.echo("$HOME").pipe_to(clom.cat)._argv() is None
+            True
+            >>> clom.cd('/tmp')._argv() is None
+            True
+
+        """
+        if self._pipe_to or self._redirects or self._env or self._background or self._priority:
+            return None
+
+        argv = []
+        if self._parent:
+            parent = self._parent._argv()
+            if parent is None:
+                return None
+            argv.extend(parent)
+        elif self._is_builtin():
+            # Builtins only exist in the shell
+            return None
+
+        try:
+            self._build_parts(argv, _raw_arg)
+        except _NeedsShell:
+            return None
+        return argv
 
     @_makes_clone
     def __call__(self, *args, **kwargs):
@@ -535,7 +806,6 @@ class Command(Operation):
         q._args = self._args[:]
         q._listopts = self._listopts[:]
         q._kwopts = self._kwopts.copy()
-        q._pipe_to = self._pipe_to[:]
 
         return q
 
@@ -0,0 +1,312 @@
+import threading
+import time
+import logging
+
+from clom.shell import CommandError
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'Graph',
+    'Node',
+    'NodeResult',
+    'GraphResult',
+    'SUCCESS',
+    'FAILURE',
+    'ALWAYS',
+]
+
+#: Run a node only if its dependency succeeded, like `&&`
+SUCCESS = 'success'
+
+#: Run a node only if its dependency failed, like `||`
+FAILURE = 'failure'
+
+#: Run a node once its dependency finished regardless of status, like `;`
+ALWAYS = 'always'
+
+_CONDITIONS = (SUCCESS, FAILURE, ALWAYS)
+
+
+class Node(object):
+    """
+    An `Operation` in a `Graph` along with the nodes it runs after.
+
+    Don't create directly, use `Graph.add`.
+    """
+    def __init__(self, name, operation, edges):
+        self.name = name
+        self.operation = operation
+        #: List of `(node, condition)` tuples this node depends on
+        self.edges = edges
+
+    def __repr__(self):
+        return '<Node %s>' % self.name
+
+
+class NodeResult(object):
+    """
+    The outcome of a single node in a `Graph` run.
+    """
+    def __init__(self, node, status, ok, result=None, started=None, finished=None):
+        self.node = node
+        #: One of `'success'`, `'failed'`, or `'skipped'`
+        self.status = status
+        #: Whether the node counts as succeeded for the nodes after it. Skipped nodes pass on
+        #: the outcome of the dependency that skipped them, just like the shell does with `a || b && c`.
+        self.ok = ok
+        #: `CommandResult` or `CommandError`, the exception raised if the node couldn't run, `None` if skipped
+        self.result = result
+        self.started = started
+        self.finished = finished
+
+    @property
+    def name(self):
+        return self.node.name
+
+    @property
+    def duration(self):
+        """
+        Seconds the node ran for, 0 if it was skipped.
+        """
+        if self.started is None:
+            return 0.0
+        return self.finished - self.started
+
+    @property
+    def skipped(self):
+        return self.status == 'skipped'
+
+    def __repr__(self):
+        return '<NodeResult %s status=%s duration=%.3fs>' % (self.name, self.status, self.duration)
+
+
+class GraphResult(object):
+    """
+    Results of a `Graph` run keyed by node name.
+    """
+    def __init__(self, graph, results, started, finished):
+        self._graph = graph
+        self._results = results
+        self.started = started
+        self.finished = finished
+
+    def __getitem__(self, name):
+        if isinstance(name, Node):
+            name = name.name
+        return self._results[name]
+
+    def __iter__(self):
+        """
+        Iterate over `NodeResult`s in the order nodes were added.
+        """
+        return (self._results[node.name] for node in self._graph.nodes)
+
+    def __len__(self):
+        return len(self._results)
+
+    @property
+    def duration(self):
+        """
+        Wall clock seconds for the whole run.
+        """
+        return self.finished - self.started
+
+    @property
+    def timings(self):
+        """
+        Dictionary of node name to seconds each node ran for.
+        """
+        return dict((r.name, r.duration) for r in self)
+
+    @property
+    def ok(self):
+        """
+        `True` if every node that nothing runs after succeeded.
+        """
+        return all(self._results[node.name].ok for node in self._graph.leaves)
+
+    @property
+    def critical_path(self):
+        """
+        Names of the chain of nodes that determined how long the run took.
+
+        Starting at the node that finished last, each step goes back to the
+        dependency that finished last before it.
+        """
+        ran = [r for r in self if not r.skipped]
+        if not ran:
+            return []
+
+        r = max(ran, key=lambda r: r.finished)
+        path = [r.name]
+        while True:
+            deps = [self._results[dep.name] for dep, _ in r.node.edges]
+            deps = [d for d in deps if not d.skipped]
+            if not deps:
+                break
+            r = max(deps, key=lambda d: d.finished)
+            path.append(r.name)
+
+        path.reverse()
+        return path
+
+    def __repr__(self):
+        return '<GraphResult nodes=%d ok=%s duration=%.3fs>' % (len(self), self.ok, self.duration)
+
+
+class Graph(object):
+    """
+    Runs `Operation`s as a dependency graph with as much parallelism as the
+    dependencies allow.
+
+    Edges carry the same short-circuit rules as `AND` and `OR`: by default a node
+    only runs after its dependencies succeed, `on=FAILURE` runs it only after they
+    fail and `on=ALWAYS` runs it either way.
+
+    ::
+
+        >>> g = Graph(max_parallel=2)
+        >>> a = g.add(clom.true, name='a')
+        >>> b = g.add(clom.false, name='b')
+        >>> c = g.add(clom.echo('done'), after=[a, b], name='c')
+        >>> d = g.add(clom.echo('b failed'), after=b, on=FAILURE, name='d')
+        >>> r = g.run()
+        >>> [(n.name, n.status) for n in r]
+        [('a', 'success'), ('b', 'failed'), ('c', 'skipped'), ('d', 'success')]
+        >>> r.ok
+        False
+
+    """
+    def __init__(self, max_parallel=None):
+        """
+        :param max_parallel: Maximum number of nodes to run at once, `None` for no limit
+        """
+        self.max_parallel = max_parallel
+        self.nodes = []
+        self._names = set()
+
+    def add(self, operation, after=None, on=SUCCESS, name=None):
+        """
+        Add an operation to the graph.
+
+        :param operation: Operation to run
+        :param after: `Node` or list of `Node`s this runs after. Items may also be
+                      `(node, condition)` tuples to set the condition per edge.
+        :param on: Condition for edges that don't set their own, one of
+                   `SUCCESS`, `FAILURE` or `ALWAYS`
+        :param name: Name of the node, defaults to the command string
+        :returns: Node
+        """
+        if on not in _CONDITIONS:
+            raise ValueError('Unknown edge condition %r' % on)
+
+        if after is None:
+            after = []
+        elif isinstance(after, (Node, tuple)):
+            after = [after]
+
+        edges = []
+        for dep in after:
+            if isinstance(dep, tuple):
+                dep, cond = dep
+            else:
+                cond = on
+            if cond not in _CONDITIONS:
+                raise ValueError('Unknown edge condition %r' % cond)
+            if dep not in self.nodes:
+                raise ValueError('%r is not a node of this graph' % dep)
+            edges.append((dep, cond))
+
+        if name is None:
+            name = base = str(operation)
+            i = 1
+            while name in self._names:
+                i += 1
+                name = '%s#%d' % (base, i)
+        elif name in self._names:
+            raise ValueError('Duplicate node name %r' % name)
+
+        node = Node(name, operation, edges)
+        self.nodes.append(node)
+        self._names.add(name)
+        return node
+
+    @property
+    def leaves(self):
+        """
+        Nodes that no other node runs after.
+        """
+        deps = set(dep.name for node in self.nodes for dep, _ in node.edges)
+        return [node for node in self.nodes if node.name not in deps]
+
+    def _run_node(self, node):
+        started = time.time()
+        try:
+            result = node.operation.shell()
+            ok = True
+        except CommandError as e:
+            result = e
+            ok = False
+        except Exception as e:
+            # Anything else fails the node too, rather than the thread running it
+            log.exception('Error running node %s' % node.name)
+            result = e
+            ok = False
+        return NodeResult(node, 'success' if ok else 'failed', ok, result, started, time.time())
+
+    def _resolve(self, node, results):
+        """
+        Decide what to do with a node whose dependencies have all finished.
+
+        :returns: NodeResult if the node is skipped, `None` if it should run
+        """
+        for dep, cond in node.edges:
+            dep_ok = results[dep.name].ok
+            if (cond == SUCCESS and not dep_ok) or (cond == FAILURE and dep_ok):
+                return NodeResult(node, 'skipped', dep_ok)
+        return None
+
+    def run(self):
+        """
+        Run the graph, blocking until every node has finished or been skipped.
+
+        :returns: GraphResult
+        """
+        started = time.time()
+        results = {}
+        pending = list(self.nodes)
+        running = [0]
+        lock = threading.Condition()
+
+        def worker(node):
+            r = self._run_node(node)
+            log.info('Node %s %s in %.3fs' % (node.name, r.status, r.duration))
+            with lock:
+                results[node.name] = r
+                running[0] -= 1
+                lock.notify()
+
+        with lock:
+            while pending or running[0]:
+                progressed = False
+                for node in list(pending):
+                    if any(dep.name not in results for dep, _ in node.edges):
+                        continue
+
+                    skipped = self._resolve(node, results)
+                    if skipped is not None:
+                        results[node.name] = skipped
+                        pending.remove(node)
+                        progressed = True
+                    elif self.max_parallel is None or running[0] < self.max_parallel:
+                        pending.remove(node)
+                        running[0] += 1
+                        t = threading.Thread(target=worker, args=(node,))
+                        t.daemon = True
+                        t.start()
+
+                if not progressed and (pending or running[0]):
+                    lock.wait()
+
+        return GraphResult(self, results, started, time.time())
@@ -1,7 +1,167 @@
+import os
+import re
+import time
+import logging
+
 from clom.command import Command
 from clom import arg
 
-class FabAction(Command):
+log = logging.getLogger(__name__)
+
+
+class HostResult(object):
+    """
+    The outcome of one fab invocation from `run_on`.
+    """
+    def __init__(self, hosts, command, result, started, finished):
+        #: Hosts the invocation ran against
+        self.hosts = hosts
+        #: Command string that ran
+        self.command = command
+        #: `CommandResult` or `CommandError`
+        self.result = result
+        self.started = started
+        self.finished = finished
+
+    @property
+    def ok(self):
+        return self.result.return_code == 0
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+    def __repr__(self):
+        return '<HostResult %s return_code=%s duration=%.3fs>' % (
+            ','.join(self.hosts), self.result.return_code, self.duration)
+
+
+class FanOutResult(object):
+    """
+    Results of running a fab command against many hosts, keyed by host.
+    """
+    def __init__(self, results, started, finished):
+        #: List of `HostResult` in the order they finished
+        self.results = results
+        self.started = started
+        self.finished = finished
+        self._by_host = dict((host, r) for r in results for host in r.hosts)
+
+    def __getitem__(self, host):
+        """
+        The `CommandResult` or `CommandError` for a host.
+        """
+        return self._by_host[host].result
+
+    def __iter__(self):
+        return iter(self.hosts)
+
+    def __len__(self):
+        return len(self._by_host)
+
+    @property
+    def hosts(self):
+        return sorted(self._by_host)
+
+    @property
+    def failed(self):
+        """
+        Hosts whose invocation failed.
+        """
+        return sorted(host for host, r in self._by_host.items() if not r.ok)
+
+    @property
+    def ok(self):
+        return not self.failed
+
+    @property
+    def duration(self):
+        return self.finished - self.started
+
+    @property
+    def timings(self):
+        """
+        Dictionary of host to seconds its invocation took.
+        """
+        return dict((host, r.duration) for host, r in self._by_host.items())
+
+    def __repr__(self):
+        return '<FanOutResult hosts=%d failed=%d duration=%.3fs>' % (
+            len(self), len(self.failed), self.duration)
+
+
+class _FabOperation(Command):
+    """
+    Behavior shared by `FabCommand` and `FabAction`.
+    """
+    def for_hosts(self, hosts):
+        """
+        The same command, run against `hosts` with Fabric's `--hosts` option.
+
+        ::
+
+            >>> clom.fab.deploy('dev').for_hosts(['web1', 'web2'])
+            'fab --hosts=web1,web2 deploy:dev'
+
+        """
+        if self._parent is None:
+            return self.with_opts(hosts=','.join(hosts))
+        q = self._clone()
+        q._parent = self._parent.for_hosts(hosts)
+        return q
+
+    def iter_run_on(self, hosts, parallel=10, shard_size=1):
+        """
+        Like `run_on` but yields each `HostResult` as it finishes.
+        """
+        from clom._pool import imap_unordered
+        from clom.shell import CommandError
+
+        hosts = list(hosts)
+        shards = [tuple(hosts[i:i + shard_size]) for i in range(0, len(hosts), shard_size)]
+
+        def run(shard):
+            command = self.for_hosts(shard)
+            started = time.time()
+            try:
+                result = command.shell()
+            except CommandError as e:
+                result = e
+            return HostResult(shard, str(command), result, started, time.time())
+
+        for shard, r in imap_unordered(run, shards, parallel):
+            log.info('%s finished on %s (%s) in %.3fs' % (
+                r.command, ','.join(shard), r.result.return_code, r.duration))
+            yield r
+
+    def run_on(self, hosts, parallel=10, shard_size=1, progress=None):
+        """
+        Run the command against many hosts at once, one fab invocation per host
+        or per shard of hosts.
+
+        :param hosts: List of hosts
+        :param parallel: Maximum number of fab invocations to run at once
+        :param shard_size: Number of hosts to pass to each invocation
+        :param progress: Function called with each `HostResult` as it finishes
+        :returns: FanOutResult
+
+        ::
+
+            >>> r = clom.fab.deploy('dev').run_on(['web1', 'web2'])    # doctest: +SKIP
+            >>> r.failed                                                 # doctest: +SKIP
+            []
+
+        """
+        started = time.time()
+        results = []
+        for r in self.iter_run_on(hosts, parallel=parallel, shard_size=shard_size):
+            results.append(r)
+            if progress:
+                progress(r)
+        return FanOutResult(results, started, time.time())
+
+
+class FabAction(_FabOperation):
     """
     Fabric action
 
@@ -16,24 +176,24 @@ class FabAction(Command):
         
     """
 
-    def _build_action(self, s):
+    def _build_action(self, s, e):
         """
         Encode fab action's parameters in Fabric's format
         """        
         args = []
         for val in self._args:
             if val is not arg.NOTSET:
-                args.append(self._escape_arg(val))
+                args.append(e(val))
 
         if args:
             s.append('%s:%s' % (
-                self._escape_arg(self.name),
+                e(self.name),
                 ','.join(args)
             ))
         else:
-            s.append(self._escape_arg(self.name))                        
+            s.append(e(self.name))                        
 
-    def _build_args(self, s):
+    def _build_args(self, s, e):
         # Do nothing, we did it in _build_action
         pass
         
@@ -47,10 +207,16 @@ class FabAction(Command):
             'fab push'
 
         """
+        if name.startswith('__'):
+            raise AttributeError(name)
         parent = self._clone()
-        return FabAction(self._clom, name, parent=parent)
+        # The priority is for the whole command line, like `Command.__getattr__`
+        priority, parent._priority = parent._priority, None
+        action = FabAction(self._clom, name, parent=parent)
+        action._priority = priority
+        return action
                 
-class FabCommand(Command):
+class FabCommand(_FabOperation):
     """
     A command that whose sub-commands are FabActions
 
@@ -70,5 +236,206 @@ class FabCommand(Command):
             'fab push'
 
         """
+        if name.startswith('__'):
+            raise AttributeError(name)
         parent = self._clone()
-        return FabAction(self._clom, name, parent=parent)
+        # The priority is for the whole command line, like `Command.__getattr__`
+        priority, parent._priority = parent._priority, None
+        action = FabAction(self._clom, name, parent=parent)
+        action._priority = priority
+        return action
+
+
+_TASK_LINE = re.compile(r"^(?:\[[^\]]*\] )?Executing task '([^']*)'$")
+
+
+def _default_arg_max():
+    """
+    Longest command string that can safely be passed to `sh -c`.
+    """
+    try:
+        arg_max = os.sysconf('SC_ARG_MAX')
+    except (AttributeError, ValueError, OSError):
+        arg_max = 131072
+    env_size = sum(len(k) + len(v) + 2 for k, v in os.environ.items())
+    # Linux also limits any single argument to 32 pages
+    return min(arg_max - env_size, 131072) - 2048
+
+
+def _chain(action):
+    """
+    Split a fab command into its root `FabCommand` and list of `FabAction`s.
+    """
+    actions = []
+    while isinstance(action, FabAction):
+        actions.append(action)
+        action = action._parent
+    if not isinstance(action, FabCommand):
+        raise TypeError('Can only coalesce fab commands, not %r' % action)
+    actions.reverse()
+    return action, actions
+
+
+def _coalesce_key(action):
+    """
+    Key that is equal for fab commands that can share a fab invocation, or
+    `None` if the command must run on its own.
+    """
+    root, actions = _chain(action)
+    if not actions:
+        return None
+    for a in [root] + actions:
+        if a._pipe_to or a._redirects or a._background:
+            return None
+    for a in [root] + actions[:-1]:
+        if a._priority is not None:
+            return None
+    for a in actions[:-1]:
+        if a._env:
+            return None
+    leaf = actions[-1]
+    return (str(root), sorted(leaf._env.items()), id(leaf._backend), leaf._priority)
+
+
+class CoalescedFab(object):
+    """
+    Several fab commands merged into one invocation. Created by `coalesce`.
+    """
+    def __init__(self, commands):
+        #: Original fab commands, in order
+        self.commands = commands
+
+        root, actions = _chain(commands[0])
+        tasks = list(actions)
+        for command in commands[1:]:
+            tasks.extend(_chain(command)[1])
+
+        if len(commands) == 1:
+            merged = commands[0]
+        else:
+            merged = root
+            for task in tasks:
+                task = task._clone()
+                task._parent = merged
+                task._env = {}
+                task._priority = None
+                merged = task
+            merged._env = actions[-1]._env.copy()
+            merged._priority = actions[-1]._priority
+
+        #: Merged fab command
+        self.command = merged
+        #: Names of every task, in order
+        self.tasks = [task.name for task in tasks]
+        self._counts = [len(_chain(command)[1]) for command in commands]
+
+    def __str__(self):
+        return str(self.command)
+
+    def __repr__(self):
+        return '<CoalescedFab commands=%d %r>' % (len(self.commands), str(self))
+
+    def split_output(self, output):
+        """
+        Split fab's output into the output of each task using the
+        `Executing task '...'` lines Fabric prints before running a task on a host.
+
+        Fabric only prints these when a task runs against hosts, so this works for
+        remote tasks. If a task failed, the tasks after it have no output.
+
+        :returns: list - Output of each task in `tasks`, `None` for tasks that didn't run.
+                  `None` if the output can't be split.
+        """
+        chunks = []
+        i = -1
+        for line in output.splitlines(True):
+            m = _TASK_LINE.match(line.rstrip('\r\n'))
+            if m and i + 1 < len(self.tasks) and m.group(1) == self.tasks[i + 1]:
+                i += 1
+                chunks.append([])
+            elif i < 0:
+                if line.strip():
+                    # Output before the first task, can't tell whose it is
+                    return None
+                continue
+            chunks[-1].append(line)
+        if i < 0:
+            return None
+        return [''.join(c) for c in chunks] + [None] * (len(self.tasks) - len(chunks))
+
+    def run(self):
+        """
+        Run the merged command.
+
+        :returns: list - For each original command in order, a `CommandResult` if it
+                  succeeded, `CommandError` if it failed or `None` if Fabric aborted
+                  before it ran. When the output can't be split by task every
+                  command gets the result of the whole invocation.
+        """
+        from clom.shell import CommandError, CommandResult
+
+        try:
+            result = self.command.shell()
+        except CommandError as e:
+            result = e
+
+        task_output = self.split_output(result.stdout)
+        if task_output is None:
+            return [result] * len(self.commands)
+
+        # Fabric stops at the first failing task, so the last task that ran is the one that failed
+        ran = len([o for o in task_output if o is not None])
+        results = []
+        t = 0
+        for count in self._counts:
+            outputs = task_output[t:t + count]
+            t += count
+            if outputs[0] is None:
+                results.append(None)
+            elif result.return_code != 0 and t >= ran:
+                results.append(CommandError(result.return_code, ''.join(o or '' for o in outputs),
+                                            result.stderr, result.args[0]))
+            else:
+                results.append(CommandResult(0, ''.join(outputs), ''))
+        return results
+
+
+def coalesce(commands, arg_max=None):
+    """
+    Merge fab commands that use the same fabfile and options into as few
+    invocations as possible, saving Fabric's startup and connection setup for
+    each one.
+
+    Only neighboring commands are merged so the tasks still run in the same
+    order. A command with redirects, pipes, or backgrounding runs on its own.
+
+    :param commands: List of `FabCommand`s and `FabAction`s
+    :param arg_max: Longest command string to build, defaults to what the system allows
+    :returns: list - `CoalescedFab` objects to run in order
+
+    ::
+
+        >>> coalesce([clom.fab.test('unit'), clom.fab.deploy('dev'), clom.fab(H='a').deploy])
+        [<CoalescedFab commands=2 'fab test:unit deploy:dev'>, <CoalescedFab commands=1 'fab -H a deploy'>]
+
+    """
+    if arg_max is None:
+        arg_max = _default_arg_max()
+
+    groups = []
+    key = None
+    length = 0
+    for command in commands:
+        k = _coalesce_key(command)
+        if k is not None and k == key:
+            extra = sum(len(str(a)) - len(str(a._parent)) for a in _chain(command)[1])
+            if length + extra <= arg_max:
+                groups[-1].append(command)
+                length += extra
+                continue
+
+        groups.append([command])
+        key = k
+        length = len(str(command))
+
+    return [CoalescedFab(group) for group in groups]
@@ -0,0 +1,332 @@
+"""
+A helper process that starts commands on behalf of a large parent.
+
+The server is started while the parent is still small. Afterwards every fork happens
+in the server, so it costs the same however much memory the parent grows to use.
+"""
+import array
+import errno
+import marshal
+import os
+import socket
+import subprocess
+import sys
+import threading
+import logging
+
+from clom.spawn import Spawner, SpawnedProcess, PopenSpawner
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'SpawnServer',
+]
+
+# Layout of requests, bumped whenever it changes
+_VERSION = 1
+
+# How each of stdin, stdout and stderr is connected
+_INHERIT = 'fd'
+_PIPE = 'pipe'
+_DEVNULL = 'devnull'
+_STDOUT = 'stdout'
+
+_MAX_FDS = 4
+_MAX_MESSAGE = 1024 * 1024
+
+
+def _send(sock, data, fds=()):
+    ancillary = []
+    if fds:
+        ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds).tobytes())]
+    sock.sendmsg([marshal.dumps(data)], ancillary)
+
+
+def _recv(sock, flags=0):
+    """
+    :returns: tuple - `(message, list of fds)`, the message is `None` if the other end closed
+    """
+    fds = array.array('i')
+    data, ancillary, _, _ = sock.recvmsg(_MAX_MESSAGE, socket.CMSG_SPACE(_MAX_FDS * fds.itemsize), flags)
+    for level, kind, payload in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - (len(payload) % fds.itemsize)])
+    if not data:
+        return None, list(fds)
+    return marshal.loads(data), list(fds)
+
+
+class ServerProcess(SpawnedProcess):
+    """
+    A process started by a `SpawnServer`.
+
+    The server waits on the process and reports its status over a socket kept for it.
+    """
+    def __init__(self, args, pid, reply, stdin=None, stdout=None, stderr=None):
+        super(ServerProcess, self).__init__(args, pid, stdin, stdout, stderr)
+        self._reply = reply
+
+    def _reap(self, options):
+        with self._lock:
+            if self.returncode is not None:
+                return self.returncode
+            try:
+                message, _ = _recv(self._reply, socket.MSG_DONTWAIT if options & os.WNOHANG else 0)
+            except (IOError, OSError) as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return None
+                raise
+            if message is None:
+                raise OSError(errno.ECHILD, 'The spawn server exited before process %s' % self.pid)
+            self.returncode = message[1]
+            self._reply.close()
+            return self.returncode
+
+
+class SpawnServer(Spawner):
+    """
+    Starts processes in a helper process, see the module's description.
+
+    Requests go to the server over a Unix socket. The stdin, stdout and stderr
+    a process should use are sent with `SCM_RIGHTS`, and the ends of any pipes
+    the server makes are sent back the same way, so output streams to the parent
+    as usual. Operations are sent with `clom.wire`.
+
+    Create one early, before the parent grows, and use it like any other spawner::
+
+        >>> server = SpawnServer()
+        >>> str(clom.echo('hi').shell.with_spawner(server)())
+        'hi'
+        >>> p = server.spawn_operation(clom.printf('%s', 'x'), stdout=subprocess.PIPE)
+        >>> p.communicate()
+        (b'x', None)
+        >>> server.close()
+
+    Since it runs in another process, the server can't call `preexec_fn`. It
+    applies `rlimits` instead, and anything else it can't do falls back to
+    `subprocess.Popen` in the parent.
+    """
+    #: `subprocess.Popen` keyword arguments the server handles
+    supported = frozenset(['stdin', 'stdout', 'stderr', 'env', 'cwd', 'close_fds', 'start_new_session'])
+
+    def __init__(self, rlimits=None, fallback=None):
+        """
+        :param rlimits: Default resource limits for every process, a dictionary of
+                        `resource.RLIMIT_*` to `(soft, hard)`
+        :param fallback: `Spawner` for processes the server can't start, defaults to `PopenSpawner`
+        """
+        self.rlimits = dict(rlimits or {})
+        self.fallback = fallback or PopenSpawner()
+        self._lock = threading.Lock()
+        self._sock, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+        package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package, env.get('PYTHONPATH')]))
+        try:
+            self._process = subprocess.Popen(
+                [sys.executable, '-m', 'clom.forkserver', str(theirs.fileno())],
+                pass_fds=[theirs.fileno()], env=env, stdin=subprocess.DEVNULL,
+            )
+        finally:
+            theirs.close()
+        log.info('Started spawn server %s' % self._process.pid)
+
+    def __repr__(self):
+        return '<SpawnServer pid=%s>' % self.pid
+
+    @property
+    def pid(self):
+        """
+        Process id of the server.
+        """
+        return self._process.pid
+
+    def can_spawn(self, kwargs):
+        """
+        Can a process with these `subprocess.Popen` keyword arguments be started by the server.
+        """
+        return all(k in self.supported or not v for k, v in kwargs.items())
+
+    def spawn(self, cmd, rlimits=None, **kwargs):
+        """
+        Start a process in the server.
+
+        :param cmd: Command string to run with `sh`, or argument list to execute directly
+        :param rlimits: Resource limits for this process, added to the server's
+        :param kwargs: Keyword arguments of `subprocess.Popen`
+        :returns: `ServerProcess`
+        """
+        if not self.can_spawn(kwargs):
+            log.debug('Falling back to %r for %r' % (self.fallback, cmd))
+            return self.fallback.spawn(cmd, **kwargs)
+        return self._request(cmd, cmd, False, rlimits, kwargs)
+
+    def spawn_operation(self, operation, rlimits=None, **kwargs):
+        """
+        Start an operation in the server, sending it serialized with `clom.wire`
+        and rendering it there.
+
+        :returns: `ServerProcess`
+        """
+        from clom.wire import dumps
+        return self._request(operation, dumps(operation), True, rlimits, kwargs)
+
+    def _request(self, args, payload, is_operation, rlimits, kwargs):
+        limits = dict(self.rlimits)
+        limits.update(rlimits or {})
+
+        reply, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        streams = []
+        fds = [theirs.fileno()]
+        for fd, name in enumerate(('stdin', 'stdout', 'stderr')):
+            target = kwargs.get(name)
+            if target is None:
+                streams.append(_INHERIT)
+                fds.append(fd)
+            elif target == subprocess.PIPE:
+                streams.append(_PIPE)
+            elif target == subprocess.DEVNULL:
+                streams.append(_DEVNULL)
+            elif target == subprocess.STDOUT:
+                streams.append(_STDOUT)
+            else:
+                streams.append(_INHERIT)
+                fds.append(target if isinstance(target, int) else target.fileno())
+
+        env = kwargs.get('env')
+        request = (
+            _VERSION, payload, is_operation, tuple(streams),
+            dict(env) if env is not None else None,
+            kwargs.get('cwd'), bool(kwargs.get('start_new_session')),
+            tuple((int(k), tuple(v)) for k, v in limits.items()),
+        )
+        try:
+            with self._lock:
+                _send(self._sock, request, fds)
+        finally:
+            theirs.close()
+
+        message, pipes = _recv(reply)
+        if message is None:
+            reply.close()
+            raise OSError(errno.ECHILD, 'The spawn server exited')
+        if message[0] == 'error':
+            reply.close()
+            raise OSError(message[1], message[2])
+
+        _, pid = message
+        files = []
+        for fd, stream in enumerate(streams):
+            if stream == _PIPE:
+                files.append(os.fdopen(pipes.pop(0), 'wb' if fd == 0 else 'rb'))
+            else:
+                files.append(None)
+        return ServerProcess(args, pid, reply, *files)
+
+    def close(self):
+        """
+        Stop the server. Processes it started keep running.
+        """
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _limits(rlimits):
+    def apply():
+        import resource
+        for kind, limit in rlimits:
+            resource.setrlimit(kind, limit)
+    return apply
+
+
+def _watch(process, reply):
+    """
+    Report the process's status once it exits.
+    """
+    try:
+        _send(reply, ('exit', process.wait()))
+    except (IOError, OSError):
+        # Nobody is waiting on it anymore
+        pass
+    finally:
+        reply.close()
+
+
+def _start(message, fds):
+    version, payload, is_operation, streams, env, cwd, new_session, rlimits = message
+    if version != _VERSION:
+        raise ValueError('Unsupported request version %r' % (version,))
+
+    if is_operation:
+        from clom.wire import loads
+        cmd = str(loads(payload))
+    else:
+        cmd = payload
+
+    passed = iter(fds)
+    targets = []
+    for stream in streams:
+        if stream == _INHERIT:
+            targets.append(next(passed))
+        elif stream == _PIPE:
+            targets.append(subprocess.PIPE)
+        elif stream == _DEVNULL:
+            targets.append(subprocess.DEVNULL)
+        else:
+            targets.append(subprocess.STDOUT)
+
+    return subprocess.Popen(
+        cmd, shell=not isinstance(cmd, (list, tuple)),
+        stdin=targets[0], stdout=targets[1], stderr=targets[2],
+        env=env, cwd=cwd, start_new_session=new_session,
+        preexec_fn=_limits(rlimits) if rlimits else None,
+    )
+
+
+def _serve(sock):
+    while True:
+        try:
+            message, fds = _recv(sock)
+        except InterruptedError:
+            continue
+        if message is None:
+            return
+
+        reply = socket.socket(fileno=fds.pop(0))
+        try:
+            process = _start(message, fds)
+        except Exception as e:
+            try:
+                _send(reply, ('error', getattr(e, 'errno', None) or errno.EINVAL, str(getattr(e, 'strerror', None) or e)))
+            except (IOError, OSError):
+                pass
+            reply.close()
+            continue
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        pipes = [f for f in (process.stdin, process.stdout, process.stderr) if f is not None]
+        try:
+            _send(reply, ('ok', process.pid), [f.fileno() for f in pipes])
+        except (IOError, OSError):
+            process.kill()
+        for f in pipes:
+            f.close()
+
+        t = threading.Thread(target=_watch, args=(process, reply))
+        t.daemon = True
+        t.start()
+
+
+if __name__ == '__main__':
+    _serve(socket.socket(fileno=int(sys.argv[1])))
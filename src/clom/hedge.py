@@ -0,0 +1,185 @@
+import collections
+import errno
+import os
+import signal
+import subprocess
+import threading
+import time
+import logging
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+from clom.shell import CommandError, CommandResult, _describe
+from clom._compat import string_types
+from clom._cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'HedgedResult',
+    'LatencyHistory',
+]
+
+
+class HedgedResult(CommandResult):
+    """
+    The result of a hedged execution, see `Shell.hedged`.
+    """
+    def __init__(self, return_code, stdout='', stderr='', attempt=0, attempts=1, duration=0.0):
+        super(HedgedResult, self).__init__(return_code, stdout, stderr)
+        #: Index of the attempt that won, `0` for the first
+        self.attempt = attempt
+        #: Number of attempts started
+        self.attempts = attempts
+        #: Seconds until the winning attempt finished
+        self.duration = duration
+
+    def __repr__(self):
+        return '<HedgedResult return_code=%s, attempt=%s of %s, duration=%.3fs>' % (
+            self.return_code, self.attempt, self.attempts, self.duration)
+
+
+class LatencyHistory(object):
+    """
+    Recent durations of successful runs of each command, used to decide when to hedge.
+
+    ::
+
+        >>> history = LatencyHistory(window=100, min_samples=5)
+        >>> history.percentile('ls', 95) is None
+        True
+        >>> for seconds in range(1, 101):
+        ...     history.add('ls', seconds / 100.0)
+        >>> history.percentile('ls', 95)
+        0.95
+
+    """
+    def __init__(self, window=100, min_samples=20, maxsize=1024):
+        """
+        :param window: Number of durations to keep for each command
+        :param min_samples: Durations needed before a percentile is given
+        :param maxsize: Most commands to keep durations for
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self._durations = LRUCache(maxsize)
+
+    def _samples(self, cmd):
+        return self._durations.get(cmd, lambda: collections.deque(maxlen=self.window))
+
+    def add(self, cmd, duration):
+        self._samples(cmd).append(duration)
+
+    def percentile(self, cmd, percent):
+        """
+        :returns: float - Seconds, or `None` if there aren't enough durations yet
+        """
+        samples = sorted(self._samples(cmd))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[int(round((len(samples) - 1) * percent / 100.0))]
+
+
+#: Durations `Shell.hedged` learns from when it isn't given a delay
+history = LatencyHistory()
+
+
+def _kill_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        # Already gone
+        pass
+
+
+def run_hedged(shell, after=None, max_copies=2, percentile=95, default_after=1.0):
+    """
+    Implements `Shell.hedged`.
+    """
+    operation = shell._command
+    backend = shell.backend
+    cmd, env, backend = shell._prepare(operation, backend, direct=True)
+    key = _describe(operation)
+
+    if after is None:
+        after = history.percentile(key, percentile)
+        if after is None:
+            after = default_after
+
+    done = Queue()
+    processes = []
+    starts = []
+    started = time.time()
+
+    def launch():
+        attempt = len(processes)
+        starts.append(time.time())
+        log.info('Hedged attempt %d: %s' % (attempt, key))
+        kwargs = {} if env is None else {'env': env}
+        try:
+            p = backend.popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, start_new_session=True, **kwargs)
+        except OSError as e:
+            if isinstance(cmd, string_types):
+                raise
+            # Report a missing or unusable program the way the shell would, another copy won't fare better
+            status = 127 if e.errno == errno.ENOENT else 126
+            stderr = '%s: %s\n' % (cmd[0], e.strerror)
+            error = CommandError(status, '', stderr, 'Error while executing "%s" (%s):\n%s' % (key, status, stderr))
+            error.attempt = attempt
+            error.attempts = attempt + 1
+            raise error
+        processes.append(p)
+
+        def wait():
+            stdout, stderr = p.communicate()
+            done.put((attempt, p.returncode, stdout, stderr))
+
+        t = threading.Thread(target=wait, name='clom-hedge-%d' % attempt)
+        t.daemon = True
+        t.start()
+
+    try:
+        launch()
+    except NotImplementedError:
+        # The backend doesn't start processes, so there's nothing to hedge
+        result = shell()
+        return HedgedResult(result.return_code, result.stdout, result.stderr, duration=time.time() - started)
+
+    failures = []
+    try:
+        while len(failures) < len(processes):
+            try:
+                attempt, status, stdout, stderr = done.get(timeout=after if len(processes) < max_copies else None)
+            except Empty:
+                launch()
+                continue
+
+            finished = time.time()
+            encoding = operation._encoding
+            if encoding:
+                stdout = stdout.decode(encoding)
+                stderr = stderr.decode(encoding)
+
+            if status == 0:
+                # Learn how long the command itself takes, not how long hedging took
+                history.add(key, finished - starts[attempt])
+                return HedgedResult(status, stdout, stderr, attempt, len(processes), finished - started)
+
+            error = CommandError(status, stdout, stderr, 'Error while executing "%s" (%s):\n%s' % (
+                key, status, stderr or stdout))
+            error.attempt = attempt
+            failures.append(error)
+            if len(processes) < max_copies:
+                launch()
+
+        error = failures[0]
+        error.attempts = len(processes)
+        raise error
+    finally:
+        for p in processes:
+            if p.poll() is None:
+                _kill_group(p)
@@ -0,0 +1,294 @@
+import os
+import signal
+import time
+import logging
+
+from clom.backend import get_default_backend
+from clom._compat import PY3
+from clom.shell import CommandError, CommandResult
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'JobHandle',
+    'JobManager',
+    'JobTimeout',
+]
+
+
+class JobTimeout(Exception):
+    """
+    A background job did not finish in the time allowed.
+    """
+    def __init__(self, job, timeout):
+        super(JobTimeout, self).__init__(
+            'Job %s did not finish within %ss: %s' % (job.pid, timeout, job.command))
+        self.job = job
+        self.timeout = timeout
+
+
+def _foreground(operation):
+    """
+    Returns a copy of `operation` that renders without the `nohup ... &` wrapper.
+    """
+    if operation.is_background:
+        operation = operation._clone()
+        operation._background = False
+    return operation
+
+
+class JobHandle(object):
+    """
+    A command running in the background in its own process group.
+
+    Don't create directly, use `Shell.spawn` or `JobManager.submit`::
+
+        >>> job = clom.echo('foo').shell.spawn()
+        >>> job.wait().return_code
+        0
+
+    """
+
+    #: Interval in seconds between polls while waiting on a job
+    poll_interval = 0.01
+
+    def __init__(self, operation, stdout=None, stderr=None, encoding=None):
+        """
+        :param operation: Operation to run
+        :param stdout: Filename to capture stdout to, `None` discards it
+        :param stderr: Filename to capture stderr to, `None` discards it
+        :param encoding: Encoding used to decode captured output
+        """
+        self.command = _foreground(operation).as_string()
+        self.stdout_path = stdout
+        self.stderr_path = stderr
+        self._encoding = encoding
+        self._result = None
+
+        log.info('Spawning job: %s' % self.command)
+
+        devnull = open(os.devnull, 'r+b')
+        out = open(stdout, 'wb') if stdout else devnull
+        err = open(stderr, 'wb') if stderr else devnull
+        backend = operation._backend or get_default_backend()
+        # Its own session so the whole process group can be signalled
+        if PY3:
+            session = {'start_new_session': True}
+        else:
+            session = {'preexec_fn': os.setsid}
+        try:
+            self._process = backend.popen(
+                self.command,
+                stdin=devnull, stdout=out, stderr=err,
+                close_fds=True, **session
+            )
+        finally:
+            for f in set((devnull, out, err)):
+                f.close()
+
+        self.started = time.time()
+        self.finished = None
+
+    def __repr__(self):
+        return '<JobHandle pid=%s, return_code=%s, command=%r>' % (
+            self.pid, self.poll(), self.command)
+
+    @property
+    def pid(self):
+        """
+        Process id of the job.
+        """
+        return self._process.pid
+
+    @property
+    def pgid(self):
+        """
+        Process group id of the job. Jobs lead their own process group so
+        every process they start can be signaled together.
+        """
+        return self._process.pid
+
+    @property
+    def return_code(self):
+        """
+        Status code of the job or `None` if it's still running.
+        """
+        return self.poll()
+
+    def poll(self):
+        """
+        Check if the job has finished, reaping it if so.
+
+        :returns: int - Status code or `None` if the job is still running
+        """
+        status = self._process.poll()
+        if status is not None and self.finished is None:
+            self.finished = time.time()
+        return status
+
+    @property
+    def is_running(self):
+        return self.poll() is None
+
+    @property
+    def duration(self):
+        """
+        Seconds the job has been running, or ran for if it finished.
+        """
+        return (self.finished or time.time()) - self.started
+
+    def wait(self, timeout=None):
+        """
+        Block until the job finishes.
+
+        :param timeout: Seconds to wait before giving up, `None` waits forever
+        :raises: JobTimeout, CommandError
+        :returns: CommandResult - Output is filled in from the capture files
+        """
+        if timeout is None:
+            self._process.wait()
+        else:
+            deadline = time.time() + timeout
+            while self.poll() is None:
+                if time.time() >= deadline:
+                    raise JobTimeout(self, timeout)
+                time.sleep(self.poll_interval)
+
+        return self.result()
+
+    def result(self):
+        """
+        The `CommandResult` of a finished job.
+
+        :raises: CommandError
+        """
+        status = self.poll()
+        if status is None:
+            raise ValueError('Job %s is still running' % self.pid)
+
+        if self._result is None:
+            stdout = self._read(self.stdout_path)
+            stderr = self._read(self.stderr_path)
+            if status != 0:
+                raise CommandError(status, stdout, stderr, 'Error while executing "%s" (%s):\n%s' % (
+                    self.command, status, stderr or stdout))
+            self._result = CommandResult(status, stdout, stderr)
+        return self._result
+
+    def _read(self, path):
+        if not path:
+            return ''
+        with open(path, 'rb') as f:
+            data = f.read()
+        if self._encoding:
+            data = data.decode(self._encoding)
+        return data
+
+    def kill(self, sig=signal.SIGTERM):
+        """
+        Send a signal to every process in the job's process group.
+
+        :param sig: Signal to send
+        :returns: bool - `False` if the job had already exited
+        """
+        if self.poll() is not None:
+            return False
+        try:
+            os.killpg(self.pgid, sig)
+        except OSError:
+            # Exited between the poll and the kill
+            return False
+        return True
+
+
+class JobManager(object):
+    """
+    Runs background jobs with a limit on how many run at once.
+
+    ::
+
+        >>> jobs = JobManager(max_jobs=2)
+        >>> handles = [jobs.submit(clom.true) for i in range(3)]
+        >>> [h.return_code for h in jobs.wait_all()]
+        [0, 0, 0]
+
+    """
+
+    def __init__(self, max_jobs=None):
+        """
+        :param max_jobs: Maximum number of jobs to run at once, `None` for no limit
+        """
+        self.max_jobs = max_jobs
+        self._running = []
+        # Jobs not yet returned by `wait_all`, in submission order
+        self._jobs = []
+
+    @property
+    def running(self):
+        """
+        List of `JobHandle`s that are still running.
+        """
+        self.reap()
+        return list(self._running)
+
+    def submit(self, operation, stdout=None, stderr=None):
+        """
+        Start a job, blocking until a slot is free if `max_jobs` are already running.
+
+        :param operation: Operation to run
+        :param stdout: Filename to capture stdout to
+        :param stderr: Filename to capture stderr to
+        :returns: JobHandle
+        """
+        if self.max_jobs is not None:
+            while len(self._running) >= self.max_jobs:
+                if not self.reap():
+                    time.sleep(JobHandle.poll_interval)
+
+        job = JobHandle(operation, stdout=stdout, stderr=stderr, encoding=operation._encoding)
+        self._running.append(job)
+        self._jobs.append(job)
+        return job
+
+    def reap(self):
+        """
+        Collect jobs that have finished.
+
+        :returns: list - `JobHandle`s that finished since the last reap
+        """
+        done = [job for job in self._running if job.poll() is not None]
+        for job in done:
+            self._running.remove(job)
+        return done
+
+    def wait_all(self, timeout=None):
+        """
+        Wait for every running job to finish.
+
+        :raises: JobTimeout
+        :returns: list - Every `JobHandle` submitted since the last `wait_all`, in submission order
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        for job in list(self._running):
+            while job.poll() is None:
+                if deadline is not None and time.time() >= deadline:
+                    raise JobTimeout(job, timeout)
+                time.sleep(JobHandle.poll_interval)
+        self.reap()
+        jobs, self._jobs = self._jobs, []
+        return jobs
+
+    def kill_all(self, sig=signal.SIGTERM):
+        """
+        Signal every running job.
+        """
+        for job in self.running:
+            job.kill(sig)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.kill_all()
+        self.wait_all()
@@ -0,0 +1,218 @@
+import errno
+import os
+import selectors
+import subprocess
+import logging
+
+from clom._compat import string_types
+from clom.backend import get_default_backend
+from clom.shell import CommandError, CommandResult
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'Multiplexer',
+]
+
+# Seconds between checks on children that closed their output but haven't been seen to exit
+_POLL_INTERVAL = 0.005
+
+
+def _pidfd(pid):
+    """
+    A file descriptor that becomes readable when `pid` exits, or `None` if the
+    platform doesn't have them.
+    """
+    pidfd_open = getattr(os, 'pidfd_open', None)
+    if pidfd_open is None or pid is None:
+        return None
+    try:
+        return pidfd_open(pid)
+    except OSError:
+        return None
+
+
+class _Child(object):
+    """
+    A running operation and the output read from it so far.
+    """
+    def __init__(self, index, operation, process, pidfd):
+        self.index = index
+        self.operation = operation
+        self.process = process
+        self.pidfd = pidfd
+        self.open = 2
+        self.stdout = []
+        self.stderr = []
+        #: The pidfd said the process exited, but `poll` hasn't reported it yet
+        self.exiting = False
+
+    def result(self):
+        status = self.process.returncode
+        stdout = b''.join(self.stdout)
+        stderr = b''.join(self.stderr)
+        encoding = self.operation._encoding
+        if encoding:
+            stdout = stdout.decode(encoding)
+            stderr = stderr.decode(encoding)
+        return _result(self.operation, status, stdout, stderr)
+
+
+def _result(operation, status, stdout, stderr):
+    if status == 0:
+        return CommandResult(status, stdout, stderr)
+    return CommandError(status, stdout, stderr, 'Error while executing "%s" (%s):\n%s' % (
+        operation, status, stderr or stdout))
+
+
+class Multiplexer(object):
+    """
+    Runs many operations at once from a single thread.
+
+    Every child's stdout and stderr, and its exit where the platform has pidfds,
+    are waited on together with `selectors`, so thousands of commands can run
+    concurrently without a thread each. Children read from `/dev/null`.
+
+    ::
+
+        >>> mux = Multiplexer(max_running=2)
+        >>> ops = [clom.sh(c='sleep 0.2; echo slow'), clom.echo('fast'), clom.false]
+        >>> [(str(op), r.return_code) for op, r in mux.run(ops)]
+        [('echo fast', 0), ('false', 1), ("sh -c 'sleep 0.2; echo slow'", 0)]
+
+    """
+    def __init__(self, max_running=128, backend=None):
+        """
+        :param max_running: Most operations to run at once, `None` for no limit
+        :param backend: `clom.backend.Backend` for operations that don't have one,
+                        defaults to the default backend
+        """
+        self.max_running = max_running
+        self.backend = backend
+
+    def _start(self, operation):
+        """
+        :returns: Popen-like object, or a finished result if the backend doesn't start processes
+        """
+        backend = operation._backend or self.backend or get_default_backend()
+        shell = operation.shell
+        if operation._has_python_stages():
+            from clom.pipeline import Pipeline
+            r, w = os.pipe()
+            with os.fdopen(w, 'wb') as errors:
+                p = Pipeline(operation, backend, stdout=subprocess.PIPE, stderr=errors,
+                             encoding=operation._encoding)
+            p.stderr = os.fdopen(r, 'rb')
+            return p
+
+        cmd, env, backend = shell._prepare(operation, backend, direct=True)
+        kwargs = {} if env is None else {'env': env}
+        try:
+            return backend.popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, **kwargs)
+        except NotImplementedError:
+            status, stdout, stderr = backend.run(cmd, encoding=operation._encoding, **kwargs)
+        except OSError as e:
+            if isinstance(cmd, string_types):
+                raise
+            # Report a missing or unusable program the way the shell would
+            status = 127 if e.errno == errno.ENOENT else 126
+            stdout, stderr = '', '%s: %s\n' % (cmd[0], e.strerror)
+        return _result(operation, status, stdout, stderr)
+
+    def run(self, operations):
+        """
+        Run the operations, yielding `(operation, result)` as each one finishes.
+
+        Results are a `CommandResult`, or a `CommandError` if the operation failed.
+        Failures are yielded rather than raised so the other operations keep going.
+
+        :param operations: Iterable of operations, started in order as others finish
+        :returns: Generator
+        """
+        for _, operation, result in self._run(operations):
+            yield operation, result
+
+    def _run(self, operations):
+        pending = enumerate(operations)
+        running = {}
+        selector = selectors.DefaultSelector()
+        finished = []
+
+        def start_next():
+            for index, operation in pending:
+                started = self._start(operation)
+                if not hasattr(started, 'poll'):
+                    finished.append((index, operation, started))
+                    return True
+
+                child = _Child(index, operation, started, _pidfd(getattr(started, 'pid', None)))
+                running[index] = child
+                selector.register(started.stdout, selectors.EVENT_READ, (child, started.stdout, child.stdout))
+                selector.register(started.stderr, selectors.EVENT_READ, (child, started.stderr, child.stderr))
+                if child.pidfd is not None:
+                    selector.register(child.pidfd, selectors.EVENT_READ, (child, None, None))
+                return True
+            return False
+
+        try:
+            while True:
+                while (self.max_running is None or len(running) < self.max_running) and start_next():
+                    while finished:
+                        yield finished.pop(0)
+                if not running:
+                    break
+
+                # Without a pidfd to wake us, poll children whose output is closed
+                waiting = any(
+                    c.open == 0 and (c.pidfd is None or c.exiting)
+                    for c in running.values()
+                )
+                for key, _ in selector.select(_POLL_INTERVAL if waiting else None):
+                    child, f, chunks = key.data
+                    if f is None:
+                        selector.unregister(child.pidfd)
+                        os.close(child.pidfd)
+                        child.pidfd = None
+                        child.exiting = True
+                        continue
+
+                    data = os.read(f.fileno(), 65536)
+                    if data:
+                        chunks.append(data)
+                    else:
+                        selector.unregister(f)
+                        f.close()
+                        child.open -= 1
+
+                for index, child in list(running.items()):
+                    if child.open == 0 and child.process.poll() is not None:
+                        del running[index]
+                        if child.pidfd is not None:
+                            selector.unregister(child.pidfd)
+                            os.close(child.pidfd)
+                        yield index, child.operation, child.result()
+        finally:
+            # Stopped early, don't leave the rest running
+            for child in running.values():
+                child.process.kill()
+                for f in (child.process.stdout, child.process.stderr):
+                    if not f.closed:
+                        selector.unregister(f)
+                        f.close()
+                if child.pidfd is not None:
+                    os.close(child.pidfd)
+                child.process.wait()
+            selector.close()
+
+    def run_all(self, operations):
+        """
+        Run the operations and return their results in the same order.
+
+        :returns: list - `CommandResult` or `CommandError` for each operation
+        """
+        operations = list(operations)
+        results = [None] * len(operations)
+        for index, _, result in self._run(operations):
+            results[index] = result
+        return results
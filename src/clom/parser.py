@@ -0,0 +1,386 @@
+import re
+
+from clom import arg
+from clom.command import Command, AND, OR
+from clom._cache import LRUCache
+
+__all__ = [
+    'parse',
+    'ParseError',
+]
+
+
+class ParseError(ValueError):
+    """
+    A command line can't be parsed into clom operations.
+    """
+
+
+# Longest first so `&&` matches before `&`
+_OPERATORS = ('&&', '||', '>>', '>&', '&>', '<<', '|', '&', ';', '(', ')', '<', '>')
+_REDIRECTS = ('>', '>>', '>&', '<')
+_METACHARS = frozenset(' \t\n|&;()<>')
+_GLOBS = frozenset('*?[')
+_ASSIGNMENT = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*=')
+_FD_REDIRECT = re.compile(r'(\d+)(>>|>&|>|<)')
+
+_WORD = 'word'
+_OP = 'op'
+_REDIRECT = 'redirect'
+
+
+class _Word(object):
+    """
+    A word from the command line.
+    """
+    def __init__(self, value, text, expands):
+        #: The word with quoting removed
+        self.value = value
+        #: The word as written
+        self.text = text
+        #: Has unquoted expansions or globs that only the shell can evaluate
+        self.expands = expands
+
+    def as_arg(self, value=None, text=None):
+        """
+        The clom value that renders as the word.
+        """
+        value = self.value if value is None else value
+        text = self.text if text is None else text
+        if self.expands:
+            return arg.RawArg(text)
+        elif str(arg.LiteralArg(value)) == text:
+            return value
+        return arg.QuotedArg(value, text)
+
+
+def _skip_substitution(s, i):
+    """
+    Index after the `)` that closes a `$(` whose contents start at `i`.
+    """
+    depth = 1
+    n = len(s)
+    while i < n:
+        c = s[i]
+        if c == '\\':
+            i += 2
+            continue
+        elif c == "'":
+            j = s.find("'", i + 1)
+            if j < 0:
+                break
+            i = j
+        elif c == '"':
+            i += 1
+            while i < n and s[i] != '"':
+                i += 2 if s[i] == '\\' else 1
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    raise ParseError('Unterminated $( in %r' % s)
+
+
+def _read_word(s, i):
+    """
+    Read the word starting at `i`.
+
+    :returns: tuple - `(_Word, index after the word)`
+    """
+    start = i
+    n = len(s)
+    value = []
+    expands = False
+
+    while i < n and s[i] not in _METACHARS:
+        c = s[i]
+        if c == "'":
+            j = s.find("'", i + 1)
+            if j < 0:
+                raise ParseError('Unterminated single quote in %r' % s)
+            value.append(s[i + 1:j])
+            i = j + 1
+        elif c == '"':
+            i += 1
+            while True:
+                if i >= n:
+                    raise ParseError('Unterminated double quote in %r' % s)
+                c = s[i]
+                if c == '"':
+                    i += 1
+                    break
+                elif c == '\\' and i + 1 < n and s[i + 1] in '$`"\\\n':
+                    value.append(s[i + 1])
+                    i += 2
+                elif c == '$' and s[i + 1:i + 2] == '(':
+                    expands = True
+                    j = _skip_substitution(s, i + 2)
+                    value.append(s[i:j])
+                    i = j
+                else:
+                    if c in '$`':
+                        expands = True
+                    value.append(c)
+                    i += 1
+        elif c == '\\':
+            if i + 1 < n and s[i + 1] != '\n':
+                value.append(s[i + 1])
+            i += 2
+        elif c == '$' and s[i + 1:i + 2] == '(':
+            expands = True
+            j = _skip_substitution(s, i + 2)
+            value.append(s[i:j])
+            i = j
+        else:
+            if c in '$`' or c in _GLOBS or (c == '~' and i == start):
+                expands = True
+            value.append(c)
+            i += 1
+
+    return _Word(''.join(value), s[start:i], expands), i
+
+
+def _tokenize(s):
+    tokens = []
+    i = 0
+    n = len(s)
+    while i < n:
+        c = s[i]
+        if c in ' \t':
+            i += 1
+            continue
+        elif c == '\n':
+            tokens.append((_OP, ';'))
+            i += 1
+            continue
+        elif c == '#':
+            # Comment to the end of the line
+            j = s.find('\n', i)
+            i = n if j < 0 else j
+            continue
+
+        m = _FD_REDIRECT.match(s, i)
+        if m:
+            tokens.append((_REDIRECT, int(m.group(1)), m.group(2)))
+            i = m.end()
+            continue
+
+        for op in _OPERATORS:
+            if s.startswith(op, i):
+                if op in _REDIRECTS:
+                    tokens.append((_REDIRECT, None, op))
+                else:
+                    tokens.append((_OP, op))
+                i += len(op)
+                break
+        else:
+            word, i = _read_word(s, i)
+            tokens.append((_WORD, word))
+
+    return tokens
+
+
+class _Parser(object):
+    def __init__(self, cmdline, clom):
+        self.cmdline = cmdline
+        self.clom = clom
+        self.tokens = _tokenize(cmdline)
+        self.i = 0
+
+    def error(self, message):
+        return ParseError('%s in %r' % (message, self.cmdline))
+
+    def peek(self):
+        if self.i < len(self.tokens):
+            return self.tokens[self.i]
+        return None
+
+    def next(self):
+        token = self.peek()
+        self.i += 1
+        return token
+
+    def is_op(self, *ops):
+        token = self.peek()
+        return token is not None and token[0] == _OP and token[1] in ops
+
+    def parse(self):
+        background = False
+        tokens = self.tokens
+        # The way clom renders backgrounded commands: nohup ... &> /dev/null &
+        if (len(tokens) > 4 and tokens[0][0] == _WORD and tokens[0][1].text == 'nohup'
+                and tokens[-3] == (_OP, '&>')
+                and tokens[-2][0] == _WORD and tokens[-2][1].value == '/dev/null'
+                and tokens[-1] == (_OP, '&')):
+            self.tokens = tokens[1:-3]
+            background = True
+
+        if not self.tokens:
+            raise self.error('Nothing to parse')
+
+        op = self.and_or()
+        token = self.peek()
+        if token is not None:
+            raise self.error('Unsupported %r' % (token[1] if token[0] != _REDIRECT else token[2]))
+        if background:
+            op = op.background()
+        return op
+
+    def and_or(self):
+        items = [self.pipeline()]
+        operator = None
+        while self.is_op('&&', '||'):
+            o = self.next()[1]
+            right = self.pipeline()
+            if operator is None or o == operator:
+                items.append(right)
+            else:
+                items = [self.conjunction(operator, items), right]
+            operator = o
+
+        if operator is None:
+            return items[0]
+        return self.conjunction(operator, items)
+
+    def conjunction(self, operator, items):
+        return AND(*items) if operator == '&&' else OR(*items)
+
+    def pipeline(self):
+        op = self.command()
+        while self.is_op('|'):
+            self.next()
+            op = op.pipe_to(self.command())
+        return op
+
+    def command(self):
+        if self.is_op('('):
+            self.next()
+            op = self.and_or()
+            if not self.is_op(')'):
+                raise self.error('Missing )')
+            self.next()
+            return self.redirects(op)
+
+        env = []
+        words = []
+        op = None
+        while True:
+            token = self.peek()
+            if token is None or token[0] == _OP:
+                break
+            elif token[0] == _REDIRECT:
+                if op is None:
+                    op = self.build(env, words)
+                    words = []
+                op = self.redirect(op)
+                continue
+
+            word = self.next()[1]
+            if op is not None:
+                raise self.error('Arguments after redirects are not supported')
+            if not words and _ASSIGNMENT.match(word.text):
+                name, _, value = word.value.partition('=')
+                env.append((name, word.as_arg(value, word.text[len(name) + 1:])))
+            elif not words and not env and word.text == 'env' and self._assignment_follows():
+                continue
+            else:
+                words.append(word)
+
+        if op is None:
+            op = self.build(env, words)
+        return op
+
+    def _assignment_follows(self):
+        token = self.peek()
+        return token is not None and token[0] == _WORD and _ASSIGNMENT.match(token[1].text) is not None
+
+    def build(self, env, words):
+        if not words:
+            raise self.error('Missing command')
+        name = words[0]
+        if name.expands:
+            cmd = Command(self.clom, arg.RawArg(name.text))
+        else:
+            cmd = self.clom[name.value]
+        cmd = cmd.with_args(*[w.as_arg() for w in words[1:]])
+        if env:
+            cmd = cmd._clone()
+            cmd._env.update(env)
+        return cmd
+
+    def redirects(self, op):
+        while True:
+            token = self.peek()
+            if token is None or token[0] != _REDIRECT:
+                return op
+            op = self.redirect(op)
+
+    def redirect(self, op):
+        _, fd, kind = self.next()
+        if fd is None:
+            fd = arg.STDIN if kind == '<' else arg.STDOUT
+
+        token = self.next()
+        if token is None or token[0] != _WORD:
+            raise self.error('Missing redirect target')
+        word = token[1]
+        if kind == '>&':
+            if not word.value.isdigit():
+                raise self.error('Unsupported redirect %s%s' % (kind, word.text))
+            target = int(word.value)
+        else:
+            target = word.as_arg()
+
+        op = op._clone()
+        op._redirects[fd] = (kind, target)
+        return op
+
+
+_cache = LRUCache(4096)
+
+
+def parse(cmdline, clom=None):
+    """
+    Parse a POSIX shell command line into clom operations so it can be
+    changed with clom's builders.
+
+    Pipelines, `&&`, `||`, `( ... )` groups, redirects, `env` and variable
+    assignment prefixes, and clom's `nohup ... &> /dev/null &` backgrounding
+    are understood. Arguments with expansions such as `$HOME` or `*.txt` are
+    kept as written in a `RawArg`. `a && b` parses to an `AND`, which renders
+    as `( a && b )`, and a group holding a single pipeline loses its parentheses.
+    Sequences with `;` and here documents are not supported.
+
+    Results are cached by command line. They are safe to share since builder
+    methods always return a changed copy.
+
+    :param cmdline: str - The command line
+    :param clom: `Clom` the commands belong to, defaults to `clom.clom`
+    :raises: ParseError
+    :returns: Operation
+
+    ::
+
+        >>> op = parse("grep -r 'needle' src | sort > out.txt")
+        >>> op
+        "grep -r 'needle' src | sort > out.txt"
+        >>> parse('ls -la').with_args('/tmp').pipe_to(clom.wc(l=True))
+        'ls -la /tmp | wc -l'
+        >>> parse("env DEBUG=1 make test && echo 'it worked'")
+        "( env DEBUG=1 make test && echo 'it worked' )"
+
+    """
+    if clom is None:
+        from clom import clom
+
+    return _cache.get((cmdline, clom), lambda: _Parser(cmdline, clom).parse())
+
+
+def parse_cache_info():
+    """
+    Statistics for the cache of parsed command lines.
+    """
+    return _cache.info()
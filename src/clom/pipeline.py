@@ -0,0 +1,227 @@
+import errno
+import os
+import subprocess
+import threading
+import logging
+
+from clom.command import Operation
+from clom.shell import CommandError
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'Pipeline',
+]
+
+
+def _segments(operation):
+    """
+    Group an operation's stages into command strings for the shell and Python callables.
+
+    Consecutive operations are joined into one command string so the shell pipes them
+    together without going through Python.
+
+    :returns: list - `(is_command, command string or callable)` tuples
+    """
+    segments = []
+    commands = []
+    for stage in operation._stages():
+        if not isinstance(stage, Operation):
+            if commands:
+                segments.append((True, ' | '.join(commands)))
+                commands = []
+            segments.append((False, stage))
+        else:
+            commands.append(str(stage))
+    if commands:
+        segments.append((True, ' | '.join(commands)))
+    return segments
+
+
+def _stage_name(func):
+    return getattr(func, '__name__', None) or repr(func)
+
+
+class _PythonStage(threading.Thread):
+    """
+    Runs a Python pipeline stage, reading lines from the previous stage and writing
+    what it yields to the next.
+
+    Writes block while the next stage is behind, so a slow consumer holds back the
+    producer instead of output piling up in memory.
+    """
+    def __init__(self, func, source, sink, encoding):
+        super(_PythonStage, self).__init__(name='clom-pipeline-%s' % _stage_name(func))
+        self.daemon = True
+        self.func = func
+        self.source = source
+        self.sink = sink
+        self.encoding = encoding
+        #: Exception raised by `func`, if any
+        self.error = None
+
+    def _lines(self):
+        for line in iter(self.source.readline, b''):
+            if self.encoding:
+                line = line.decode(self.encoding, 'replace')
+            yield line
+
+    def run(self):
+        try:
+            for out in self.func(self._lines()):
+                if self.encoding and not isinstance(out, bytes):
+                    out = out.encode(self.encoding)
+                self.sink.write(out)
+        except (IOError, OSError) as e:
+            # The next stage stopped reading, there's nobody left to write to
+            if e.errno != errno.EPIPE:
+                self.error = e
+        except Exception as e:
+            self.error = e
+        finally:
+            for f in (self.sink, self.source):
+                try:
+                    f.close()
+                except (IOError, OSError):
+                    pass
+
+
+class Pipeline(object):
+    """
+    A running pipeline that mixes commands with Python stages.
+
+    Don't create directly, it's used by `Shell` for operations piped to a callable.
+    A Python stage is called with an iterator of the previous stage's output lines,
+    decoded and with their line endings, and returns an iterable of strings that
+    are written to the next stage as is. Each Python stage runs in its own thread,
+    while runs of consecutive commands are left to the shell. A stage that raises
+    fails the pipeline with a `CommandError` naming it.
+
+    The commands are run as rendered, so their environment variables and priority
+    are applied with the `env`, `nice`, `ionice` and `taskset` prefixes rather than
+    natively as `Shell` does for other operations.
+
+    Has the parts of the `subprocess.Popen` interface `Shell` uses: `stdout`,
+    `poll`, `wait`, `kill` and `communicate`.
+
+    ::
+
+        >>> def shout(lines):
+        ...     for line in lines:
+        ...         yield line.upper()
+        >>> clom.printf('a\\\\nb\\\\n').pipe_to(shout).pipe_to(clom.sort(r=True)).shell.all()
+        ['B', 'A']
+
+    """
+    def __init__(self, operation, backend, stdout=None, stderr=None, encoding=None):
+        """
+        :param operation: Operation with Python stages
+        :param backend: `clom.backend.Backend` to start the commands with
+        :param stdout: Where the last stage's output goes, `subprocess.PIPE`, a file, or
+                       `None` for this process's stdout
+        :param stderr: Where the commands' stderr goes, a file or `None` for this process's stderr
+        :param encoding: Encoding used to decode lines for, and encode output from, Python stages
+        """
+        if operation.is_background:
+            raise ValueError('Pipelines with Python stages can not run in the background: %r' % operation)
+
+        self._procs = []
+        self._threads = []
+        segments = _segments(operation)
+        self._last_is_command = segments[-1][0]
+
+        # Readable end of the previous stage's output
+        upstream = None
+        try:
+            for i, (is_command, stage) in enumerate(segments):
+                last = i == len(segments) - 1
+                if is_command:
+                    log.info('Pipeline command: %s' % stage)
+                    p = backend.popen(stage, stdin=upstream,
+                                      stdout=stdout if last else subprocess.PIPE, stderr=stderr)
+                    if upstream is not None:
+                        upstream.close()
+                    self._procs.append(p)
+                    upstream = p.stdout
+                else:
+                    if last and stdout is not subprocess.PIPE:
+                        fd = stdout.fileno() if stdout is not None else 1
+                        sink = os.fdopen(os.dup(fd), 'wb', 0)
+                        read = None
+                    else:
+                        r, w = os.pipe()
+                        sink = os.fdopen(w, 'wb', 0)
+                        read = os.fdopen(r, 'rb')
+                    t = _PythonStage(stage, upstream, sink, encoding)
+                    t.start()
+                    self._threads.append(t)
+                    upstream = read
+        except Exception:
+            if upstream is not None:
+                upstream.close()
+            self.kill()
+            raise
+
+        #: Output of the last stage if `stdout` was `subprocess.PIPE`
+        self.stdout = upstream
+        self.returncode = None
+
+    def _status(self):
+        for t in self._threads:
+            if t.error is not None:
+                name = _stage_name(t.func)
+                error = CommandError(1, '', '', 'Python pipeline stage %s failed: %s: %s' % (
+                    name, type(t.error).__name__, t.error))
+                error.stage = name
+                error.__cause__ = t.error
+                raise error
+        # Like the shell, the pipeline's status is the last command's
+        if self._last_is_command:
+            self.returncode = self._procs[-1].returncode
+        else:
+            self.returncode = 0
+        return self.returncode
+
+    def poll(self):
+        if any(p.poll() is None for p in self._procs) or any(t.is_alive() for t in self._threads):
+            return None
+        return self._status()
+
+    def wait(self):
+        """
+        Wait for every stage to finish.
+
+        :raises: CommandError - If a Python stage raised, with the exception as its `__cause__`
+        :returns: int - Status of the last stage
+        """
+        for p in self._procs:
+            p.wait()
+        for t in self._threads:
+            t.join()
+        return self._status()
+
+    def kill(self):
+        """
+        Kill the commands. Python stages stop once their input or output closes.
+        """
+        for p in self._procs:
+            if p.poll() is None:
+                try:
+                    p.kill()
+                except OSError:
+                    pass
+
+    def communicate(self):
+        """
+        Read the last stage's output and wait for every stage to finish.
+
+        :returns: tuple - `(stdout, None)`
+        """
+        stdout = None
+        if self.stdout is not None:
+            try:
+                stdout = self.stdout.read()
+            finally:
+                self.stdout.close()
+        self.wait()
+        return stdout, None
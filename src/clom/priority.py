@@ -0,0 +1,182 @@
+import errno
+import os
+import sys
+
+__all__ = [
+    'Priority',
+]
+
+# ioprio_set(2) isn't wrapped by the os module, these are its syscall numbers
+_IOPRIO_SET = {
+    'x86_64': 251,
+    'amd64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'arm64': 30,
+    'riscv64': 30,
+    'armv7l': 314,
+    'ppc64': 273,
+    'ppc64le': 273,
+    's390x': 282,
+}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+
+_ioprio_set = None
+
+
+def _ioprio_setter():
+    """
+    A function setting this process's IO scheduling class and level, or `None`
+    if the platform doesn't have `ioprio_set`.
+    """
+    global _ioprio_set
+    if _ioprio_set is None:
+        machine = os.uname()[4].lower() if hasattr(os, 'uname') else ''
+        number = _IOPRIO_SET.get(machine)
+        if number is None or not sys.platform.startswith('linux'):
+            _ioprio_set = False
+        else:
+            import ctypes
+            syscall = ctypes.CDLL(None, use_errno=True).syscall
+
+            def ioprio_set(cls, level):
+                if syscall(number, _IOPRIO_WHO_PROCESS, 0, (cls << _IOPRIO_CLASS_SHIFT) | level) != 0:
+                    e = ctypes.get_errno()
+                    raise OSError(e, os.strerror(e))
+
+            _ioprio_set = ioprio_set
+    return _ioprio_set or None
+
+
+class Priority(object):
+    """
+    CPU and IO scheduling for an operation, see `Operation.with_priority`.
+
+    Rendered as the `taskset`, `ionice` and `nice` prefix that would do the same::
+
+        >>> Priority(nice=10, ionice='idle', cpu_affinity=[2, 3]).prefix()
+        ['taskset', '-c', '2,3', 'ionice', '-c', '3', 'nice', '-n', '10']
+        >>> Priority(ionice=('best-effort', 7)).prefix()
+        ['ionice', '-c', '2', '-n', '7']
+
+    """
+    #: IO scheduling classes by name
+    ionice_classes = {
+        'realtime': 1,
+        'best-effort': 2,
+        'idle': 3,
+    }
+
+    def __init__(self, nice=None, ionice=None, cpu_affinity=None):
+        """
+        :param nice: Niceness to add, like `nice -n`
+        :param ionice: IO scheduling class, one of `ionice_classes` or its number, or
+                       a tuple of the class and a level from `0` to `7`
+        :param cpu_affinity: CPUs the process may run on
+        """
+        if nice is not None and not isinstance(nice, int):
+            raise TypeError('nice must be an int, not %r' % (nice,))
+        self.nice = nice
+
+        self.ionice = None
+        if ionice is not None:
+            cls, level = ionice if isinstance(ionice, tuple) else (ionice, None)
+            cls = self.ionice_classes.get(cls, cls)
+            if cls not in self.ionice_classes.values():
+                raise ValueError('Unknown IO scheduling class %r' % (ionice,))
+            if level is not None and (cls == 3 or level not in range(8)):
+                raise ValueError('Invalid IO scheduling level in %r' % (ionice,))
+            self.ionice = (cls, level)
+
+        self.cpu_affinity = None
+        if cpu_affinity is not None:
+            self.cpu_affinity = tuple(sorted(set(int(cpu) for cpu in cpu_affinity)))
+            if not self.cpu_affinity or self.cpu_affinity[0] < 0:
+                raise ValueError('Invalid CPU affinity %r' % (cpu_affinity,))
+
+    def __repr__(self):
+        return '<Priority %s>' % ' '.join(self.prefix())
+
+    def __eq__(self, other):
+        if not isinstance(other, Priority):
+            return NotImplemented
+        return (self.nice, self.ionice, self.cpu_affinity) == (other.nice, other.ionice, other.cpu_affinity)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __hash__(self):
+        return hash((self.nice, self.ionice, self.cpu_affinity))
+
+    def prefix(self):
+        """
+        :returns: list - Command line parts to put before a command
+        """
+        s = []
+        if self.cpu_affinity is not None:
+            s.extend(['taskset', '-c', ','.join(str(cpu) for cpu in self.cpu_affinity)])
+        if self.ionice is not None:
+            cls, level = self.ionice
+            s.extend(['ionice', '-c', str(cls)])
+            if level is not None:
+                s.extend(['-n', str(level)])
+        if self.nice is not None:
+            s.extend(['nice', '-n', str(self.nice)])
+        return s
+
+    def is_native(self):
+        """
+        Can the priority be applied to processes started here without the prefix.
+        """
+        if self.cpu_affinity is not None and not hasattr(os, 'sched_setaffinity'):
+            return False
+        if self.ionice is not None and _ioprio_setter() is None:
+            return False
+        return hasattr(os, 'nice')
+
+    def preexec(self):
+        """
+        A function that applies the priority to the process calling it, for `preexec_fn`.
+
+        Everything that could need a lock is looked up here, before the fork, and the
+        CPU affinity is checked against the CPUs this process may use so a bad one
+        fails here rather than in the child.
+
+        Like `nice`, a niceness that isn't permitted is ignored and the process runs
+        at its current niceness.
+
+        :raises: ValueError - If some of the CPUs aren't available
+        """
+        nice = self.nice
+        ionice = self.ionice
+        cpu_affinity = self.cpu_affinity
+        ioprio_set = _ioprio_setter() if ionice is not None else None
+
+        if cpu_affinity is not None:
+            available = os.sched_getaffinity(0)
+            missing = sorted(set(cpu_affinity) - available)
+            if missing:
+                raise ValueError('CPUs %s are not available, this process may use %s' % (
+                    ','.join(str(cpu) for cpu in missing), ','.join(str(cpu) for cpu in sorted(available))))
+
+        def apply():
+            if cpu_affinity is not None:
+                os.sched_setaffinity(0, cpu_affinity)
+            if ionice is not None:
+                cls, level = ionice
+                # ionice's default level, idle has none
+                if level is None:
+                    level = 0 if cls == 3 else 4
+                ioprio_set(cls, level)
+            if nice:
+                try:
+                    os.nice(nice)
+                except OSError as e:
+                    # Raising priority needs privileges, nice(1) runs the command anyway
+                    if e.errno not in (errno.EPERM, errno.EACCES):
+                        raise
+
+        return apply
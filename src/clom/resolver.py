@@ -0,0 +1,135 @@
+import os
+import threading
+
+from clom._errors import CommandError
+
+__all__ = [
+    'Resolver',
+    'ExecutableNotFound',
+]
+
+#: Shell builtins that have no executable, these are left for the shell to run
+SHELL_BUILTINS = frozenset([
+    '.', ':', 'alias', 'bg', 'break', 'cd', 'command', 'continue', 'eval', 'exec',
+    'exit', 'export', 'fg', 'getopts', 'hash', 'jobs', 'local', 'read', 'readonly',
+    'return', 'set', 'shift', 'source', 'times', 'trap', 'type', 'ulimit', 'umask',
+    'unalias', 'unset', 'wait',
+])
+
+#: Programs the shell has builtins for that behave differently, such as dash's `echo`
+#: interpreting backslashes, left for the shell to run so they match the rendered command
+SHELL_BUILTIN_VARIANTS = frozenset([
+    '[', 'echo', 'kill', 'printf', 'pwd', 'test',
+])
+
+
+class ExecutableNotFound(CommandError):
+    """
+    A command's executable is not on the `PATH`.
+
+    Has the same status code the shell uses for a missing command.
+    """
+    def __init__(self, name, path):
+        message = '%s: command not found in PATH=%s' % (name, path)
+        super(ExecutableNotFound, self).__init__(127, '', message, message)
+        self.name = name
+        self.path = path
+
+
+class Resolver(object):
+    """
+    Resolves command names to absolute paths using an index of the `PATH` directories.
+
+    Each directory is listed once and re-listed only when its modification time
+    changes, so resolving a name costs a `stat` of each directory up to the one
+    it's found in rather than a `stat` of every candidate path.
+
+    ::
+
+        >>> from clom import Clom
+        >>> c = Clom(resolver=Resolver(path='/bin:/usr/bin'))
+        >>> c.ls('-a')          # doctest: +SKIP
+        '/bin/ls -a'
+        >>> c.cd('/tmp')
+        'cd /tmp'
+
+    Names that aren't found are rendered as they are, running them raises before
+    any process is started::
+
+        >>> c['not-a-real-command']
+        'not-a-real-command'
+        >>> c['not-a-real-command'].shell()     # doctest:+IGNORE_EXCEPTION_DETAIL
+        Traceback (most recent call last):
+            ...
+        ExecutableNotFound: not-a-real-command: command not found in PATH=/bin:/usr/bin
+
+    """
+    def __init__(self, path=None):
+        """
+        :param path: Search path to use instead of the `PATH` environment variable
+        """
+        self._path = path
+        # Directory -> (mtime, set of names)
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'path': self._path}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def path(self):
+        if self._path is not None:
+            return self._path
+        return os.environ.get('PATH', os.defpath)
+
+    def _names(self, directory):
+        """
+        Names in `directory`, listing it again if it changed since it was indexed.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime
+        except OSError:
+            return ()
+
+        entry = self._index.get(directory)
+        if entry is None or entry[0] != mtime:
+            try:
+                names = frozenset(os.listdir(directory))
+            except OSError:
+                names = frozenset()
+            with self._lock:
+                self._index[directory] = (mtime, names)
+            return names
+        return entry[1]
+
+    def resolve(self, name):
+        """
+        Get the absolute path of the executable for `name`.
+
+        Names containing a `/` and shell builtins are returned as is.
+
+        :raises: ExecutableNotFound
+        :returns: str
+        """
+        if '/' in name or name in SHELL_BUILTINS:
+            return name
+
+        path = self.path
+        for directory in path.split(os.pathsep):
+            directory = directory or '.'
+            if name in self._names(directory):
+                candidate = os.path.join(directory, name)
+                if os.access(candidate, os.X_OK) and not os.path.isdir(candidate):
+                    return os.path.abspath(candidate)
+
+        raise ExecutableNotFound(name, path)
+
+    def clear(self):
+        """
+        Forget every indexed directory.
+        """
+        with self._lock:
+            self._index.clear()
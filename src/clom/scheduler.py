@@ -0,0 +1,336 @@
+import collections
+import threading
+import time
+import logging
+
+from clom.command import BaseConjunction, Command
+from clom.shell import CommandError
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'Scheduler',
+    'Ticket',
+    'URGENT',
+    'NORMAL',
+    'BULK',
+    'command_name',
+]
+
+#: Priority classes, lower runs first
+URGENT = 0
+NORMAL = 1
+BULK = 2
+
+
+def command_name(operation):
+    """
+    The name of the program an operation starts with, the default fair share key.
+
+    ::
+
+        >>> command_name(clom.git.status | clom.grep('x'))
+        'git'
+        >>> from clom import AND
+        >>> command_name(AND(clom.rsync('a', 'b'), clom.touch('done')))
+        'rsync'
+
+    """
+    while True:
+        if isinstance(operation, Command):
+            while operation._parent is not None:
+                operation = operation._parent
+            return str(operation.name)
+        if isinstance(operation, BaseConjunction) and operation.commands:
+            operation = operation.commands[0]
+            continue
+        return type(operation).__name__
+
+
+class Ticket(object):
+    """
+    An operation waiting for, or given, its turn in a `Scheduler`.
+    """
+    def __init__(self, operation, priority, key):
+        self.operation = operation
+        self.priority = priority
+        self.key = key
+        #: When it was submitted, started and finished, from `time.time()`
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._result = None
+        self._error = None
+        self._done = threading.Event()
+
+    def __repr__(self):
+        if self.finished is not None:
+            state = 'finished'
+        elif self.started is not None:
+            state = 'running'
+        else:
+            state = 'queued'
+        return '<Ticket %s priority=%s key=%r>' % (state, self.priority, self.key)
+
+    @property
+    def wait_time(self):
+        """
+        Seconds spent queued, so far if it hasn't started.
+        """
+        return (self.started or time.time()) - self.submitted
+
+    def done(self):
+        """
+        Has the operation finished, or been cancelled.
+        """
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the operation to finish.
+
+        :param timeout: Seconds to wait, `None` to wait forever
+        :returns: `CommandResult`
+        :raises: `CommandError` if the operation failed, or the exception
+                 it raised. `RuntimeError` if it was cancelled or the
+                 timeout expired.
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('%r did not finish in %ss' % (self, timeout))
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class _WaitTimes(object):
+    """
+    The most recent wait times of one priority class.
+    """
+    def __init__(self, window):
+        self.count = 0
+        self.recent = collections.deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.recent.append(seconds)
+
+    def summary(self):
+        samples = sorted(self.recent)
+        if not samples:
+            return {'count': self.count, 'mean': None, 'p95': None, 'max': None}
+        return {
+            'count': self.count,
+            'mean': sum(samples) / len(samples),
+            'p95': samples[int(round((len(samples) - 1) * 0.95))],
+            'max': samples[-1],
+        }
+
+
+class Scheduler(object):
+    """
+    A queue in front of `Shell` execution that decides which operation runs next.
+
+    Operations run on `workers` threads. The most urgent priority class with
+    anything runnable goes first. Within a class the keys take turns, one
+    operation each, so a flood from one key doesn't starve the others. A key
+    with `caps` running operations already is skipped until one finishes.
+
+    Keys come from `key`, by default `command_name`, or are given to `submit`
+    to share by host, tenant or anything else.
+
+    ::
+
+        >>> with Scheduler(workers=2, caps={'sleep': 1}) as scheduler:
+        ...     bulk = [scheduler.submit(clom.sleep(0.1), priority=BULK) for _ in range(3)]
+        ...     urgent = scheduler.submit(clom.echo('now'), priority=URGENT)
+        ...     str(urgent.result())
+        'now'
+        >>> [t.done() for t in bulk]
+        [True, True, True]
+
+    """
+    def __init__(self, workers=4, caps=None, default_cap=None, key=command_name, window=1000):
+        """
+        :param workers: Most operations to run at once
+        :param caps: dict - Most operations to run at once for each key
+        :param default_cap: Most operations to run at once for keys not in `caps`,
+                            `None` for no limit
+        :param key: Function giving an operation's key when `submit` isn't given one
+        :param window: Number of recent wait times kept for each priority class
+        """
+        self.workers = workers
+        self.caps = dict(caps or {})
+        self.default_cap = default_cap
+        self.key = key
+        self.window = window
+
+        self._lock = threading.Condition()
+        # priority -> key -> deque of tickets
+        self._queues = {}
+        # priority -> deque of keys in turn order
+        self._turns = {}
+        self._running = collections.Counter()
+        self._waits = {}
+        self._closed = False
+
+        self._threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._work, name='clom-scheduler-%d' % i)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def __repr__(self):
+        return '<Scheduler workers=%s>' % self.workers
+
+    def cap(self, key):
+        """
+        Most operations to run at once for `key`, `None` for no limit.
+        """
+        return self.caps.get(key, self.default_cap)
+
+    def submit(self, operation, priority=NORMAL, key=None):
+        """
+        Queue an operation.
+
+        :param operation: `Operation` to run with its shell
+        :param priority: Priority class, lower runs first
+        :param key: Fair share key, defaults to `key(operation)`
+        :returns: `Ticket`
+        """
+        if key is None:
+            key = self.key(operation)
+        ticket = Ticket(operation, priority, key)
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('%r is shut down' % self)
+            queues = self._queues.setdefault(priority, {})
+            if key not in queues:
+                queues[key] = collections.deque()
+                self._turns.setdefault(priority, collections.deque()).append(key)
+            queues[key].append(ticket)
+            self._lock.notify()
+        return ticket
+
+    def _next(self):
+        """
+        Take the next runnable ticket off the queues, or `None`. Called holding the lock.
+        """
+        for priority in sorted(self._turns):
+            turns = self._turns[priority]
+            queues = self._queues[priority]
+            for _ in range(len(turns)):
+                key = turns[0]
+                turns.rotate(-1)
+                cap = self.cap(key)
+                if cap is not None and self._running[key] >= cap:
+                    continue
+
+                queue = queues[key]
+                ticket = queue.popleft()
+                if not queue:
+                    del queues[key]
+                    turns.remove(key)
+                    if not turns:
+                        del self._turns[priority]
+                        del self._queues[priority]
+                return ticket
+        return None
+
+    def _work(self):
+        while True:
+            with self._lock:
+                ticket = self._next()
+                while ticket is None:
+                    if self._closed and not self._turns:
+                        return
+                    self._lock.wait()
+                    ticket = self._next()
+                ticket.started = time.time()
+                self._running[ticket.key] += 1
+                self._waits.setdefault(ticket.priority, _WaitTimes(self.window)).add(ticket.wait_time)
+
+            log.debug('Running %r after %.3fs' % (ticket, ticket.wait_time))
+            try:
+                ticket._result = ticket.operation.shell()
+            except CommandError as e:
+                ticket._error = e
+            except Exception as e:
+                log.exception('Error running %r' % ticket)
+                ticket._error = e
+            finally:
+                ticket.finished = time.time()
+                with self._lock:
+                    self._running[ticket.key] -= 1
+                    if not self._running[ticket.key]:
+                        del self._running[ticket.key]
+                    # A worker may be waiting on this key's cap
+                    self._lock.notify_all()
+                ticket._done.set()
+
+    def metrics(self):
+        """
+        The state of the queue.
+
+        ::
+
+            {
+                'queued': {priority: number of operations waiting},
+                'queued_by_key': {key: number of operations waiting},
+                'running': {key: number of operations running},
+                'oldest_wait': {priority: seconds the longest waiting operation has waited},
+                'wait_times': {priority: {'count', 'mean', 'p95', 'max'}},
+            }
+
+        Wait times are of operations that have started, the mean, 95th percentile
+        and maximum are of the most recent `window` of them.
+
+        :returns: dict
+        """
+        now = time.time()
+        with self._lock:
+            queued = {}
+            queued_by_key = collections.Counter()
+            oldest_wait = {}
+            for priority, queues in self._queues.items():
+                queued[priority] = sum(len(q) for q in queues.values())
+                oldest_wait[priority] = now - min(q[0].submitted for q in queues.values())
+                for key, queue in queues.items():
+                    queued_by_key[key] += len(queue)
+            return {
+                'queued': queued,
+                'queued_by_key': dict(queued_by_key),
+                'running': dict(self._running),
+                'oldest_wait': oldest_wait,
+                'wait_times': dict((p, w.summary()) for p, w in self._waits.items()),
+            }
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        Stop accepting operations.
+
+        :param wait: Wait for the workers to finish
+        :param cancel: Drop queued operations instead of running them, their
+                       tickets raise `RuntimeError`
+        """
+        with self._lock:
+            self._closed = True
+            if cancel:
+                for queues in self._queues.values():
+                    for queue in queues.values():
+                        for ticket in queue:
+                            ticket._error = RuntimeError('%r was cancelled' % ticket)
+                            ticket._done.set()
+                self._queues.clear()
+                self._turns.clear()
+            self._lock.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -1,8 +1,21 @@
+import codecs
+import os
+import re
 import subprocess
+import tempfile
+import threading
 import time
 import logging
 
+from array import array
+
+from clom import streams
+from clom._environ import merged_environ
+# Defined apart so modules that only render commands can use it without loading this one
+from clom._errors import CommandError
 from clom._compat import string_types
+from clom.backend import get_default_backend
+from clom.spawn import PrioritySpawner
 
 log = logging.getLogger(__name__)
 
@@ -10,19 +23,25 @@ __all__ = [
     'Shell',
     'CommandError',
     'CommandResult',
+    'ConjunctionResult',
+    'StepResult',
 ]
 
-class CommandError(Exception):
-    """
-    An error returned from a shell command.
-    """
-    def __init__(self, return_code, stdout, stderr, message):
-        super(CommandError, self).__init__(message)
-
-        self.stdout = stdout
-        self.stderr = stderr
-        self.code = return_code
-        self.return_code = return_code
+# Line boundaries for the line index of `CommandResult`, the same as `splitlines`.
+# Output rarely has any but \n, which is much quicker to scan for alone.
+_NEWLINE = re.compile(u'\n')
+_NEWLINE_BYTES = re.compile(b'\n')
+_LINE_END = re.compile(u'\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+_LINE_END_BYTES = re.compile(b'\r\n|[\n\r]')
+_OTHER_BREAKS = u'\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+_OTHER_BREAKS_BYTES = (b'\r',)
+
+try:
+    array('Q')
+    _OFFSET_TYPE = 'Q'
+except ValueError:
+    # Python 2 has no unsigned long long arrays
+    _OFFSET_TYPE = 'L'
 
 class _AttributeString(str):
     """
@@ -32,11 +51,24 @@ class _AttributeString(str):
 class CommandResult(object):
     """
     The result of a command execution.
+
+    Lines of output can be counted, indexed, sliced and iterated in reverse. An
+    index of where each line ends is built the first time it's needed, and lines
+    are only created when they're asked for::
+
+        >>> r = CommandResult(0, 'a\\n b \\nc\\n')
+        >>> len(r), r[1], r[-1], r[:2]
+        (3, 'b', 'c', ['a', 'b'])
+        >>> list(reversed(r))
+        ['c', 'b', 'a']
+
     """
     def __init__(self, return_code, stdout='', stderr=''):
         self._stdout = stdout
         self._return_code = return_code
         self._stderr = stderr
+        # Offset just past each line, built on first use
+        self._line_ends = None
 
     def __str__(self):
         if self._stdout.endswith('\n'):
@@ -79,6 +111,66 @@ class CommandResult(object):
         """        
         return self._stderr                
 
+    def _ends(self):
+        """
+        The offset just past each line of stdout, splitting lines the same as `splitlines`.
+
+        Found by scanning for line boundaries, so no line is copied to build it.
+
+        :returns: array
+        """
+        if self._line_ends is None:
+            stdout = self._stdout or ''
+            if isinstance(stdout, bytes):
+                others, line_end, newline = _OTHER_BREAKS_BYTES, _LINE_END_BYTES, _NEWLINE_BYTES
+            else:
+                others, line_end, newline = _OTHER_BREAKS, _LINE_END, _NEWLINE
+            if not any(c in stdout for c in others):
+                line_end = newline
+            ends = array(_OFFSET_TYPE, (m.end() for m in line_end.finditer(stdout)))
+            if len(stdout) > (ends[-1] if ends else 0):
+                # The last line has no line ending
+                ends.append(len(stdout))
+            self._line_ends = ends
+        return self._line_ends
+
+    def _line(self, i, strip=True):
+        ends = self._ends()
+        line = self._stdout[ends[i - 1] if i else 0:ends[i]]
+        return line.strip() if strip else line
+
+    def __len__(self):
+        """
+        Number of lines of output.
+        """
+        return len(self._ends())
+
+    def __bool__(self):
+        # A result is true even without output
+        return True
+
+    __nonzero__ = __bool__
+
+    def __getitem__(self, i):
+        """
+        A line, or list of lines for a slice, with whitespace stripped.
+        """
+        n = len(self._ends())
+        if isinstance(i, slice):
+            return [self._line(j) for j in range(*i.indices(n))]
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('line index out of range')
+        return self._line(i)
+
+    def __reversed__(self):
+        """
+        Iterate over the lines, last first, with whitespace stripped.
+        """
+        for i in range(len(self._ends()) - 1, -1, -1):
+            yield self._line(i)
+
     def __iter__(self):
         """
         Iterate over the command results split by lines with whitespace
@@ -93,7 +185,7 @@ class CommandResult(object):
 
         :param strip: bool - Strip whitespace for each line
         """
-        return iter(self.all(strip))
+        return (self._line(i, strip) for i in range(len(self._ends())))
 
     def first(self, strip=True):
         """
@@ -106,12 +198,7 @@ class CommandResult(object):
             2
                
         """
-        try:
-            s = next(self.iter(strip=strip))
-        except StopIteration:
-            s = ''
-
-        s = _AttributeString(s)
+        s = _AttributeString(self._line(0, strip) if len(self) else '')
         s.return_code = s.code = self.return_code
         return s
 
@@ -126,10 +213,7 @@ class CommandResult(object):
             2
 
         """
-        line = ''
-        for line in self.iter(strip=strip):
-            pass
-        s = _AttributeString(line)
+        s = _AttributeString(self._line(len(self) - 1, strip) if len(self) else '')
         s.return_code = s.code = self.return_code
         return s
 
@@ -143,20 +227,204 @@ class CommandResult(object):
         else:
             return self.stdout.splitlines(keepends=True)
 
+    def columns(self, sep=None, header=True):
+        """
+        Iterate over the output split into columns, see `clom.streams.columns`.
+
+        ::
+
+            >>> r = CommandResult(0, 'NAME SIZE\\nroot 4096\\n')
+            >>> [row['SIZE'] for row in r.columns()]
+            ['4096']
+
+        """
+        return streams.columns(streams.split((self._stdout,)), sep=sep, header=header)
+
+    def jsonl(self):
+        """
+        Iterate over the output decoded as one JSON value per line.
+
+        ::
+
+            >>> list(CommandResult(0, '{"id": 1}\\n{"id": 2}\\n').jsonl())
+            [{'id': 1}, {'id': 2}]
+
+        """
+        return streams.jsonl(streams.split((self._stdout,)))
+
+    def split0(self):
+        """
+        Iterate over NUL separated output, such as from `find -print0`.
+
+        ::
+
+            >>> list(CommandResult(0, 'a b\\0c\\0').split0())
+            ['a b', 'c']
+
+        """
+        return streams.split((self._stdout,), '\0')
+
+    def records(self, regex):
+        """
+        Iterate over the fields `regex` picks out of each line, see `clom.streams.records`.
+        """
+        return streams.records(streams.split((self._stdout,)), regex)
+
+    def _state(self):
+        state = vars(self).copy()
+        # The line index is a cache, not part of the result
+        state.pop('_line_ends', None)
+        return state
+
     def __eq__(self, other):
         if isinstance(other, string_types):
             return other == str(self)
         elif isinstance(other, CommandResult):
-            return vars(other) == vars(self)
+            return self._state() == other._state()
         else:
             return NotImplemented
 
+class StepResult(object):
+    """
+    The outcome of one operation evaluated as part of an `AND` or `OR`.
+    """
+    def __init__(self, operation, result, duration, direct):
+        self.operation = operation
+        #: `CommandResult` or `CommandError`
+        self.result = result
+        #: Seconds the operation took
+        self.duration = duration
+        #: `True` if the operation was executed directly instead of through `sh`
+        self.direct = direct
+
+    @property
+    def return_code(self):
+        return self.result.return_code
+
+    def __repr__(self):
+        return '<StepResult %r return_code=%s duration=%.3fs>' % (
+            _describe(self.operation), self.return_code, self.duration)
+
+
+class ConjunctionResult(CommandResult):
+    """
+    The result of evaluating an `AND` or `OR` in Python.
+
+    Output is the output of every step that ran, in order, the same as the shell
+    would produce. The individual steps are available as `steps`::
+
+        >>> from clom import AND
+        >>> r = AND(clom.echo('foo'), clom.echo('bar')).shell()
+        >>> r.all()
+        ['foo', 'bar']
+        >>> [s.return_code for s in r.steps]
+        [0, 0]
+
+    """
+    def __init__(self, return_code, stdout='', stderr='', steps=None):
+        super(ConjunctionResult, self).__init__(return_code, stdout, stderr)
+        #: List of `StepResult` for each operation that ran
+        self.steps = steps or []
+
+    @property
+    def duration(self):
+        """
+        Total seconds spent running the steps.
+        """
+        return sum(step.duration for step in self.steps)
+
+
+def _describe(operation):
+    """
+    The operation as a string for messages, even if it has Python stages and can't be rendered.
+    """
+    try:
+        return str(operation)
+    except ValueError:
+        if operation._has_python_stages():
+            return repr(operation)
+        # A conjunction of operations with Python stages
+        return '( %s )' % (' %s ' % operation.operator).join(_describe(c) for c in operation.commands)
+
+
+def _uses_builtins(operation):
+    """
+    Does `operation` run a shell builtin, whose effects such as a changed
+    directory or exported variable the steps after it could depend on.
+    """
+    from clom.command import BaseConjunction, Command
+    if isinstance(operation, BaseConjunction):
+        return any(_uses_builtins(c) for c in operation.commands)
+    return isinstance(operation, Command) and operation._is_builtin()
+
+
+def _has_builtin_variant(operation):
+    """
+    Does `operation` run a program the shell has a differently behaving builtin for.
+
+    These are run through the shell even when they could be executed directly, so
+    they do the same as the rendered command.
+    """
+    from clom.command import Command
+    from clom.resolver import SHELL_BUILTIN_VARIANTS
+    if not isinstance(operation, Command):
+        return False
+    while operation._parent is not None:
+        operation = operation._parent
+    return operation.name in SHELL_BUILTIN_VARIANTS
+
+
+def _resolve_executables(operation):
+    """
+    Resolve the programs of `operation`'s pipeline with their clom's resolver, if
+    it has one, so a missing one is reported before anything is started.
+
+    The steps of `AND` / `OR` aren't checked, a missing one is a failed step.
+
+    :raises: `clom.resolver.ExecutableNotFound`
+    """
+    from clom.command import Command
+    for stage in operation._stages() if operation._pipe_to else [operation]:
+        if isinstance(stage, Command):
+            while stage._parent is not None:
+                stage = stage._parent
+            resolver = getattr(stage._clom, '_resolver', None)
+            if resolver is not None and isinstance(stage.name, string_types):
+                resolver.resolve(stage.name)
+
+
+def _is_native_conjunction(operation):
+    """
+    Can `operation` be evaluated as an `AND` / `OR` without a shell.
+
+    Conjunctions using builtins run in one shell so the steps share its state.
+    """
+    from clom.command import BaseConjunction
+    return isinstance(operation, BaseConjunction) and not (
+        operation._pipe_to or operation._redirects or operation._env or operation._background
+        or operation._priority or _uses_builtins(operation)
+    )
+
+
 class Shell(object):
     """
     Easily run `Command`s on the system's shell.
     """
-    def __init__(self, cmd):
+    def __init__(self, cmd, sinks=None, spawner=None):
         self._command = cmd
+        # (stdout sinks, stderr sinks) to send output to instead of capturing it
+        self._sinks = sinks
+        self._spawner = spawner
+
+    @property
+    def backend(self):
+        """
+        The `clom.backend.Backend` commands are run with.
+        """
+        backend = self._command._backend or get_default_backend()
+        if self._spawner is not None:
+            backend = backend.with_spawner(self._spawner)
+        return backend
 
     def __call__(self, *args, **kwargs):
         r"""
@@ -178,21 +446,310 @@ class Shell(object):
             # Force command to not capture since it's backgrounding
             return self.execute(*args, **kwargs)
 
-        cmd = self._command.as_string(*args, **kwargs)
-        log.info('Executing command: %s' % cmd)
+        if self._sinks is not None:
+            return self._run_with_sinks(self._operation(args, kwargs))
+
+        if not args and not kwargs and _is_native_conjunction(self._command):
+            return self._evaluate(self._command)
 
-        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (stdout, stderr) = p.communicate()
-        if self._command._encoding:
-            stdout = stdout.decode(self._command._encoding)
-            stderr = stderr.decode(self._command._encoding)
-        status = p.returncode
+        if self._command._has_python_stages():
+            operation = self._operation(args, kwargs)
+            cmd = repr(operation)
+            log.info('Executing pipeline: %s' % cmd)
+            status, stdout, stderr = self._run_pipeline(operation, self.backend)
+        else:
+            operation = self._operation(args, kwargs)
+            cmd, env, backend = self._prepare(operation, self.backend)
+            log.info('Executing command: %s' % cmd)
+            status, stdout, stderr = backend.run(cmd, encoding=operation._encoding, env=env)
+            if status != 0 and (env is not None or operation._priority is not None):
+                cmd = str(operation)
 
         if status == 0:
             return CommandResult(status, stdout, stderr)
         else:
             raise CommandError(status, stdout, stderr, 'Error while executing "%s" (%s):\n%s' % (cmd, status, stderr or stdout))
 
+    def with_sinks(self, stdout=(), stderr=()):
+        r"""
+        A `Shell` that sends the command's output to sinks as it's read instead of capturing it.
+
+        Each chunk is read once and given to every sink for its stream, so output
+        can be logged, counted and parsed at the same time without being held in
+        memory. The `CommandResult` of running it has no output.
+
+        :param stdout: List of `clom.sinks.Sink` for stdout
+        :param stderr: List of `clom.sinks.Sink` for stderr
+        :returns: Shell
+
+        ::
+
+            >>> from clom.sinks import Counter
+            >>> lines, errors = Counter(), Counter()
+            >>> shell = clom.sh(c='echo out; echo err >&2').shell.with_sinks(stdout=[lines], stderr=[errors])
+            >>> shell().return_code
+            0
+            >>> lines.lines, errors.lines
+            (1, 1)
+
+        """
+        return Shell(self._command, sinks=(list(stdout), list(stderr)), spawner=self._spawner)
+
+    def with_spawner(self, spawner):
+        """
+        A `Shell` that starts processes with `spawner`.
+
+        :param spawner: `clom.spawn.Spawner`
+        :returns: Shell
+
+        ::
+
+            >>> from clom.spawn import PosixSpawner
+            >>> str(clom.echo('foo').shell.with_spawner(PosixSpawner())())
+            'foo'
+
+        """
+        return Shell(self._command, sinks=self._sinks, spawner=spawner)
+
+    def _run_with_sinks(self, operation):
+        """
+        Run `operation`, sending its output to this shell's sinks.
+
+        :raises: CommandError
+        :returns: CommandResult
+        """
+        from clom.sinks import _pump
+        backend = self.backend
+        encoding = operation._encoding
+        stdout_sinks, stderr_sinks = self._sinks
+        cmd = _describe(operation)
+        python = operation._has_python_stages()
+        env = None
+        if not python:
+            # Run the same way as `__call__`, with the environment and priority applied natively
+            run, env, backend = self._prepare(operation, backend)
+        kwargs = {} if env is None else {'env': env}
+        log.info('Executing command (output to sinks): %s' % cmd)
+
+        # Only sinks that opened are closed, if one fails to open the command isn't run
+        opened = []
+        try:
+            for sink in stdout_sinks + stderr_sinks:
+                sink.open(encoding)
+                opened.append(sink)
+
+            r, w = os.pipe()
+            errors = os.fdopen(r, 'rb')
+            try:
+                with os.fdopen(w, 'wb') as errors_w:
+                    if python:
+                        from clom.pipeline import Pipeline
+                        p = Pipeline(operation, backend, stdout=subprocess.PIPE, stderr=errors_w, encoding=encoding)
+                    else:
+                        p = backend.popen(run, stdout=subprocess.PIPE, stderr=errors_w, **kwargs)
+            except NotImplementedError:
+                # The backend doesn't start processes, give the sinks all the output at once
+                errors.close()
+                status, stdout, stderr = backend.run(run, encoding=encoding, **kwargs)
+                for output, output_sinks in ((stdout, stdout_sinks), (stderr, stderr_sinks)):
+                    if encoding:
+                        output = output.encode(encoding)
+                    if output:
+                        for sink in output_sinks:
+                            sink.write(output)
+            else:
+                failed = []
+
+                def pump_errors():
+                    try:
+                        _pump(errors, stderr_sinks)
+                    except Exception as e:
+                        failed.append(e)
+                    finally:
+                        errors.close()
+
+                t = threading.Thread(target=pump_errors, name='clom-sinks-stderr')
+                t.daemon = True
+                t.start()
+                try:
+                    _pump(p.stdout, stdout_sinks)
+                except Exception:
+                    p.kill()
+                    raise
+                finally:
+                    p.stdout.close()
+                    status = p.wait()
+                    t.join()
+                if failed:
+                    raise failed[0]
+        finally:
+            for sink in opened:
+                sink.close()
+
+        if status == 0:
+            return CommandResult(status, '', '')
+        raise CommandError(status, '', '', 'Error while executing "%s" (%s): Output sent to sinks.' % (cmd, status))
+
+    def _prepare(self, operation, backend, direct=False):
+        """
+        How to run `operation` with `backend`.
+
+        With a `clom.resolver.Resolver`, the programs it runs are looked up first so
+        a missing one raises `ExecutableNotFound` without starting a process.
+
+        Backends that run commands locally get the operation's environment variables
+        merged into a cached copy of this process's environment instead of an `env`
+        prefix, saving an exec of `env` for every command. Its priority is applied
+        as the process starts instead of with `nice`, `ionice` and `taskset`.
+
+        :param direct: Use an argument list instead of a string if the operation allows it,
+                       and it doesn't run a program the shell has a different builtin for
+        :raises: `clom.resolver.ExecutableNotFound`
+        :returns: tuple - `(command string or argument list, environment or None, backend to run it with)`
+        """
+        _resolve_executables(operation)
+        env = None
+        if backend.direct:
+            operation, priority = operation._without_priority()
+            if priority is not None:
+                backend = backend.with_spawner(PrioritySpawner(priority, backend.spawner))
+            operation, variables = operation._without_env()
+            if variables is not None:
+                env = merged_environ(variables)
+            if direct and not _has_builtin_variant(operation):
+                argv = operation._argv()
+                if argv is not None:
+                    return argv, env, backend
+        return str(operation), env, backend
+
+    def hedged(self, after=None, max_copies=2, percentile=95, default_after=1.0):
+        """
+        Execute the command, starting another copy of it if it hasn't finished in
+        time, and take whichever copy succeeds first.
+
+        Cuts the tail latency of commands that occasionally hang, such as reads
+        from a flaky NFS mount. Only use it for commands that are safe to run more
+        than once at the same time. Each copy runs in its own process group, and
+        the groups of the copies that lose are killed.
+
+        :param after: Seconds to wait before starting another copy. `None` uses
+                      `percentile` of the durations of this command's recent runs.
+        :param max_copies: Most copies to run, including the first
+        :param percentile: Percentile of recent durations to wait for when `after` is `None`
+        :param default_after: Seconds to wait when `after` is `None` and there aren't
+                              enough recent runs to learn from
+        :raises: CommandError - If every copy failed
+        :returns: `clom.hedge.HedgedResult`
+
+        ::
+
+            >>> r = clom.cat('/proc/loadavg').shell.hedged(after=0.5)     # doctest: +SKIP
+            >>> r.attempt, r.attempts     # doctest: +SKIP
+            (1, 2)
+
+        """
+        from clom.hedge import run_hedged
+        return run_hedged(self, after=after, max_copies=max_copies, percentile=percentile,
+                          default_after=default_after)
+
+    def _operation(self, args, kwargs):
+        """
+        The command with `args` and `kwargs` added, the same way `Command.as_string` adds them.
+        """
+        if not args and not kwargs:
+            return self._command
+        operation = self._command._clone()
+        operation._kwopts.update(kwargs)
+        operation._args.extend(args)
+        return operation
+
+    def _run_pipeline(self, operation, backend, capture=True):
+        """
+        Run an operation that pipes to Python stages.
+
+        :returns: tuple - `(status, stdout, stderr)`
+        """
+        from clom.pipeline import Pipeline
+        encoding = operation._encoding
+        if not capture:
+            return Pipeline(operation, backend, encoding=encoding).wait(), '', ''
+
+        errfile = tempfile.TemporaryFile()
+        try:
+            p = Pipeline(operation, backend, stdout=subprocess.PIPE, stderr=errfile, encoding=encoding)
+            stdout, _ = p.communicate()
+            errfile.seek(0)
+            stderr = errfile.read()
+        finally:
+            errfile.close()
+
+        if encoding:
+            stdout = stdout.decode(encoding)
+            stderr = stderr.decode(encoding)
+        return p.returncode, stdout, stderr
+
+    def _evaluate(self, conjunction):
+        """
+        Evaluate an `AND` / `OR` in Python, short-circuiting like the shell.
+
+        Each operation that can be is executed directly if the backend allows it,
+        saving the subshell and the `sh -c` the rendered string would need.
+
+        :raises: CommandError
+        :returns: ConjunctionResult
+        """
+        from clom.resolver import ExecutableNotFound
+        log.info('Evaluating: %s' % _describe(conjunction))
+        steps = []
+        status = 0
+        for i, operation in enumerate(conjunction.commands):
+            if i and (status == 0) != (conjunction.operator == '&&'):
+                break
+
+            started = time.time()
+            if _is_native_conjunction(operation):
+                try:
+                    result = self._evaluate(operation)
+                except CommandError as e:
+                    result = e
+                direct = all(step.direct for step in result.steps)
+            else:
+                backend = operation._backend or self.backend
+                if operation._has_python_stages():
+                    direct = False
+                    name = repr(operation)
+                    status, stdout, stderr = self._run_pipeline(operation, backend)
+                else:
+                    name = None
+                    try:
+                        cmd, env, backend = self._prepare(operation, backend, direct=True)
+                    except ExecutableNotFound as e:
+                        # A failed step, like the shell's 127, the next ones may not need it
+                        direct = True
+                        status, stdout, stderr = e.return_code, '', e.stderr
+                    else:
+                        direct = not isinstance(cmd, string_types)
+                        status, stdout, stderr = backend.run(cmd, encoding=operation._encoding, env=env)
+                if status == 0:
+                    result = CommandResult(status, stdout, stderr)
+                else:
+                    name = name or str(operation)
+                    result = CommandError(status, stdout, stderr, 'Error while executing "%s" (%s):\n%s' % (
+                        name, status, stderr or stdout))
+
+            steps.append(StepResult(operation, result, time.time() - started, direct))
+            status = result.return_code
+
+        stdout = ''.join(step.result.stdout for step in steps)
+        stderr = ''.join(step.result.stderr for step in steps)
+        if status == 0:
+            return ConjunctionResult(status, stdout, stderr, steps)
+        else:
+            error = CommandError(status, stdout, stderr, 'Error while executing "%s" (%s):\n%s' % (
+                _describe(conjunction), status, stderr or stdout))
+            error.steps = steps
+            raise error
+
     def first(self, *args, **kwargs):
         """
         Executes the command and returns the first line.
@@ -246,6 +803,132 @@ class Shell(object):
         """
         return self(*args, **kwargs).iter()
 
+    def _chunks(self, operation):
+        """
+        Run `operation` and yield its output as it's read.
+
+        stderr goes to a temporary file so a chatty command can't block on a full pipe.
+
+        :raises: CommandError - After the last chunk, if the command failed
+        """
+        backend = self.backend
+        encoding = operation._encoding
+        python = operation._has_python_stages()
+        cmd = repr(operation) if python else str(operation)
+        env = None
+        if not python:
+            # Run the same way as `__call__`, with the environment and priority applied natively
+            run, env, backend = self._prepare(operation, backend)
+        log.info('Streaming command: %s' % cmd)
+        kwargs = {} if env is None else {'env': env}
+
+        errfile = tempfile.TemporaryFile()
+        try:
+            try:
+                if python:
+                    from clom.pipeline import Pipeline
+                    p = Pipeline(operation, backend, stdout=subprocess.PIPE, stderr=errfile, encoding=encoding)
+                else:
+                    p = backend.popen(run, stdout=subprocess.PIPE, stderr=errfile, **kwargs)
+            except NotImplementedError:
+                # The backend doesn't start processes, so there's nothing to stream
+                status, stdout, stderr = backend.run(run, encoding=encoding, **kwargs)
+                if stdout:
+                    yield stdout
+            else:
+                decoder = codecs.getincrementaldecoder(encoding)('replace') if encoding else None
+                try:
+                    fd = p.stdout.fileno()
+                    while True:
+                        chunk = os.read(fd, 65536)
+                        if not chunk:
+                            break
+                        if decoder:
+                            chunk = decoder.decode(chunk)
+                        if chunk:
+                            yield chunk
+                    if decoder:
+                        chunk = decoder.decode(b'', final=True)
+                        if chunk:
+                            yield chunk
+                finally:
+                    p.stdout.close()
+                    if p.poll() is None:
+                        # Stopped early, the rest of the output isn't wanted
+                        p.kill()
+                    status = p.wait()
+
+                errfile.seek(0)
+                stderr = errfile.read()
+                if encoding:
+                    stderr = stderr.decode(encoding)
+        finally:
+            errfile.close()
+
+        if status != 0:
+            raise CommandError(status, '', stderr, 'Error while executing "%s" (%s):\n%s' % (cmd, status, stderr))
+
+    def stream(self, *args, **kwargs):
+        r"""
+        Execute the command and yield each line of its output as it's produced,
+        without holding the whole output in memory.
+
+        Lines have the line ending removed. Stopping early kills the command.
+
+        :raises: CommandError - After the last line, if the command failed
+
+        ::
+
+            >>> list(clom.printf.shell.stream('a\nb\n'))
+            ['a', 'b']
+
+        """
+        return streams.split(self._chunks(self._operation(args, kwargs)))
+
+    def columns(self, sep=None, header=True):
+        """
+        Execute the command and yield its output split into columns as it's produced.
+
+        See `clom.streams.columns`.
+
+        ::
+
+            >>> [row['PID'] for row in clom.ps.shell.columns()]     # doctest: +SKIP
+            ['1', '2', ...]
+
+        """
+        return streams.columns(self.stream(), sep=sep, header=header)
+
+    def jsonl(self, *args, **kwargs):
+        """
+        Execute the command and yield each line of its output decoded as JSON as it's produced.
+
+        Arguments are added to the command, like `stream`.
+        """
+        return streams.jsonl(self.stream(*args, **kwargs))
+
+    def split0(self, *args, **kwargs):
+        """
+        Execute the command and yield each NUL separated item of its output as it's produced.
+
+        Arguments are added to the command, like `stream`.
+
+        ::
+
+            >>> list(clom.printf(r'a b\\0c\\0').shell.split0())
+            ['a b', 'c']
+
+        """
+        return streams.split(self._chunks(self._operation(args, kwargs)), '\0')
+
+    def records(self, regex):
+        """
+        Execute the command and yield the fields `regex` picks out of each line as it's produced.
+
+        See `clom.streams.records`.
+        """
+        return streams.records(self.stream(), regex)
+
     def execute(self, *args, **kwargs):
         """
         Execute the command on the shell without capturing output.
@@ -255,14 +938,44 @@ class Shell(object):
         :raises: CommandError
         :returns: CommandResult
         """
-        cmd = self._command.as_string(*args, **kwargs)
-        log.info('Executing command (capture off): %s' % cmd)
-
-        p = subprocess.Popen(cmd, shell=True, stdout=None, stderr=None)
-        p.communicate()
-        status = p.returncode
+        if self._command._has_python_stages():
+            operation = self._operation(args, kwargs)
+            cmd = repr(operation)
+            log.info('Executing pipeline (capture off): %s' % cmd)
+            status, _, _ = self._run_pipeline(operation, self.backend, capture=False)
+        else:
+            operation = self._operation(args, kwargs)
+            run, env, backend = self._prepare(operation, self.backend)
+            cmd = str(operation)
+            log.info('Executing command (capture off): %s' % cmd)
+            status, _, _ = backend.run(run, capture=False, env=env)
 
         if status == 0:
             return CommandResult(status, '', '')
         else:
             raise CommandError(status, '', '', 'Error while executing "%s" (%s): Error not captured, see console.' % (cmd, status))
+
+    def spawn(self, stdout=None, stderr=None):
+        """
+        Start the command in the background and return a handle to it.
+
+        Unlike `Operation.background`, the command is not wrapped in `nohup ... &` so
+        its process id is known and it can be polled, waited on, or killed.
+
+        :param stdout: Filename to capture stdout to, `None` discards it
+        :param stderr: Filename to capture stderr to, `None` discards it
+        :returns: `clom.jobs.JobHandle`
+
+        ::
+
+            >>> job = clom.sleep(10).shell.spawn()
+            >>> job.kill()
+            True
+            >>> job.wait()      # doctest:+IGNORE_EXCEPTION_DETAIL
+            Traceback (most recent call last):
+                ...
+            CommandError: Error while executing "sleep 10" (-15):
+
+        """
+        from clom.jobs import JobHandle
+        return JobHandle(self._command, stdout=stdout, stderr=stderr, encoding=self._command._encoding)
@@ -0,0 +1,389 @@
+import itertools
+import os
+import re
+import selectors
+import signal
+import subprocess
+import threading
+import uuid
+import logging
+
+from clom import arg
+from clom._pool import imap_unordered
+from clom.backend import get_default_backend
+from clom.shell import CommandError, CommandResult
+from clom.spawn import UNKNOWN_STATUS
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'ShellWorker',
+    'ShellPool',
+]
+
+_is_name = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$').match
+
+
+def _tail(chunks, n):
+    """
+    At least the last `n` bytes of `chunks`.
+    """
+    tail = []
+    size = 0
+    for chunk in reversed(chunks):
+        tail.append(chunk)
+        size += len(chunk)
+        if size >= n:
+            break
+    return b''.join(reversed(tail))
+
+
+def _exit_status(process):
+    """
+    Status to report for an operation whose shell exited under it, the shell's own
+    if it has one that isn't a success, otherwise `UNKNOWN_STATUS`.
+    """
+    status = process.poll()
+    if not status:
+        try:
+            status = process.wait(timeout=0.1)
+        except subprocess.TimeoutExpired:
+            status = None
+    return status or UNKNOWN_STATUS
+
+
+class ShellWorker(object):
+    """
+    A shell kept running to execute operations one after another, see `ShellPool`.
+
+    Operations are written to the shell's stdin followed by the same marker lines
+    `clom.batch.Batch` uses, and their output is read back up to the markers.
+    Each operation runs in a subshell so `cd`, `exit`, variable assignments and so
+    on don't leak into the next one.
+    """
+
+    #: Shell kept running
+    shell = '/bin/sh'
+
+    def __init__(self, backend=None):
+        """
+        :param backend: `clom.backend.Backend` to start the shell with, defaults to the default backend
+        """
+        self.backend = backend or get_default_backend()
+        #: Operations run by the current shell process
+        self.commands = 0
+        self._process = None
+        self._marker = None
+        self._start()
+
+    def __repr__(self):
+        return '<ShellWorker pid=%s commands=%s>' % (self.pid, self.commands)
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else None
+
+    def _start(self):
+        self._marker = '__clom_worker_%s' % uuid.uuid4().hex
+        self._process = self.backend.popen(
+            [self.shell, '-s'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, start_new_session=True,
+        )
+        self.commands = 0
+        log.debug('Started %r' % self)
+
+    def restart(self):
+        """
+        Replace the shell process with a new one.
+        """
+        self.close()
+        self._start()
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def check(self):
+        """
+        Is the shell running and answering.
+        """
+        if not self.is_alive():
+            return False
+        try:
+            return self.execute(':')[0] == 0
+        except (IOError, OSError, CommandError):
+            return False
+
+    def script(self, cmd, cwd=None, env=None):
+        """
+        Render the lines that run `cmd` and write the markers after it.
+        """
+        setup = []
+        if cwd is not None:
+            setup.append('cd %s || exit' % arg.LiteralArg(cwd))
+        for name, value in sorted((env or {}).items()):
+            if not _is_name(name):
+                raise ValueError('Invalid environment variable name %r' % (name,))
+            setup.append('%s=%s; export %s' % (name, arg.LiteralArg(value), name))
+        setup.append(cmd)
+        return '(\n%s\n) </dev/null\n%s\n%s\n' % (
+            '\n'.join(setup),
+            "printf '\\n%%s %%d\\n' %s $?" % self._marker,
+            "printf '\\n%%s\\n' %s >&2" % self._marker,
+        )
+
+    def execute(self, cmd, cwd=None, env=None):
+        """
+        Run a command string in the shell.
+
+        :param cwd: Directory to run it in
+        :param env: dict - Environment variables to export for it
+        :raises: CommandError - If the shell exited before the command finished
+        :returns: tuple - `(return code, stdout bytes, stderr bytes)`
+        """
+        p = self._process
+        try:
+            p.stdin.write(self.script(cmd, cwd, env).encode('UTF-8'))
+            p.stdin.flush()
+        except (IOError, OSError):
+            raise CommandError(_exit_status(p), b'', b'', 'Shell worker exited before executing "%s"' % cmd)
+        self.commands += 1
+
+        marker = self._marker.encode('ascii')
+        out_end = re.compile(b'\n' + marker + b' (\\d+)\n\\Z')
+        err_end = b'\n' + marker + b'\n'
+        out = []
+        err = []
+        status = None
+        open_ = 2
+
+        with selectors.DefaultSelector() as selector:
+            selector.register(p.stdout, selectors.EVENT_READ, (out, True))
+            selector.register(p.stderr, selectors.EVENT_READ, (err, False))
+            while open_:
+                for key, _ in selector.select():
+                    chunks, is_out = key.data
+                    data = os.read(key.fileobj.fileno(), 65536)
+                    if not data:
+                        # The shell is gone
+                        raise CommandError(_exit_status(p), b''.join(out), b''.join(err),
+                                           'Shell worker exited while executing "%s"' % cmd)
+                    chunks.append(data)
+                    if is_out:
+                        # Markers can be split across reads, only check the end
+                        match = out_end.search(_tail(out, len(marker) + 24))
+                        if match:
+                            status = int(match.group(1))
+                            out[:] = [b''.join(out)[:-len(match.group(0))]]
+                            selector.unregister(p.stdout)
+                            open_ -= 1
+                    elif _tail(err, len(err_end)).endswith(err_end):
+                        err[:] = [b''.join(err)[:-len(err_end)]]
+                        selector.unregister(p.stderr)
+                        open_ -= 1
+
+        return status, b''.join(out), b''.join(err)
+
+    def run(self, operation, cwd=None, env=None):
+        """
+        Run an operation in the shell.
+
+        :returns: `CommandResult`, or `CommandError` if it failed
+        """
+        status, stdout, stderr = self.execute(str(operation), cwd, env)
+        encoding = operation._encoding
+        if encoding:
+            stdout = stdout.decode(encoding)
+            stderr = stderr.decode(encoding)
+        if status == 0:
+            return CommandResult(status, stdout, stderr)
+        return CommandError(status, stdout, stderr, 'Error while executing "%s" (%s):\n%s' % (
+            operation, status, stderr or stdout))
+
+    def close(self):
+        """
+        Stop the shell, and anything it started that is still running.
+        """
+        p = self._process
+        if p is None:
+            return
+        self._process = None
+        try:
+            p.stdin.close()
+        except (IOError, OSError):
+            pass
+        try:
+            p.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            p.wait()
+        for f in (p.stdout, p.stderr):
+            f.close()
+
+
+class ShellPool(object):
+    """
+    Shells started ahead of time that operations are handed to, so bursts of small
+    commands run in parallel without starting a shell for each one.
+
+    A worker is health checked before it is given an operation and replaced if
+    it has exited, and recycled after `max_commands` operations. Each operation
+    runs in its own subshell with its own `cwd` and `env`, so nothing one
+    operation does carries over to the next.
+
+    ::
+
+        >>> with ShellPool(size=2) as pool:
+        ...     str(pool.run(clom.pwd, cwd='/'))
+        ...     [str(r) for r in pool.map([clom.echo(i) for i in range(3)])]
+        '/'
+        ['0', '1', '2']
+
+    """
+    #: How workers are chosen
+    strategies = ('least_loaded', 'round_robin')
+
+    def __init__(self, size=4, max_commands=1000, strategy='least_loaded', backend=None):
+        """
+        :param size: Number of shells
+        :param max_commands: Operations a shell runs before it is replaced, `None` for no limit
+        :param strategy: `'least_loaded'` gives operations to the worker with the fewest
+                         waiting, `'round_robin'` to each worker in turn
+        :param backend: `clom.backend.Backend` that starts the shells, defaults to the default
+                        backend. Operations are rendered as strings and run by the
+                        shells, their own backends are not used.
+        """
+        if strategy not in self.strategies:
+            raise ValueError('Unknown strategy %r, expected one of %r' % (strategy, self.strategies))
+        self.size = size
+        self.max_commands = max_commands
+        self.strategy = strategy
+        self.backend = backend or get_default_backend()
+
+        self._lock = threading.Lock()
+        self._workers = []
+        self._locks = []
+        self._pending = []
+        self._turns = itertools.cycle(range(size))
+        try:
+            for _ in range(size):
+                self._workers.append(ShellWorker(self.backend))
+                self._locks.append(threading.Lock())
+                self._pending.append(0)
+        except Exception:
+            # Don't leave the shells that did start running
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+            raise
+
+    def __repr__(self):
+        return '<ShellPool size=%s strategy=%s>' % (self.size, self.strategy)
+
+    def _choose(self):
+        with self._lock:
+            if not self._workers:
+                raise RuntimeError('%r is closed' % self)
+            if self.strategy == 'round_robin':
+                index = next(self._turns)
+            else:
+                index = min(range(self.size), key=self._pending.__getitem__)
+            self._pending[index] += 1
+            return index
+
+    def _worker(self, index):
+        """
+        The worker at `index`, restarted if it has exited or run too many operations.
+        Called holding its lock.
+        """
+        worker = self._workers[index]
+        if not worker.is_alive():
+            log.warning('Replacing exited %r' % worker)
+            worker.restart()
+        elif self.max_commands is not None and worker.commands >= self.max_commands:
+            log.debug('Recycling %r' % worker)
+            worker.restart()
+        return worker
+
+    def run(self, operation, cwd=None, env=None):
+        """
+        Run an operation in one of the shells.
+
+        :param cwd: Directory to run it in
+        :param env: dict - Environment variables to export for it
+        :raises: CommandError - If the operation failed
+        :returns: `CommandResult`
+        """
+        result = self._run(operation, cwd, env)
+        if isinstance(result, CommandError):
+            raise result
+        return result
+
+    def _run(self, operation, cwd=None, env=None):
+        index = self._choose()
+        try:
+            with self._locks[index]:
+                worker = self._worker(index)
+                try:
+                    return worker.run(operation, cwd, env)
+                except CommandError:
+                    # The shell died, don't give it anything else
+                    worker.close()
+                    raise
+        finally:
+            with self._lock:
+                self._pending[index] -= 1
+
+    def map(self, operations, cwd=None, env=None):
+        """
+        Run operations in all the shells at once and return their results in the same order.
+
+        :returns: list - `CommandResult` or `CommandError` for each operation
+        """
+        operations = list(operations)
+
+        def run(index):
+            try:
+                return self._run(operations[index], cwd, env)
+            except CommandError as e:
+                # The shell died, the other operations' results are still wanted
+                return e
+
+        results = [None] * len(operations)
+        for index, result in imap_unordered(run, range(len(operations)), self.size):
+            results[index] = result
+        return results
+
+    def check(self):
+        """
+        Health check every shell, replacing those that don't answer.
+
+        :returns: int - Number of shells replaced
+        """
+        replaced = 0
+        for index in range(len(self._workers)):
+            with self._locks[index]:
+                worker = self._workers[index]
+                if not worker.check():
+                    log.warning('Replacing unhealthy %r' % worker)
+                    worker.restart()
+                    replaced += 1
+        return replaced
+
+    def close(self):
+        """
+        Stop the shells.
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for index, worker in enumerate(workers):
+            with self._locks[index]:
+                worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
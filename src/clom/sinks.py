@@ -0,0 +1,145 @@
+import codecs
+import os
+
+__all__ = [
+    'Sink',
+    'FileSink',
+    'LineCallback',
+    'Counter',
+]
+
+
+class Sink(object):
+    """
+    Receives a command's output as it's read, see `Shell.with_sinks`.
+
+    Subclasses implement `write`, and `open` and `close` if they hold resources.
+    """
+    def open(self, encoding):
+        """
+        Called before the command starts.
+
+        :param encoding: Encoding of the command's output, or `None`
+        """
+
+    def write(self, data):
+        """
+        Called with each chunk of output, as bytes.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Called once the command finishes, even if it failed.
+        """
+
+
+class FileSink(Sink):
+    """
+    Writes output to a file, like `tee`.
+    """
+    def __init__(self, path, append=False):
+        """
+        :param path: File to write to
+        :param append: Append to the file instead of replacing it
+        """
+        self.path = path
+        self.append = append
+        self._file = None
+
+    def open(self, encoding):
+        self._file = open(self.path, 'ab' if self.append else 'wb')
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __repr__(self):
+        return '<FileSink %s>' % self.path
+
+
+class LineCallback(Sink):
+    """
+    Calls a function with each line of output, decoded and without the line ending.
+
+    ::
+
+        >>> seen = []
+        >>> clom.printf('a\\\\nb').shell.with_sinks(stdout=[LineCallback(seen.append)])()
+        <CommandResult return_code=0, stdout=0 bytes, stderr=0 bytes>
+        >>> seen
+        ['a', 'b']
+
+    """
+    def __init__(self, func):
+        self.func = func
+        self._decoder = None
+        self._pending = ''
+
+    def open(self, encoding):
+        self._decoder = codecs.getincrementaldecoder(encoding)('replace') if encoding else None
+        self._pending = '' if encoding else b''
+
+    def _feed(self, text):
+        if self._pending:
+            text = self._pending + text
+        lines = text.split('\n' if self._decoder else b'\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self.func(line)
+
+    def write(self, data):
+        self._feed(self._decoder.decode(data) if self._decoder else data)
+
+    def close(self):
+        if self._decoder:
+            self._feed(self._decoder.decode(b'', final=True))
+        if self._pending:
+            self.func(self._pending)
+        self._pending = self._pending[:0]
+
+
+class Counter(Sink):
+    """
+    Counts the bytes, lines and chunks of output without keeping it. Lines are
+    counted the same as `wc -l`, by their newlines.
+
+    ::
+
+        >>> count = Counter()
+        >>> clom.printf('a\\\\nbc\\\\n').shell.with_sinks(stdout=[count])()
+        <CommandResult return_code=0, stdout=0 bytes, stderr=0 bytes>
+        >>> count.bytes, count.lines
+        (5, 2)
+
+    """
+    def __init__(self):
+        self.bytes = self.lines = self.chunks = 0
+
+    def open(self, encoding):
+        self.bytes = self.lines = self.chunks = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        self.lines += data.count(b'\n')
+        self.chunks += 1
+
+    def __repr__(self):
+        return '<Counter bytes=%d lines=%d>' % (self.bytes, self.lines)
+
+
+def _pump(f, sinks, size=65536):
+    """
+    Read `f` to the end, giving each chunk to every sink.
+    """
+    fd = f.fileno()
+    while True:
+        chunk = os.read(fd, size)
+        if not chunk:
+            break
+        for sink in sinks:
+            sink.write(chunk)
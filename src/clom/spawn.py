@@ -0,0 +1,391 @@
+import errno
+import os
+import signal
+import subprocess
+import threading
+import time
+import logging
+
+from clom._compat import string_types
+
+log = logging.getLogger(__name__)
+
+__all__ = [
+    'Spawner',
+    'PopenSpawner',
+    'PosixSpawner',
+    'PrioritySpawner',
+    'get_default_spawner',
+]
+
+#: Shell used to run command strings
+SHELL = '/bin/sh'
+
+
+class Spawner(object):
+    """
+    Starts processes for a `clom.backend.Backend`.
+
+    Select one for a single shell with `Shell.with_spawner`, or for a backend with
+    `clom.backend.Backend.with_spawner`.
+    """
+    def spawn(self, cmd, **kwargs):
+        """
+        Start a process.
+
+        :param cmd: Command string to run with `sh`, or argument list to execute directly
+        :param kwargs: Keyword arguments of `subprocess.Popen`
+        :returns: `subprocess.Popen` or an object with the same interface
+        """
+        raise NotImplementedError()
+
+
+class PopenSpawner(Spawner):
+    """
+    Starts processes with `subprocess.Popen`.
+    """
+    def spawn(self, cmd, **kwargs):
+        return subprocess.Popen(cmd, shell=isinstance(cmd, string_types), **kwargs)
+
+    def __repr__(self):
+        return '<PopenSpawner>'
+
+
+#: Status reported for a process whose exit status was lost, like the shell's
+#: for a command it couldn't run
+UNKNOWN_STATUS = 255
+
+
+def _exit_status(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class SpawnedProcess(object):
+    """
+    A process started by `PosixSpawner`, with the parts of the `subprocess.Popen`
+    interface clom uses.
+    """
+    def __init__(self, args, pid, stdin=None, stdout=None, stderr=None):
+        self.args = args
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<SpawnedProcess pid=%s returncode=%s>' % (self.pid, self.returncode)
+
+    def _reap(self, options):
+        with self._lock:
+            if self.returncode is not None:
+                return self.returncode
+            try:
+                pid, status = os.waitpid(self.pid, options)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                # Reaped elsewhere, the status is lost and can't be assumed a success
+                log.warning('Exit status of process %s was lost, reporting %s' % (self.pid, UNKNOWN_STATUS))
+                self.returncode = UNKNOWN_STATUS
+            else:
+                if pid == self.pid:
+                    self.returncode = _exit_status(status)
+            return self.returncode
+
+    def poll(self):
+        return self._reap(os.WNOHANG)
+
+    def wait(self, timeout=None):
+        if timeout is None:
+            return self._reap(0)
+
+        deadline = time.time() + timeout
+        delay = 0.0005
+        while self.poll() is None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.poll() is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def communicate(self, input=None):
+        """
+        Write `input`, read stdout and stderr to the end and wait for the process.
+
+        :returns: tuple - `(stdout, stderr)`, `None` for streams that weren't piped
+        """
+        results = {}
+
+        def read(name, f):
+            try:
+                results[name] = f.read()
+            finally:
+                f.close()
+
+        readers = []
+        for name in ('stdout', 'stderr'):
+            f = getattr(self, name)
+            if f is not None:
+                t = threading.Thread(target=read, args=(name, f))
+                t.daemon = True
+                t.start()
+                readers.append(t)
+
+        if self.stdin is not None:
+            try:
+                if input:
+                    self.stdin.write(input)
+            except (IOError, OSError) as e:
+                if e.errno != errno.EPIPE:
+                    raise
+            finally:
+                try:
+                    self.stdin.close()
+                except (IOError, OSError):
+                    pass
+
+        for t in readers:
+            t.join()
+        self.wait()
+        return results.get('stdout'), results.get('stderr')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for f in (self.stdin, self.stdout, self.stderr):
+            if f is not None:
+                f.close()
+        self.wait()
+
+
+#: Signals Python ignores that `subprocess.Popen` restores the default handling of in children
+_RESTORED_SIGNALS = tuple(getattr(signal, name) for name in ('SIGPIPE', 'SIGXFZ', 'SIGXFSZ')
+                          if hasattr(signal, name))
+
+
+def _find_program(name, env):
+    """
+    The path of the program `name` on the `PATH` of `env`, the environment the
+    process gets, like `subprocess.Popen` and `execvpe` look it up.
+
+    :raises: OSError - `ENOENT` if there's no such program, `EACCES` if it isn't executable
+    """
+    if '/' in name:
+        return name
+    denied = False
+    for directory in os.get_exec_path(env):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            if os.access(path, os.X_OK):
+                return path
+            denied = True
+    code = errno.EACCES if denied else errno.ENOENT
+    raise OSError(code, os.strerror(code), name)
+
+
+def _inheritable_fds():
+    """
+    Descriptors above stderr a spawned process would inherit, or `None` if they can't be listed.
+    """
+    try:
+        fds = [int(fd) for fd in os.listdir('/dev/fd')]
+    except (OSError, ValueError):
+        return None
+    inheritable = []
+    for fd in fds:
+        if fd > 2:
+            try:
+                if os.get_inheritable(fd):
+                    inheritable.append(fd)
+            except OSError:
+                # The descriptor listdir had open
+                pass
+    return inheritable
+
+
+class PosixSpawner(Spawner):
+    """
+    Starts processes with `os.posix_spawn`, which doesn't copy the parent's page
+    tables the way `fork` does, so starting a process stays fast however much
+    memory the parent uses.
+
+    Pipes and redirects become the spawn's file actions, as does closing inherited
+    descriptors for `close_fds`, which defaults to true like `subprocess.Popen`.
+    Also like it, programs are looked up on the `PATH` of the environment the
+    process gets, and signals Python ignores, such as `SIGPIPE`, are restored.
+    Anything it can't do, such as `preexec_fn`, `cwd` or text mode, falls back to
+    `subprocess.Popen`, as does a Python without `os.posix_spawn`.
+
+    ::
+
+        >>> p = PosixSpawner().spawn(['echo', 'spawned'], stdout=subprocess.PIPE)
+        >>> p.communicate()
+        (b'spawned\\n', None)
+
+    """
+    #: `subprocess.Popen` keyword arguments this spawner handles itself
+    supported = frozenset(['stdin', 'stdout', 'stderr', 'env', 'close_fds', 'start_new_session'])
+
+    def __init__(self, fallback=None):
+        """
+        :param fallback: `Spawner` for processes `posix_spawn` can't start, defaults to `PopenSpawner`
+        """
+        self.fallback = fallback or PopenSpawner()
+
+    def __repr__(self):
+        return '<PosixSpawner>'
+
+    def can_spawn(self, kwargs):
+        """
+        Can a process with these `subprocess.Popen` keyword arguments be started with `posix_spawn`.
+        """
+        if not hasattr(os, 'posix_spawn'):
+            return False
+        return all(k in self.supported or not v for k, v in kwargs.items())
+
+    def spawn(self, cmd, **kwargs):
+        if not self.can_spawn(kwargs):
+            log.debug('Falling back to %r for %r' % (self.fallback, cmd))
+            return self.fallback.spawn(cmd, **kwargs)
+
+        if isinstance(cmd, string_types):
+            argv = [SHELL, '-c', cmd]
+        else:
+            argv = [str(a) for a in cmd]
+        env = kwargs.get('env')
+        if env is None:
+            env = os.environ
+        program = _find_program(argv[0], env)
+
+        # (parent end, child end) for each of stdin, stdout and stderr
+        ends = []
+        file_actions = []
+        to_close = []
+        try:
+            for fd, name in enumerate(('stdin', 'stdout', 'stderr')):
+                target = kwargs.get(name)
+                parent = None
+                if target is None:
+                    child = None
+                elif target == subprocess.PIPE:
+                    r, w = os.pipe()
+                    parent, child = (w, r) if fd == 0 else (r, w)
+                    to_close.append(child)
+                elif target == subprocess.DEVNULL:
+                    child = os.open(os.devnull, os.O_RDWR)
+                    to_close.append(child)
+                elif target == subprocess.STDOUT:
+                    child = 1 if ends[1][1] is None else ends[1][1]
+                elif isinstance(target, int):
+                    child = target
+                else:
+                    child = target.fileno()
+                ends.append((parent, child))
+                if child is not None and child != fd:
+                    file_actions.append((os.POSIX_SPAWN_DUP2, child, fd))
+
+            if kwargs.get('close_fds', True):
+                inheritable = _inheritable_fds()
+                if inheritable is None:
+                    log.debug('Falling back to %r to close descriptors for %r' % (self.fallback, cmd))
+                    for parent, _ in ends:
+                        if parent is not None:
+                            os.close(parent)
+                    return self.fallback.spawn(cmd, **kwargs)
+                # After the dup2s, so a descriptor can be closed once it's been moved into place
+                file_actions.extend((os.POSIX_SPAWN_CLOSE, fd) for fd in inheritable)
+
+            try:
+                pid = os.posix_spawn(program, argv, env, file_actions=file_actions,
+                                     setsigdef=_RESTORED_SIGNALS,
+                                     setsid=bool(kwargs.get('start_new_session')))
+            except Exception:
+                for parent, _ in ends:
+                    if parent is not None:
+                        os.close(parent)
+                raise
+        finally:
+            for fd in to_close:
+                os.close(fd)
+
+        files = []
+        for fd, (parent, _) in enumerate(ends):
+            files.append(None if parent is None else os.fdopen(parent, 'wb' if fd == 0 else 'rb'))
+        return SpawnedProcess(cmd, pid, *files)
+
+
+class PrioritySpawner(Spawner):
+    """
+    Starts processes with another spawner, applying a `clom.priority.Priority`
+    to them as they start. Used by `Shell` for `Operation.with_priority`.
+
+    It needs `preexec_fn`, so `PosixSpawner` and `clom.forkserver.SpawnServer`
+    fall back to `subprocess.Popen` for these processes.
+
+    A priority that can't be applied, such as CPUs this process can't use, raises
+    a `clom.shell.CommandError` naming the command instead of starting it.
+    """
+    def __init__(self, priority, spawner=None):
+        """
+        :param priority: `clom.priority.Priority`
+        :param spawner: `Spawner` that starts the processes, defaults to the default spawner
+        """
+        self.priority = priority
+        self.spawner = spawner
+
+    def __repr__(self):
+        return '<PrioritySpawner %r>' % self.priority
+
+    def _error(self, cmd, e):
+        from clom.shell import CommandError
+        if not isinstance(cmd, string_types):
+            cmd = ' '.join(str(a) for a in cmd)
+        message = 'Could not apply %r to "%s": %s' % (self.priority, cmd, e)
+        error = CommandError(126, '', message, message)
+        error.__cause__ = e
+        return error
+
+    def spawn(self, cmd, **kwargs):
+        try:
+            apply = self.priority.preexec()
+        except ValueError as e:
+            raise self._error(cmd, e)
+        previous = kwargs.get('preexec_fn')
+        if previous is not None:
+            def preexec():
+                previous()
+                apply()
+            kwargs['preexec_fn'] = preexec
+        else:
+            kwargs['preexec_fn'] = apply
+        try:
+            return (self.spawner or get_default_spawner()).spawn(cmd, **kwargs)
+        except subprocess.SubprocessError as e:
+            # Raised when preexec_fn fails in the child, without saying why
+            raise self._error(cmd, e)
+
+
+_default_spawner = PopenSpawner()
+
+
+def get_default_spawner():
+    """
+    The spawner used by backends that don't have one set.
+    """
+    return _default_spawner
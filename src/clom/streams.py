@@ -0,0 +1,132 @@
+import json
+import re
+
+from clom._compat import string_types
+
+__all__ = [
+    'split',
+    'columns',
+    'jsonl',
+    'records',
+]
+
+
+def split(chunks, sep='\n'):
+    """
+    Split a stream of text chunks on `sep`, yielding each piece as soon as it's complete.
+
+    A trailing piece without `sep` after it is yielded if it isn't empty.
+
+    ::
+
+        >>> list(split(['a\\nb', 'c\\n', 'd']))
+        ['a', 'bc', 'd']
+        >>> list(split(['x\\0y\\0'], '\\0'))
+        ['x', 'y']
+
+    """
+    pending = None
+    for chunk in chunks:
+        if pending:
+            chunk = pending + chunk
+        start = 0
+        while True:
+            end = chunk.find(sep, start)
+            if end < 0:
+                break
+            yield chunk[start:end]
+            start = end + len(sep)
+        pending = chunk[start:]
+    if pending:
+        yield pending
+
+
+def columns(lines, sep=None, header=True):
+    """
+    Split lines into columns.
+
+    Blank lines are skipped. With a header each row is a dictionary keyed by the
+    header's column names, and the last column gets the rest of the line so values
+    with spaces, like the command in `ps` output, are kept whole.
+
+    :param lines: Iterable of lines
+    :param sep: Column separator, `None` splits on runs of whitespace
+    :param header: `True` to take column names from the first line, a list of
+                   column names, or `False` to yield lists
+    :returns: Generator of dict or list
+
+    ::
+
+        >>> rows = columns(['PID TTY CMD', '1 ? /sbin/init splash'])
+        >>> list(rows) == [{'PID': '1', 'TTY': '?', 'CMD': '/sbin/init splash'}]
+        True
+        >>> list(columns(['a:b:c'], sep=':', header=False))
+        [['a', 'b', 'c']]
+
+    """
+    names = None
+    if header and header is not True:
+        names = list(header)
+
+    for line in lines:
+        if not line.strip():
+            continue
+        if sep is None:
+            line = line.strip()
+        elif line.endswith('\r'):
+            line = line[:-1]
+
+        if not header:
+            yield line.split(sep)
+        elif names is None:
+            names = line.split(sep)
+        else:
+            values = line.split(sep, len(names) - 1)
+            yield dict(zip(names, values))
+
+
+def jsonl(lines):
+    """
+    Decode each non-blank line as JSON.
+
+    :raises: ValueError - A line is not valid JSON
+    :returns: Generator
+
+    ::
+
+        >>> list(jsonl(['{"a": 1}', '', '[2, 3]']))
+        [{'a': 1}, [2, 3]]
+
+    """
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def records(lines, regex):
+    """
+    Pick fields out of lines with a regular expression.
+
+    Lines the expression doesn't match are skipped. Each match yields a dictionary
+    of its named groups, or a tuple of its groups if it has no named groups.
+
+    :param lines: Iterable of lines
+    :param regex: Regular expression string or compiled pattern, searched for in each line
+    :returns: Generator of dict or tuple
+
+    ::
+
+        >>> list(records(['eth0: 10.0.0.1', 'lo: 127.0.0.1', 'down'], r'^(\\w+): ([\\d.]+)$'))
+        [('eth0', '10.0.0.1'), ('lo', '127.0.0.1')]
+        >>> list(records(['size=42'], r'size=(?P<size>\\d+)'))
+        [{'size': '42'}]
+
+    """
+    if isinstance(regex, string_types):
+        regex = re.compile(regex)
+    named = bool(regex.groupindex)
+
+    for line in lines:
+        m = regex.search(line)
+        if m is not None:
+            yield m.groupdict() if named else m.groups()
@@ -0,0 +1,213 @@
+import marshal
+
+from clom import arg
+from clom.command import Operation, Command, BaseConjunction, AND, OR
+from clom.fabric import FabCommand, FabAction
+from clom.priority import Priority
+from clom._compat import number_types, string_types
+
+__all__ = [
+    'WIRE_VERSION',
+    'WireError',
+    'dumps',
+    'loads',
+    'to_tree',
+    'from_tree',
+]
+
+#: Version of the tree layout, bumped whenever it changes
+WIRE_VERSION = 2
+# Oldest version that can still be read, 2 added the priority to the common fields
+_OLDEST_WIRE_VERSION = 1
+
+# Tags for values that aren't plain strings, numbers, bools or None
+_NOTSET = 'N'
+_RAW = 'R'
+_LITERAL = 'L'
+_QUOTED = 'Q'
+_ARG = 'A'
+_OPERATION = 'O'
+
+# Tags for operation types
+_COMMAND = 'C'
+_FAB_COMMAND = 'F'
+_FAB_ACTION = 'FA'
+_AND = '&&'
+_OR = '||'
+
+
+_COMMAND_TYPES = {
+    _COMMAND: Command,
+    _FAB_COMMAND: FabCommand,
+    _FAB_ACTION: FabAction,
+}
+
+
+class WireError(ValueError):
+    """
+    Data can't be decoded as a serialized operation.
+    """
+
+
+def _value_to_tree(val):
+    if val is None or isinstance(val, string_types) or isinstance(val, number_types):
+        return val
+    elif val is arg.NOTSET:
+        return (_NOTSET,)
+    elif isinstance(val, arg.RawArg):
+        return (_RAW, _value_to_tree(val.data))
+    elif isinstance(val, arg.QuotedArg):
+        return (_QUOTED, _value_to_tree(val.data), val.text)
+    elif isinstance(val, arg.LiteralArg):
+        return (_LITERAL, _value_to_tree(val.data))
+    elif isinstance(val, arg.Arg):
+        return (_ARG, _value_to_tree(val.data))
+    elif isinstance(val, Operation):
+        return (_OPERATION, to_tree(val))
+    else:
+        # Values are rendered with str() anyway
+        return str(val)
+
+
+def _value_from_tree(tree, clom):
+    if not isinstance(tree, tuple):
+        return tree
+
+    tag = tree[0]
+    if tag == _NOTSET:
+        return arg.NOTSET
+    elif tag == _RAW:
+        return arg.RawArg(_value_from_tree(tree[1], clom))
+    elif tag == _QUOTED:
+        return arg.QuotedArg(_value_from_tree(tree[1], clom), tree[2])
+    elif tag == _LITERAL:
+        return arg.LiteralArg(_value_from_tree(tree[1], clom))
+    elif tag == _ARG:
+        return arg.Arg(_value_from_tree(tree[1], clom))
+    elif tag == _OPERATION:
+        return from_tree(tree[1], clom)
+    raise WireError('Unknown value tag %r' % (tag,))
+
+
+def to_tree(operation):
+    """
+    Convert an operation to a tree of tuples.
+
+    ::
+
+        >>> to_tree(clom.ls('-a'))
+        ('C', (), ('ls', None, (), (), ('-a',)))
+
+    """
+    if not isinstance(operation, Operation):
+        raise TypeError('Can not serialize %r' % (operation,))
+
+    common = []
+    if operation._pipe_to or operation._redirects or operation._env or operation._background or operation._priority:
+        common = [
+            tuple(to_tree(c) for c in operation._pipe_to),
+            tuple((fd, d, _value_to_tree(target)) for fd, (d, target) in operation._redirects.items()),
+            tuple((k, _value_to_tree(v)) for k, v in operation._env.items()),
+            operation._background,
+        ]
+        # Only added when set, so trees without one read the same as before it existed
+        priority = operation._priority
+        if priority is not None:
+            common.append((priority.nice, priority.ionice, priority.cpu_affinity))
+    common = tuple(common)
+
+    if isinstance(operation, Command):
+        if isinstance(operation, FabAction):
+            tag = _FAB_ACTION
+        elif isinstance(operation, FabCommand):
+            tag = _FAB_COMMAND
+        else:
+            tag = _COMMAND
+        return (tag, common, (
+            operation.name,
+            to_tree(operation._parent) if operation._parent is not None else None,
+            tuple(_value_to_tree(v) for v in operation._listopts),
+            tuple((k, _value_to_tree(v)) for k, v in operation._kwopts.items()),
+            tuple(_value_to_tree(v) for v in operation._args),
+        ))
+    elif isinstance(operation, BaseConjunction) and operation.operator in (_AND, _OR):
+        return (operation.operator, common, tuple(to_tree(c) for c in operation.commands))
+
+    raise TypeError('Can not serialize %r' % operation)
+
+
+def from_tree(tree, clom=None):
+    """
+    Build an operation from a tree made by `to_tree`.
+
+    :param clom: `Clom` the commands belong to, defaults to `clom.clom`
+    """
+    if clom is None:
+        from clom import clom
+
+    try:
+        tag, common, body = tree
+    except (TypeError, ValueError):
+        raise WireError('Malformed operation %r' % (tree,))
+
+    if tag in _COMMAND_TYPES:
+        cls = _COMMAND_TYPES[tag]
+        name, parent, listopts, kwopts, args = body
+        if parent is not None:
+            parent = from_tree(parent, clom)
+        operation = cls(clom, name, parent=parent)
+        operation._listopts = [_value_from_tree(v, clom) for v in listopts]
+        operation._kwopts = dict((k, _value_from_tree(v, clom)) for k, v in kwopts)
+        operation._args = [_value_from_tree(v, clom) for v in args]
+    elif tag in (_AND, _OR):
+        cls = AND if tag == _AND else OR
+        operation = cls(*[from_tree(c, clom) for c in body])
+    else:
+        raise WireError('Unknown operation tag %r' % (tag,))
+
+    if common:
+        pipe_to, redirects, env, background = common[:4]
+        if len(common) > 4:
+            operation._priority = Priority(*common[4])
+        operation._pipe_to = [from_tree(c, clom) for c in pipe_to]
+        operation._redirects = dict((fd, (d, _value_from_tree(target, clom))) for fd, d, target in redirects)
+        operation._env = dict((k, _value_from_tree(v, clom)) for k, v in env)
+        operation._background = background
+
+    return operation
+
+
+def dumps(operation):
+    """
+    Serialize an operation to bytes.
+
+    Operations are turned into a tree of tuples holding only what's needed to
+    render them, leaving out the `Clom`, backend and shell. The tree is encoded
+    with `marshal`, so both ends must run the same major Python version.
+
+    ::
+
+        >>> from clom import AND
+        >>> op = AND(clom.git.commit(m='fix'), clom.fab.deploy('dev')).output_to_file('log')
+        >>> loads(dumps(op))
+        '( git commit -m fix && fab deploy:dev ) > log'
+
+    """
+    return marshal.dumps((WIRE_VERSION, to_tree(operation)))
+
+
+def loads(data, clom=None):
+    """
+    Build an operation from bytes made by `dumps`.
+
+    :param clom: `Clom` the commands belong to, defaults to `clom.clom`
+    :raises: WireError
+    """
+    try:
+        version, tree = marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        raise WireError('Data is not a serialized operation')
+    if not isinstance(version, int) or not _OLDEST_WIRE_VERSION <= version <= WIRE_VERSION:
+        raise WireError('Unsupported wire version %r, expected %r to %r' % (
+            version, _OLDEST_WIRE_VERSION, WIRE_VERSION))
+    return from_tree(tree, clom)
@@ -0,0 +1,109 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+from clom import Clom, clom, AND
+from clom.backend import FakeBackend, LocalBackend, SSHBackend, get_default_backend, set_default_backend
+from clom.batch import Batch
+from clom.shell import CommandError
+
+# Stands in for ssh: opens a "master connection" the first time a control path is
+# used then runs the command locally.
+FAKE_SSH = textwrap.dedent('''
+    import os, subprocess, sys
+
+    args = sys.argv[1:]
+    opts = {}
+    while args[0].startswith('-'):
+        flag = args.pop(0)
+        value = args.pop(0)
+        if flag == '-o':
+            name, _, value = value.partition('=')
+        opts[flag if flag != '-o' else name] = value
+
+    control = opts['ControlPath'].replace('%C', args[0])
+    if '-O' in opts:
+        sys.exit(0 if os.path.exists(control) else 255)
+
+    if not os.path.exists(control):
+        open(control, 'w').close()
+        with open(os.environ['FAKE_SSH_LOG'], 'a') as f:
+            f.write('connect %s\\n' % args[0])
+
+    sys.exit(subprocess.call(args[1], shell=True))
+''')
+
+
+@pytest.fixture
+def ssh(tmpdir, monkeypatch):
+    script = tmpdir.join('fake_ssh.py')
+    script.write(FAKE_SSH)
+    log = tmpdir.join('ssh.log')
+    log.write('')
+    monkeypatch.setenv('FAKE_SSH_LOG', str(log))
+
+    def backend(host):
+        return SSHBackend(host, ssh=[sys.executable, str(script)], control_dir=str(tmpdir))
+    backend.log = log
+    return backend
+
+
+def test_ssh_backend_reuses_connection(ssh):
+    web1 = ssh('web1')
+    web2 = ssh('web2')
+    assert not web1.is_connected()
+
+    for i in range(3):
+        assert str(clom.echo('hello', i).with_backend(web1).shell()) == 'hello %d' % i
+    assert clom.echo('$HOME').with_backend(ssh('web1')).shell() == '$HOME'
+    assert str(clom.hostname.with_backend(web2).shell()) == clom.hostname.shell()
+
+    assert web1.is_connected()
+    assert ssh.log.read() == 'connect web1\nconnect web2\n'
+
+    with pytest.raises(CommandError) as e:
+        clom.sh(c='exit 3').with_backend(web1).shell()
+    assert e.value.code == 3
+
+    # Batches and native conjunctions run remotely too
+    assert [str(r) for r in Batch([clom.echo('a'), clom.echo('b')], backend=web1).run()] == ['a', 'b']
+    assert AND(clom.echo('a'), clom.echo('b')).with_backend(web1).shell().all() == ['a', 'b']
+
+
+def test_ssh_argv():
+    backend = SSHBackend('db', user='admin', port=2222, options={'BatchMode': 'yes'})
+    argv = backend.ssh_argv(['echo', "it's"])
+    assert argv[0] == 'ssh'
+    assert '-p' in argv and '2222' in argv
+    assert 'BatchMode=yes' in argv
+    assert argv[-2:] == ['admin@db', "echo 'it'\\''s'"]
+
+
+def test_fake_backend():
+    fake = FakeBackend(return_code=1, stderr='nope')
+    fake.respond('ls', stdout='a\nb\n')
+
+    remote = Clom(backend=fake)
+    assert remote.ls.shell.all() == ['a', 'b']
+    with pytest.raises(CommandError):
+        remote.rm('x').shell()
+
+    # Sub commands and conjunctions use the backend too
+    with pytest.raises(CommandError):
+        remote.git.status.shell.execute()
+    with pytest.raises(CommandError):
+        AND(remote.ls, remote.cat('x')).shell()
+    assert fake.calls == ['ls', 'rm x', 'git status', 'ls', 'cat x']
+
+
+def test_default_backend():
+    fake = FakeBackend(stdout='faked')
+    previous = set_default_backend(fake)
+    try:
+        assert str(clom.ls.shell()) == 'faked'
+        assert str(clom.ls.with_backend(LocalBackend()).shell()) != 'faked'
+    finally:
+        set_default_backend(previous)
+    assert get_default_backend() is previous
@@ -0,0 +1,45 @@
+import pytest
+
+from clom import clom, AND
+from clom.batch import Batch
+from clom.shell import CommandError
+
+
+def test_batch_splits_output():
+    ops = [
+        clom.printf('no newline'),
+        clom.sh(c='echo out; echo err >&2; exit 3'),
+        clom.cat,
+        AND(clom.echo('a'), clom.echo('b')),
+        clom.printf('trailing\\n\\n'),
+    ]
+    results = Batch(ops).run()
+    assert len(results) == len(ops)
+
+    assert results[0].stdout == 'no newline'
+    assert results[1].return_code == 3
+    assert results[1].stdout == 'out\n'
+    assert results[1].stderr == 'err\n'
+    # stdin is not the script
+    assert results[2].stdout == ''
+    assert results[3].all() == ['a', 'b']
+    assert results[4].stdout == 'trailing\n\n'
+
+
+def test_batch_matches_shell():
+    ops = [clom.echo(i) for i in range(50)]
+    assert [r.stdout for r in Batch(ops).run()] == [op.shell().stdout for op in ops]
+
+
+def test_batch_isolate():
+    ops = [clom.cd('/'), clom.pwd, clom.exit(4), clom.echo('after')]
+
+    results = Batch(ops, isolate=True).run()
+    assert results[1].stdout == clom.pwd.shell().stdout
+    assert results[2].return_code == 4
+    assert str(results[3]) == 'after'
+
+    with pytest.raises(CommandError) as e:
+        Batch(ops).run()
+    assert e.value.code == 4
+    assert [str(r) for r in e.value.results] == ['', '/']
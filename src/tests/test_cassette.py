@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+from clom import clom
+from clom.backend import FakeBackend, get_default_backend
+from clom.cassette import CassetteBackend, CassetteError
+from clom.shell import CommandError
+
+
+def test_record_and_replay_without_spawning(tmpdir):
+    path = str(tmpdir.join('c.json'))
+    with CassetteBackend(path, mode='record') as cassette:
+        assert 'hi' == clom.echo('hi').shell()
+        with pytest.raises(CommandError):
+            clom.sh(c='echo bad >&2; exit 3').shell()
+        assert 'v' == clom.sh(c='echo $CLOM_CASSETTE').with_env(CLOM_CASSETTE='v').shell()
+    assert get_default_backend() is not cassette
+
+    data = json.load(open(path))
+    assert 3 == len(data['interactions'])
+    assert {'CLOM_CASSETTE': 'v'} == data['interactions'][2]['env']
+
+    # Nothing runs when replaying
+    fake = FakeBackend(return_code=99)
+    with CassetteBackend(path, mode='replay', backend=fake):
+        assert 'hi' == clom.echo('hi').shell()
+        with pytest.raises(CommandError) as e:
+            clom.sh(c='echo bad >&2; exit 3').shell()
+        assert (3, 'bad\n') == (e.value.return_code, e.value.stderr)
+        assert 'v' == clom.sh(c='echo $CLOM_CASSETTE').with_env(CLOM_CASSETTE='v').shell()
+    assert [] == fake.calls
+
+
+def test_strict_matching(tmpdir):
+    path = str(tmpdir.join('c.json'))
+    with CassetteBackend(path, mode='record'):
+        clom.echo('a').shell()
+        clom.sh(c='echo $V').with_env(V='1').shell()
+
+    with CassetteBackend(path, mode='replay') as cassette:
+        assert 2 == len(cassette.unplayed)
+        assert 'a' == clom.echo('a').shell()
+        # Each interaction is served once
+        with pytest.raises(CassetteError):
+            clom.echo('a').shell()
+        # The environment has to match too
+        with pytest.raises(CassetteError):
+            clom.sh(c='echo $V').with_env(V='2').shell()
+        assert 1 == len(cassette.unplayed)
+
+
+def test_lenient_matching(tmpdir):
+    path = str(tmpdir.join('c.json'))
+    with CassetteBackend(path, mode='record'):
+        clom.sh(c='echo $V').with_env(V='1').shell()
+
+    with CassetteBackend(path, mode='replay', match='lenient'):
+        for _ in range(3):
+            assert '1' == clom.sh(c='echo $V').with_env(V='2').shell()
+
+
+def test_auto_records_misses(tmpdir):
+    path = str(tmpdir.join('c.json'))
+    with CassetteBackend(path):
+        clom.echo('a').shell()
+    with CassetteBackend(path) as cassette:
+        clom.echo('a').shell()
+        clom.echo('b').shell()
+    assert ['echo a', 'echo b'] == [i['command'] for i in cassette.interactions]
+
+    # Recording again replaces the cassette
+    with CassetteBackend(path, mode='record'):
+        clom.echo('c').shell()
+    assert ['echo c'] == [i['command'] for i in CassetteBackend(path).interactions]
+
+
+def test_written_once_on_close(tmpdir, monkeypatch):
+    path = tmpdir.join('c.json')
+    with CassetteBackend(str(path), mode='record'):
+        clom.echo('old').shell()
+    before = path.read()
+
+    saves = []
+    original = CassetteBackend.save
+    monkeypatch.setattr(CassetteBackend, 'save', lambda self: saves.append(1) or original(self))
+    with CassetteBackend(str(path), mode='record'):
+        for i in range(5):
+            clom.echo(i).shell()
+        # The previous cassette is untouched until it's closed
+        assert before == path.read()
+    assert 1 == len(saves)
+    assert 5 == len(json.loads(path.read())['interactions'])
+    assert [] == [p for p in tmpdir.listdir() if p.ext == '.tmp']
+
+    # Nothing recorded, nothing written
+    with CassetteBackend(str(path), mode='replay'):
+        clom.echo(0).shell()
+    assert 1 == len(saves)
+
+
+def test_binary_output_and_streams(tmpdir):
+    path = str(tmpdir.join('c.json'))
+    with CassetteBackend(path, mode='record') as cassette:
+        assert (0, b'\xff', b'') == cassette.run(['printf', '\\377'])
+        assert ['1', '2'] == list(clom.seq(2).shell.stream())
+
+    with CassetteBackend(path, mode='replay') as cassette:
+        assert (0, b'\xff', b'') == cassette.run(['printf', '\\377'])
+        assert ['1', '2'] == list(clom.seq(2).shell.stream())
+
+
+def test_options_are_checked(tmpdir):
+    with pytest.raises(ValueError):
+        CassetteBackend(str(tmpdir.join('c.json')), mode='sometimes')
+    with pytest.raises(ValueError):
+        CassetteBackend(str(tmpdir.join('c.json')), match='loose')
+    with pytest.raises(IOError):
+        CassetteBackend(str(tmpdir.join('missing.json')), mode='replay')
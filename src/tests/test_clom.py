@@ -1,3 +1,6 @@
+import os
+import pickle
+
 from clom import clom, AND, OR, STDERR
 
 def test_clom():
@@ -123,3 +126,244 @@ def test_metadecorator():
     assert myfunc2 is not myfunc
     assert myfunc2.__doc__ == myfunc.__doc__
     assert myfunc2('foo', bar=3) == (('foo',), {'bar':3})
+
+def test_pickle():
+    from clom import Clom
+
+    c = Clom(cache_size=5)
+    op = c.git.commit(m='fix').pipe_to(c.tee('log'))
+    loaded = pickle.loads(pickle.dumps(op))
+    assert 'git commit -m fix | tee log' == loaded
+    assert 5 == loaded._clom.cache_info()['maxsize']
+    assert 'fab deploy:dev' == pickle.loads(pickle.dumps(c.fab.deploy('dev')))
+
+    from clom.resolver import Resolver
+    c = pickle.loads(pickle.dumps(Clom(resolver=Resolver(path='/bin'))))
+    assert '/bin' == c._resolver.path
+
+def test_native_conjunction():
+    from clom.shell import CommandError, ConjunctionResult
+
+    r = AND(clom.basename('/foo'), OR(clom.false, clom.basename('/bar'))).shell()
+    assert isinstance(r, ConjunctionResult)
+    assert r.all() == ['foo', 'bar']
+    assert [s.return_code for s in r.steps] == [0, 0]
+    assert all(s.direct for s in r.steps)
+    assert [s.return_code for s in r.steps[1].result.steps] == [1, 0]
+
+    # Short-circuits like the shell
+    try:
+        AND(clom.echo('foo'), clom.false, clom.echo('bar')).shell()
+    except CommandError as e:
+        assert e.code == 1
+        assert e.stdout == 'foo\n'
+        assert len(e.steps) == 2
+    else:
+        raise AssertionError('Expected CommandError')
+
+    r = OR(clom.true, clom.echo('bar')).shell()
+    assert r.stdout == ''
+    assert len(r.steps) == 1
+
+    # Operations that need a shell still work
+    r = AND(clom.basename('/$0'), clom.echo('foo').pipe_to(clom.cat)).shell()
+    assert r.all() == ['$0', 'foo']
+    assert [s.direct for s in r.steps] == [True, False]
+
+    r = OR(clom['not-a-real-command'], clom.echo('fallback')).shell()
+    assert r.steps[0].return_code == 127
+    assert str(r) == 'fallback'
+
+    # Conjunctions with their own redirects go through the shell
+    assert AND(clom.echo('foo'), clom.echo('bar')).pipe_to(clom.wc('-l')).shell().first() == '2'
+
+def test_conjunction_with_builtin_variants():
+    # echo, printf and test run through the shell like the rendered command, not
+    # as /bin/echo and so on, whose handling of backslashes and options differs
+    for op in (clom.echo('a\\nb'), clom.printf('%s\\n', 'x'), clom.test('-n', 'x')):
+        r = AND(op, clom.true).shell()
+        assert not r.steps[0].direct
+        assert op.shell().stdout == r.steps[0].result.stdout
+    assert clom.echo('x')._argv() == ['echo', 'x']
+
+def test_conjunction_with_builtins():
+    import tempfile
+    from clom.shell import ConjunctionResult
+
+    # Builtins share the state of one shell with the steps after them
+    tmp = os.path.realpath(tempfile.gettempdir())
+    r = AND(clom.cd(tmp), clom.pwd).shell()
+    assert not isinstance(r, ConjunctionResult)
+    assert tmp == os.path.realpath(str(r))
+    assert '1' == AND(clom.export('FOO=1'), clom.sh(c='echo $FOO')).shell()
+    assert '1' == OR(clom.false, AND(clom.export('FOO=1'), clom.sh(c='echo $FOO'))).shell()
+    assert clom.cd('/')._argv() is None
+
+def test_command_cache():
+    import threading
+    from clom import Clom
+
+    c = Clom(cache_size=2)
+    assert c.ls is c.ls
+    assert c.fab.deploy == 'fab deploy'
+    c['/bin/ls']
+    assert c.cache_info() == {'hits': 1, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2}
+
+    # Shared commands are never changed by building on them
+    ls = c.ls
+    assert ls('-a') == 'ls -a'
+    assert ls.shell is not ls('-a').shell
+    assert c.ls == 'ls'
+
+    c = Clom(cache_size=None)
+    seen = []
+    def lookup():
+        seen.append(c.cat)
+    threads = [threading.Thread(target=lookup) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(cmd is seen[0] for cmd in seen)
+    assert c.cache_info()['size'] == 1
+
+def test_resolver(tmpdir):
+    import os
+    import pytest
+    from clom import Clom
+    from clom.resolver import Resolver, ExecutableNotFound
+    from clom.shell import CommandError
+
+    first = tmpdir.mkdir('first')
+    second = tmpdir.mkdir('second')
+    tool = second.join('tool')
+    tool.write('#!/bin/sh\necho second "$@"\n')
+    tool.chmod(0o755)
+    second.join('not-executable').write('')
+
+    c = Clom(resolver=Resolver(path='%s:%s' % (first, second)))
+    assert str(c.tool('x')) == '%s x' % tool
+    assert str(c.tool.sub) == '%s sub' % tool
+    assert c.tool('x').shell() == 'second x'
+    assert c.tool('x')._argv() == [str(tool), 'x']
+    assert c.cd('/') == 'cd /'
+    assert c['./tool'] == './tool'
+
+    # Missing names render bare, so printing and comparing commands never raises
+    assert str(c['not-executable']) == 'not-executable'
+    assert c.missing == 'missing'
+    with pytest.raises(ExecutableNotFound):
+        c._resolver.resolve('missing')
+    with pytest.raises(CommandError) as e:
+        c.missing.shell()
+    assert e.value.code == 127
+
+    # Adding a file changes the directory's mtime which updates the index, set it
+    # explicitly as the filesystem's timestamps may be too coarse to notice
+    override = first.join('tool')
+    override.write('#!/bin/sh\necho first\n')
+    override.chmod(0o755)
+    mtime = os.stat(str(first)).st_mtime
+    os.utime(str(first), (mtime + 10, mtime + 10))
+    assert str(c.tool) == str(override)
+
+    # Defaults to $PATH
+    assert os.path.isabs(str(Clom(resolver=True).sh))
+
+def test_resolver_fails_before_spawning(tmpdir):
+    import pytest
+    from clom import Clom, AND, OR
+    from clom.backend import LocalBackend
+    from clom.resolver import Resolver, ExecutableNotFound
+    from clom.shell import CommandError
+
+    class Recording(LocalBackend):
+        calls = []
+
+        def popen(self, cmd, **kwargs):
+            self.calls.append(cmd)
+            return super(Recording, self).popen(cmd, **kwargs)
+
+    backend = Recording()
+    c = Clom(backend=backend, resolver=Resolver(path=str(tmpdir)))
+    for op in (c.missing('x'), c.missing.sub, c.missing | c.missing_too):
+        with pytest.raises(ExecutableNotFound) as e:
+            op.shell()
+        assert 127 == e.value.code
+    assert [] == backend.calls
+
+    # A missing step of a conjunction fails that step like the shell would
+    r = OR(c.missing, clom.true.with_backend(backend)).shell()
+    assert 127 == r.steps[0].return_code
+    assert 1 == len(backend.calls)
+    with pytest.raises(CommandError) as e:
+        AND(c.missing, c.missing_too).shell()
+    assert 127 == e.value.code
+
+def test_env_passthrough():
+    from clom.backend import LocalBackend
+    from clom.arg import RawArg
+
+    class Recording(LocalBackend):
+        def run(self, cmd, capture=True, encoding=None, env=None):
+            self.last = (cmd, env)
+            return super(Recording, self).run(cmd, capture, encoding, env)
+
+    backend = Recording()
+    op = clom.sh(c='echo $GREETING', GREETING='hi there').with_backend(backend)
+    assert 'hi there' == op.shell()
+    cmd, env = backend.last
+    assert "sh -c 'echo $GREETING'" == cmd
+    assert 'hi there' == env['GREETING']
+    # The variables only reach the process, not this one
+    assert 'GREETING' not in os.environ
+
+    # Shell-only values and pipes keep the env prefix
+    op.with_env(GREETING=RawArg('"$USER"')).shell()
+    assert backend.last[0].startswith('env GREETING=')
+    assert backend.last[1] is None
+    op.pipe_to(clom.cat).shell()
+    assert backend.last[0].startswith('env GREETING=')
+
+    r = AND(op, clom.true.with_backend(backend)).shell()
+    assert 'hi there' == r.steps[0].result
+    assert r.steps[0].direct
+
+def test_env_passthrough_for_every_entry_point():
+    from clom.backend import LocalBackend
+    from clom.sinks import Counter
+
+    class Recording(LocalBackend):
+        calls = []
+
+        def popen(self, cmd, **kwargs):
+            self.calls.append((cmd, kwargs.get('env')))
+            return super(Recording, self).popen(cmd, **kwargs)
+
+    backend = Recording()
+    op = clom.sh(c='echo $GREETING', GREETING='hi').with_backend(backend)
+    assert ['hi'] == list(op.shell.stream())
+    op.shell.execute()
+    op.shell.with_sinks(stdout=[Counter()])()
+    assert 3 == len(backend.calls)
+    for cmd, env in backend.calls:
+        assert "sh -c 'echo $GREETING'" == cmd
+        assert 'hi' == env['GREETING']
+
+def test_lazy_imports():
+    import subprocess
+    import sys
+
+    script = (
+        'import sys, clom; str(clom.clom.ls("-l") | clom.clom.wc); '
+        'str(clom.Clom(resolver=True).ls); '
+        'print(" ".join(m for m in ("clom.shell", "clom.fabric", "clom.parser") if m in sys.modules))'
+    )
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    loaded = subprocess.check_output([sys.executable, '-c', script], cwd=src)
+    if sys.version_info >= (3, 7):
+        assert b'' == loaded.strip()
+
+    import clom as package
+    assert package.parse('ls -l') == 'ls -l'
+    assert 'FabCommand' == type(package.clom.fab).__name__
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from clom import clom
+from clom.dag import Graph, SUCCESS, FAILURE, ALWAYS
+
+
+def test_independent_nodes_run_in_parallel():
+    g = Graph()
+    for i in range(4):
+        g.add(clom.sleep(0.2), name='sleep%d' % i)
+    r = g.run()
+    assert r.ok
+    assert r.duration < 0.6
+    assert all(t >= 0.2 for t in r.timings.values())
+
+
+def test_max_parallel():
+    g = Graph(max_parallel=1)
+    for i in range(3):
+        g.add(clom.sleep(0.1))
+    r = g.run()
+    assert r.duration >= 0.3
+    assert [n.name for n in r] == ['sleep 0.1', 'sleep 0.1#2', 'sleep 0.1#3']
+
+
+def test_short_circuit_edges():
+    g = Graph()
+    a = g.add(clom.false, name='a')
+    b = g.add(clom.echo('b'), after=a, name='b')
+    # `a && b || c`: c runs since b was skipped due to a failing
+    c = g.add(clom.echo('c'), after=b, on=FAILURE, name='c')
+    d = g.add(clom.echo('d'), after=[(a, ALWAYS), (c, SUCCESS)], name='d')
+    r = g.run()
+
+    assert r['a'].status == 'failed'
+    assert r['b'].skipped and not r['b'].ok
+    assert r['c'].status == 'success'
+    assert str(r['c'].result) == 'c'
+    assert r['d'].status == 'success'
+    assert r.ok
+
+
+def test_critical_path():
+    g = Graph()
+    slow = g.add(clom.sleep(0.3), name='slow')
+    fast = g.add(clom.true, name='fast')
+    g.add(clom.true, after=[slow, fast], name='last')
+    r = g.run()
+    assert r.critical_path == ['slow', 'last']
+
+
+def test_add_validation():
+    g = Graph()
+    other = Graph().add(clom.true)
+    with pytest.raises(ValueError):
+        g.add(clom.true, after=other)
+    with pytest.raises(ValueError):
+        g.add(clom.true, name='x', on='sometimes')
+    g.add(clom.true, name='x')
+    with pytest.raises(ValueError):
+        g.add(clom.true, name='x')
+
+
+def test_node_that_raises_fails_without_hanging():
+    from clom.backend import Backend
+
+    class Broken(Backend):
+        def run(self, cmd, capture=True, encoding=None, env=None):
+            raise RuntimeError('broken backend')
+
+    g = Graph()
+    bad = g.add(clom.true.with_backend(Broken()), name='bad')
+    g.add(clom.echo('after'), after=bad, name='after')
+    g.add(clom.echo('anyway'), after=bad, on=FAILURE, name='anyway')
+    r = g.run()
+    assert 'failed' == r['bad'].status
+    assert isinstance(r['bad'].result, RuntimeError)
+    assert ('skipped', 'success') == (r['after'].status, r['anyway'].status)
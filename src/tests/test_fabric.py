@@ -0,0 +1,106 @@
+import os
+import time
+
+import pytest
+
+from clom import clom
+from clom.backend import FakeBackend
+
+
+@pytest.fixture
+def fab(tmpdir, monkeypatch):
+    """
+    A stand-in `fab` that sleeps then echoes its arguments, failing for host `bad`.
+    """
+    script = tmpdir.join('fab')
+    script.write('#!/bin/sh\nsleep 0.2\necho "$@"\ncase "$1" in *bad*) exit 2;; esac\n')
+    script.chmod(0o755)
+    monkeypatch.setenv('PATH', '%s:%s' % (tmpdir, os.environ['PATH']))
+
+
+def test_for_hosts():
+    assert 'fab --hosts=a,b test:unit deploy:dev' == clom.fab.test('unit').deploy('dev').for_hosts(['a', 'b'])
+    assert 'fab -a --hosts=a' == clom.fab.with_opts('-a').for_hosts(['a'])
+
+
+def test_run_on_parallel(fab):
+    hosts = ['web%d' % i for i in range(6)] + ['bad']
+    seen = []
+
+    start = time.time()
+    r = clom.fab.deploy('dev').run_on(hosts, parallel=7, progress=seen.append)
+    assert time.time() - start < 1.0
+
+    assert len(r) == 7
+    assert r.failed == ['bad']
+    assert not r.ok
+    assert str(r['web3']) == '--hosts=web3 deploy:dev'
+    assert r['bad'].code == 2
+    assert sorted(h for s in seen for h in s.hosts) == sorted(hosts)
+    assert all(t >= 0.2 for t in r.timings.values())
+
+
+def test_run_on_shards():
+    fake = FakeBackend()
+    r = clom.fab.deploy('dev').with_backend(fake).run_on(['a', 'b', 'c'], parallel=1, shard_size=2)
+    assert sorted(fake.calls) == ['fab --hosts=a,b deploy:dev', 'fab --hosts=c deploy:dev']
+    assert r.ok
+    assert r.hosts == ['a', 'b', 'c']
+
+
+def test_coalesce():
+    from clom.fabric import coalesce
+
+    commands = [
+        clom.fab.test('unit'),
+        clom.fab.build.deploy('dev'),
+        clom.fab(H='a').deploy,
+        clom.fab(H='a').migrate,
+        clom.fab.deploy.output_to_file('log'),
+        clom.fab.with_opts(list=True),
+        clom.fab.deploy('prod').with_env(DEBUG=1),
+        clom.fab.notify.with_env(DEBUG=1),
+    ]
+    groups = coalesce(commands)
+    assert [str(g) for g in groups] == [
+        'fab test:unit build deploy:dev',
+        'fab -H a deploy migrate',
+        'fab deploy > log',
+        'fab --list',
+        'env DEBUG=1 fab deploy:prod notify',
+    ]
+    assert [len(g.commands) for g in groups] == [2, 2, 1, 1, 2]
+    assert groups[0].tasks == ['test', 'build', 'deploy']
+
+    # Respects the length limit
+    many = [clom.fab.task(i) for i in range(10)]
+    groups = coalesce(many, arg_max=len('fab task:0 task:1 task:2'))
+    assert [len(g.commands) for g in groups] == [3, 3, 3, 1]
+
+
+def test_coalesce_split_output():
+    from clom.fabric import coalesce
+    from clom.shell import CommandError
+
+    fake = FakeBackend(return_code=1, stdout=(
+        "[a] Executing task 'build'\n[a] run: make\nok\n"
+        "[a] Executing task 'deploy'\n[b] Executing task 'deploy'\nfailed\n"
+    ))
+    group, = coalesce([
+        clom.fab.with_backend(fake).build,
+        clom.fab.with_backend(fake).deploy,
+        clom.fab.with_backend(fake).restart,
+    ])
+    assert group.split_output(fake._default[1]) == [
+        "[a] Executing task 'build'\n[a] run: make\nok\n",
+        "[a] Executing task 'deploy'\n[b] Executing task 'deploy'\nfailed\n",
+        None,
+    ]
+    build, deploy, restart = group.run()
+    assert build.return_code == 0
+    assert isinstance(deploy, CommandError)
+    assert deploy.stdout.endswith('failed\n')
+    assert restart is None
+
+    # Local tasks print no markers
+    assert group.split_output('some output\n') is None
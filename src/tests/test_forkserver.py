@@ -0,0 +1,60 @@
+import resource
+import signal
+import subprocess
+
+import pytest
+
+from clom import clom
+from clom.backend import LocalBackend
+from clom.forkserver import SpawnServer, ServerProcess
+
+
+@pytest.fixture
+def server():
+    server = SpawnServer()
+    yield server
+    server.close()
+
+
+def test_pipes_are_passed_back(server):
+    p = server.spawn(['cat'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert isinstance(p, ServerProcess)
+    assert p.pid != server.pid
+    assert (b'round trip', b'') == p.communicate(b'round trip')
+    assert 0 == p.returncode
+
+    p = server.spawn('echo out; echo err >&2; exit 5', stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert (b'out\nerr\n', None) == p.communicate()
+    assert 5 == p.returncode
+
+
+def test_shell(server):
+    shell = clom.sh(c='echo $GREETING', GREETING='hi').shell.with_spawner(server)
+    assert 'hi' == shell()
+    assert ['1', '2', '3'] == list(clom.seq(3).shell.with_spawner(server).stream())
+
+    upper = lambda lines: (line.upper() for line in lines)
+    assert ['A', 'B'] == (clom.printf('a\\nb\\n') | upper | clom.cat).shell.with_spawner(server).all()
+
+    assert 127 == LocalBackend().with_spawner(server).run(['not-a-real-command'])[0]
+
+
+def test_operations_and_limits(server):
+    p = server.spawn_operation(clom.sh(c='ulimit -n'), stdout=subprocess.PIPE,
+                               rlimits={resource.RLIMIT_NOFILE: (64, 64)})
+    assert b'64\n' == p.communicate()[0]
+
+
+def test_poll_and_kill(server):
+    p = server.spawn(['sleep', '10'])
+    assert p.poll() is None
+    with pytest.raises(subprocess.TimeoutExpired):
+        p.wait(timeout=0.05)
+    p.kill()
+    assert -signal.SIGKILL == p.wait()
+
+
+def test_fallback(server):
+    p = server.spawn(['true'], preexec_fn=lambda: None)
+    assert isinstance(p, subprocess.Popen)
+    assert 0 == p.wait()
@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+from clom import clom
+from clom.backend import FakeBackend
+from clom.hedge import HedgedResult, LatencyHistory
+from clom.shell import CommandError
+from clom import hedge
+
+
+def test_fast_command_is_not_hedged():
+    r = clom.echo('hi').shell.hedged(after=5)
+    assert isinstance(r, HedgedResult)
+    assert 'hi' == r
+    assert (0, 1) == (r.attempt, r.attempts)
+
+
+def test_hung_attempt_loses(tmpdir):
+    # The first attempt hangs, later ones are quick
+    marker = str(tmpdir.join('first'))
+    pids = str(tmpdir.join('pids'))
+    script = 'echo $$ >> %s; if mkdir %s 2>/dev/null; then sleep 30; fi; echo done' % (pids, marker)
+
+    started = time.time()
+    r = clom.sh(c=script).shell.hedged(after=0.2, max_copies=3)
+    assert time.time() - started < 5
+    assert 'done' == r
+    assert (1, 2) == (r.attempt, r.attempts)
+
+    # The hung attempt's process group was killed
+    first = int(open(pids).readline())
+    for _ in range(100):
+        try:
+            os.kill(first, 0)
+        except OSError:
+            break
+        time.sleep(0.01)
+    else:
+        raise AssertionError('Losing attempt %d is still running' % first)
+
+
+def test_failures():
+    with pytest.raises(CommandError) as e:
+        clom.sh(c='echo nope >&2; exit 3').shell.hedged(after=5, max_copies=2)
+    assert 3 == e.value.code
+    # A failure starts the next copy straight away
+    assert 2 == e.value.attempts
+
+
+def test_missing_and_unusable_programs(tmpdir):
+    with pytest.raises(CommandError) as e:
+        clom['clom-no-such-program'].shell.hedged(after=5)
+    assert 127 == e.value.code
+    assert 1 == e.value.attempts
+
+    not_executable = tmpdir.join('not-executable')
+    not_executable.write('')
+    with pytest.raises(CommandError) as e:
+        clom[str(not_executable)].shell.hedged(after=5)
+    assert 126 == e.value.code
+
+
+def test_learned_delay(monkeypatch, tmpdir):
+    history = LatencyHistory(min_samples=3)
+    monkeypatch.setattr(hedge, 'history', history)
+    slow = tmpdir.join('slow')
+    op = clom.sh(c='if [ -e %s ]; then rm %s; sleep 30; fi' % (slow, slow))
+
+    for _ in range(3):
+        op.shell.hedged()
+    assert history.percentile(str(op), 95) < 1
+
+    # Hedges after the learned p95 rather than the one second default
+    slow.write('')
+    started = time.time()
+    r = op.shell.hedged()
+    assert time.time() - started < 0.9
+    assert (1, 2) == (r.attempt, r.attempts)
+
+
+def test_without_processes():
+    r = clom.ls.with_backend(FakeBackend(stdout='x\n')).shell.hedged()
+    assert 'x' == r
+    assert 1 == r.attempts
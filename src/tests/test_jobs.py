@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from clom import clom
+from clom.shell import CommandError
+from clom.jobs import JobManager, JobTimeout
+
+
+def test_spawn_captures_output(tmpdir):
+    out = str(tmpdir.join('out.txt'))
+    err = str(tmpdir.join('err.txt'))
+
+    job = clom.sh(c='echo foo; echo bar >&2').shell.spawn(stdout=out, stderr=err)
+    assert job.pid == job.pgid
+    r = job.wait()
+    assert r.return_code == 0
+    assert r.stdout == 'foo\n'
+    assert r.stderr == 'bar\n'
+    assert job.poll() == 0
+    assert not job.is_running
+
+
+def test_spawn_ignores_background():
+    job = clom.echo('foo').background().shell.spawn()
+    assert job.command == 'echo foo'
+    assert job.wait().return_code == 0
+
+
+def test_kill_process_group():
+    job = clom.sh(c='sleep 10 & sleep 10; wait').shell.spawn()
+    with pytest.raises(JobTimeout):
+        job.wait(timeout=0.05)
+    assert job.kill()
+    with pytest.raises(CommandError):
+        job.wait(timeout=5)
+    assert not job.kill()
+
+
+def test_manager_limits_concurrency():
+    jobs = JobManager(max_jobs=2)
+    start = time.time()
+    for i in range(4):
+        jobs.submit(clom.sleep(0.2))
+        assert len(jobs.running) <= 2
+    done = jobs.wait_all(timeout=5)
+    assert len(done) == 4
+    assert jobs.running == []
+    # Two batches of two
+    assert time.time() - start >= 0.4
+
+
+def test_manager_context_kills_on_error():
+    with pytest.raises(RuntimeError):
+        with JobManager() as jobs:
+            job = jobs.submit(clom.sleep(10))
+            raise RuntimeError()
+    assert job.return_code == -15
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from clom import clom
+from clom.backend import FakeBackend, LocalBackend
+from clom.multiplex import Multiplexer
+from clom.shell import CommandError, CommandResult
+
+
+def test_many_children_one_thread():
+    threads = threading.active_count()
+    ops = [clom.sh(c='sleep 0.2; echo %d' % i) for i in range(100)]
+
+    started = time.time()
+    results = Multiplexer(max_running=None).run_all(ops)
+    assert time.time() - started < 5
+
+    assert [str(r) for r in results] == [str(i) for i in range(100)]
+    assert threading.active_count() == threads
+
+
+def test_completion_order_and_errors():
+    mux = Multiplexer(max_running=3)
+    ops = [clom.sh(c='sleep 0.3; echo slow'), clom.sh(c='echo oops >&2; exit 2'), clom.echo('fast')]
+    done = list(mux.run(ops))
+
+    assert done[-1][0] is ops[0]
+    results = dict((str(op), r) for op, r in done)
+    error = results["sh -c 'echo oops >&2; exit 2'"]
+    assert isinstance(error, CommandError)
+    assert (2, 'oops\n') == (error.code, error.stderr)
+    assert isinstance(results['echo fast'], CommandResult)
+
+
+def test_limit_running():
+    ops = [clom.sh(c='sleep 0.1') for _ in range(6)]
+    started = time.time()
+    results = Multiplexer(max_running=2).run_all(ops)
+    assert time.time() - started >= 0.3
+    assert all(r.return_code == 0 for r in results)
+
+
+def test_large_output_and_missing_programs():
+    results = Multiplexer().run_all([clom.seq(200000), clom['not-a-real-command'], clom.echo('$HOME')])
+    assert '200000' == results[0].last()
+    assert 127 == results[1].code
+    assert '$HOME' == results[2]
+
+
+def test_stop_early_kills_the_rest():
+    run = Multiplexer().run([clom.true, clom.sleep(30)])
+    op, r = next(run)
+    assert 'true' == op
+    started = time.time()
+    run.close()
+    assert time.time() - started < 5
+
+
+def test_other_operations():
+    fake = FakeBackend(stdout='faked\n')
+    upper = lambda lines: (l.upper() for l in lines)
+    results = Multiplexer(backend=fake).run_all([clom.ls, clom.echo('x').with_backend(LocalBackend()) | upper])
+    assert ['faked', 'X'] == [str(r) for r in results]
+    assert ['ls'] == fake.calls
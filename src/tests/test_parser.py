@@ -0,0 +1,76 @@
+import pytest
+
+from clom import clom, parse, AND, OR, STDERR, STDOUT
+from clom.arg import RawArg, QuotedArg
+from clom.command import Command
+from clom.fabric import FabCommand
+from clom.parser import ParseError, parse_cache_info
+
+OPERATIONS = [
+    clom.ls,
+    clom.curl('example.com', f=True, header='X-Test: 1', NO_PROXY='*'),
+    clom.echo(clom.echo(r""" $`'" \ """), 'x'),
+    clom.echo(''),
+    clom.echo(RawArg('$HOME/*.txt')),
+    clom.grep('*.pyc', 'test.txt').append_to_file('o', STDERR).redirect(STDERR, STDOUT),
+    clom.cat.from_file('in put').output_to_file('out'),
+    OR(clom.grep('*.pyc', 'test.txt'), clom.wc, AND(clom.cat, clom.ls)).pipe_to(clom.wc).output_to_file('x y'),
+    clom.ls.pipe_to(clom.grep('a')).pipe_to(clom.sort(r=True)),
+    clom.VBoxHeadless.with_opts(startvm='Windows Base').background(),
+    AND(clom.make, clom.make.install).background(),
+    clom.fab.test('doctest', 'unit').deploy('dev'),
+    clom.ls.with_env(A='x y', B=2),
+]
+
+
+@pytest.mark.parametrize('op', OPERATIONS)
+def test_round_trip(op):
+    assert str(parse(str(op))) == str(op)
+
+
+def test_structure():
+    op = parse('A=1 B=$HOME ls -l "my dir" a\\ b | wc -l > count 2>&1')
+    assert type(op) is Command
+    assert op._env['A'] == '1'
+    assert isinstance(op._env['B'], RawArg)
+    assert isinstance(op._args[1], QuotedArg)
+    assert [str(a) for a in op._args] == ['-l', '"my dir"', 'a\\ b']
+    assert op._argv() is None
+    wc = op._pipe_to[0]
+    assert wc._redirects == {STDOUT: ('>', 'count'), STDERR: ('>&', STDOUT)}
+
+    # Quoted arguments are still plain values for direct execution
+    assert parse('echo "my dir" \'x\'')._argv() == ['echo', 'my dir', 'x']
+    assert parse('echo "my dir" \'x\'').shell.all() == ['my dir x']
+
+    op = parse('a && b && c || d')
+    assert isinstance(op, OR)
+    assert isinstance(op.commands[0], AND)
+    assert len(op.commands[0].commands) == 3
+
+    assert isinstance(parse('fab deploy:dev'), FabCommand)
+    assert parse('fab deploy:dev').restart == 'fab deploy:dev restart'
+    assert parse('$EDITOR file.txt') == '$EDITOR file.txt'
+
+
+def test_builders_on_parsed():
+    op = parse('rsync -a src/ dest/')
+    assert op.with_opts(delete=True) == 'rsync --delete -a src/ dest/'
+    assert op.hide_output(STDERR).pipe_to(clom.tail) == 'rsync -a src/ dest/ 2> /dev/null | tail'
+    # The cached original is untouched
+    assert parse('rsync -a src/ dest/') == 'rsync -a src/ dest/'
+
+
+def test_cache():
+    before = parse_cache_info()['hits']
+    assert parse('echo cached') is parse('echo cached')
+    assert parse_cache_info()['hits'] > before
+
+
+@pytest.mark.parametrize('cmdline', [
+    '', 'a ; b', 'a &', 'cat <<EOF', 'echo "unterminated', "echo 'unterminated",
+    '( a && b', 'a &&', '> out', 'cat > out extra', 'ls &> log',
+])
+def test_errors(cmdline):
+    with pytest.raises(ParseError):
+        parse(cmdline)
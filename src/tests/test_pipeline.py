@@ -0,0 +1,76 @@
+import itertools
+
+import pytest
+
+from clom import clom, AND
+from clom.shell import CommandError
+
+
+def errors(lines):
+    for line in lines:
+        if 'ERROR' in line:
+            yield line
+
+
+def numbered(lines):
+    for i, line in enumerate(lines, 1):
+        yield '%d %s' % (i, line)
+
+
+def take3(lines):
+    return itertools.islice(lines, 3)
+
+
+def test_python_stage_between_commands():
+    op = clom.printf('ok\\nERROR a\\nok\\nERROR b\\n') | errors | clom.wc(l=True)
+    assert '2' == op.shell().first()
+
+
+def test_python_stage_last():
+    assert ['1 x', '2 y'] == (clom.printf('x\\ny\\n') | numbered).shell.all()
+    assert ['1 ERROR'] == (clom.echo('ERROR') | errors | numbered).shell.all()
+
+
+def test_nested_pipes_are_flattened():
+    op = clom.printf('b\\na\\n').pipe_to(clom.sort.pipe_to(numbered))
+    assert ['1 a', '2 b'] == op.shell.all()
+
+
+def test_streams_without_buffering_everything():
+    # yes never ends on its own, the Python stage stopping closes the pipe under it
+    assert ['y', 'y', 'y'] == (clom.yes | take3).shell.all()
+    lines = (clom.yes | numbered).shell.stream()
+    assert ['1 y', '2 y'] == list(itertools.islice(lines, 2))
+    lines.close()
+
+
+def test_status_and_errors():
+    with pytest.raises(CommandError) as e:
+        (clom.echo('x') | errors | clom.sh(c='cat; echo bad >&2; exit 4')).shell()
+    assert 4 == e.value.code
+    assert 'bad\n' == e.value.stderr
+
+    def broken(lines):
+        for line in lines:
+            raise RuntimeError('boom')
+        yield ''
+
+    with pytest.raises(CommandError) as e:
+        (clom.echo('x') | broken).shell()
+    assert 'broken' in str(e.value)
+    assert 'broken' == e.value.stage
+    assert isinstance(e.value.__cause__, RuntimeError)
+
+
+def test_in_native_conjunction():
+    r = AND(clom.echo('ERROR 1') | errors, clom.echo('done')).shell()
+    assert ['ERROR 1', 'done'] == r.all()
+
+
+def test_rendering():
+    op = clom.cat('big.log') | errors | clom.gzip
+    assert "'cat big.log' | <errors> | 'gzip'" == repr(op)
+    with pytest.raises(ValueError):
+        str(op)
+    with pytest.raises(TypeError):
+        clom.cat | 'gzip'
@@ -0,0 +1,125 @@
+import errno
+import os
+import sys
+
+import pytest
+
+from clom import clom, AND
+from clom.backend import FakeBackend, LocalBackend
+from clom.priority import Priority
+from clom.spawn import PrioritySpawner
+from clom.wire import dumps, loads
+
+needs_linux = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='Linux only')
+
+
+def test_renders_prefix():
+    op = clom.rsync('-a', 'src', 'dst').with_priority(nice=10, ionice='idle', cpu_affinity=[3, 2, 3])
+    assert 'taskset -c 2,3 ionice -c 3 nice -n 10 rsync -a src dst' == op
+    assert 'nice -n 5 git status' == clom.git.with_priority(nice=5).status
+    assert "nice -n 5 sh -c '( true && false )'" == AND(clom.true, clom.false).with_priority(nice=5)
+    assert 'nohup ionice -c 2 ls &> /dev/null &' == clom.ls.with_priority(ionice='best-effort').background()
+    assert 'env A=1 ls' == clom.ls.with_env(A=1)
+    assert 'nice -n 1 env A=1 ls' == clom.ls.with_env(A=1).with_priority(nice=1)
+    # The original isn't changed
+    ls = clom.ls
+    ls.with_priority(nice=1)
+    assert 'ls' == ls
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        Priority(ionice='urgent')
+    with pytest.raises(ValueError):
+        Priority(ionice=('idle', 3))
+    with pytest.raises(ValueError):
+        Priority(ionice=('best-effort', 8))
+    with pytest.raises(ValueError):
+        Priority(cpu_affinity=[])
+    with pytest.raises(TypeError):
+        Priority(nice='10')
+
+
+def test_wire_round_trip():
+    op = (clom.tar('c', '.') | clom.gzip).with_priority(nice=3, ionice=('realtime', 2), cpu_affinity=[0])
+    assert op == loads(dumps(op))
+    assert loads(dumps(clom.ls))._priority is None
+
+
+def test_fab_actions_and_coalescing():
+    from clom.fabric import coalesce
+
+    deploy = clom.fab.with_priority(nice=5).deploy('dev')
+    assert 'nice -n 5 fab deploy:dev' == deploy
+    op, priority = deploy._without_priority()
+    assert ['fab', 'deploy:dev'] == op._argv()
+    assert Priority(nice=5) == priority
+
+    # Only commands with the same priority share an invocation
+    niced = clom.fab.deploy('dev').with_priority(nice=19)
+    assert ['nice -n 19 fab deploy:dev', 'fab migrate'] == [
+        str(c) for c in coalesce([niced, clom.fab.migrate])]
+    assert ['fab migrate', 'nice -n 19 fab deploy:dev'] == [
+        str(c) for c in coalesce([clom.fab.migrate, niced])]
+    assert ['nice -n 19 fab deploy:dev migrate'] == [
+        str(c) for c in coalesce([niced, clom.fab.migrate.with_priority(nice=19)])]
+
+
+def test_non_local_backends_get_the_prefix():
+    fake = FakeBackend()
+    clom.gzip('x').with_priority(nice=10).with_backend(fake).shell()
+    assert ['nice -n 10 gzip x'] == fake.calls
+
+
+@needs_linux
+def test_applied_when_spawned(tmpdir):
+    op = clom.gzip('x').with_priority(nice=10)
+    shell = op.shell
+    cmd, env, backend = shell._prepare(op, LocalBackend(), direct=True)
+    assert ['gzip', 'x'] == cmd
+    assert isinstance(backend.spawner, PrioritySpawner)
+
+    script = 'import os; print(os.nice(0), sorted(os.sched_getaffinity(0)))'
+    cpu = min(os.sched_getaffinity(0))
+    python = clom[sys.executable]('-c', script).with_priority(nice=7, cpu_affinity=[cpu])
+    before = os.nice(0)
+    assert '%d [%d]' % (before + 7, cpu) == python.shell()
+    assert before == os.nice(0)
+
+    # Everything in a pipeline gets it
+    piped = (clom[sys.executable]('-c', script) | clom.cat).with_priority(nice=3)
+    assert str(before + 3) == piped.shell().stdout.split()[0]
+
+
+@needs_linux
+def test_unavailable_cpus_and_failures(monkeypatch):
+    from clom.shell import CommandError
+
+    with pytest.raises(CommandError) as e:
+        clom.true.with_priority(cpu_affinity=[max(os.sched_getaffinity(0)) + 1000]).shell()
+    assert 'true' in str(e.value)
+    assert isinstance(e.value.__cause__, ValueError)
+
+    def not_permitted(increment):
+        raise OSError(errno.EPERM, 'Operation not permitted')
+
+    def failed(pid, cpus):
+        raise OSError(errno.EINVAL, 'Invalid argument')
+
+    # Patched before the fork so the child has them too
+    monkeypatch.setattr(os, 'nice', not_permitted)
+    # Like nice(1), runs anyway
+    assert 0 == clom.true.with_priority(nice=-5).shell().return_code
+
+    monkeypatch.setattr(os, 'sched_setaffinity', failed)
+    with pytest.raises(CommandError) as e:
+        clom.true.with_priority(cpu_affinity=[min(os.sched_getaffinity(0))]).shell()
+    assert 'true' in str(e.value)
+
+
+@needs_linux
+@pytest.mark.skipif(not os.path.exists('/usr/bin/ionice'), reason='Needs ionice to check')
+def test_ionice_applied():
+    op = clom.sh(c='ionice -p $$').with_priority(ionice='idle')
+    assert Priority(ionice='idle').is_native()
+    assert 'idle' == op.shell()
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from clom import clom
+from clom.shell import CommandError
+from clom.scheduler import Scheduler, URGENT, BULK, command_name
+
+
+def test_command_name():
+    assert 'git' == command_name(clom.git.status)
+    assert 'cat' == command_name(clom.cat('x') | clom.gzip)
+
+
+def test_result_and_error():
+    with Scheduler(workers=2) as scheduler:
+        ok = scheduler.submit(clom.echo('hi'))
+        failed = scheduler.submit(clom.false)
+        assert 'hi' == ok.result(timeout=5)
+        with pytest.raises(CommandError):
+            failed.result(timeout=5)
+    assert ok.done() and failed.done()
+    assert ok.wait_time >= 0
+
+
+def test_urgent_runs_before_queued_bulk(tmpdir):
+    log = tmpdir.join('log')
+    with Scheduler(workers=1) as scheduler:
+        blocker = scheduler.submit(clom.sleep(0.3))
+        for i in range(5):
+            scheduler.submit(clom.sh(c='echo bulk >> %s' % log), priority=BULK)
+        scheduler.submit(clom.sh(c='echo urgent >> %s' % log), priority=URGENT)
+        blocker.result(timeout=5)
+    assert ['urgent'] + ['bulk'] * 5 == log.read().split()
+
+
+def test_keys_take_turns(tmpdir):
+    log = tmpdir.join('log')
+    with Scheduler(workers=1) as scheduler:
+        scheduler.submit(clom.sleep(0.3))
+        for i in range(3):
+            scheduler.submit(clom.sh(c='echo a >> %s' % log), key='a')
+        for i in range(3):
+            scheduler.submit(clom.sh(c='echo b >> %s' % log), key='b')
+    assert 'a b a b a b'.split() == log.read().split()
+
+
+def test_caps_limit_running():
+    most = [0]
+
+    class Watching(Scheduler):
+        def _next(self):
+            ticket = super(Watching, self)._next()
+            if ticket is not None and ticket.key == 'sleep':
+                most[0] = max(most[0], self._running['sleep'] + 1)
+            return ticket
+
+    with Watching(workers=4, caps={'sleep': 2}) as scheduler:
+        tickets = [scheduler.submit(clom.sleep(0.1)) for _ in range(6)]
+        other = scheduler.submit(clom.echo('free'))
+        assert 'free' == other.result(timeout=5)
+    assert all(t.done() for t in tickets)
+    assert 2 == most[0]
+
+
+def test_metrics():
+    scheduler = Scheduler(workers=1)
+    try:
+        scheduler.submit(clom.sleep(0.3))
+        time.sleep(0.1)
+        scheduler.submit(clom.echo('a'), priority=BULK)
+        scheduler.submit(clom.echo('b'), priority=BULK, key='tenant')
+
+        m = scheduler.metrics()
+        assert {BULK: 2} == m['queued']
+        assert {'echo': 1, 'tenant': 1} == m['queued_by_key']
+        assert {'sleep': 1} == m['running']
+        assert m['oldest_wait'][BULK] >= 0
+    finally:
+        scheduler.shutdown()
+
+    m = scheduler.metrics()
+    assert {} == m['queued']
+    assert 3 == sum(w['count'] for w in m['wait_times'].values())
+    assert m['wait_times'][BULK]['max'] >= 0.1
+
+
+def test_shutdown_cancel():
+    scheduler = Scheduler(workers=1)
+    scheduler.submit(clom.sleep(0.2))
+    queued = scheduler.submit(clom.echo('never'))
+    scheduler.shutdown(cancel=True)
+    with pytest.raises(RuntimeError):
+        queued.result()
+    with pytest.raises(RuntimeError):
+        scheduler.submit(clom.echo('late'))
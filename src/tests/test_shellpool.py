@@ -0,0 +1,109 @@
+import pytest
+
+from clom import clom
+from clom.shell import CommandError
+from clom.shellpool import ShellPool, ShellWorker
+
+
+def test_worker_output_and_status():
+    worker = ShellWorker()
+    try:
+        assert (3, b'out', b'err\n') == worker.execute('printf out; echo err >&2; exit 3')
+        assert (0, b'a\n\nb\n\n', b'') == worker.execute("printf 'a\\n\\nb\\n\\n'")
+        big = worker.execute('seq 100000')
+        assert big[1] == b''.join(b'%d\n' % i for i in range(1, 100001))
+        assert worker.check()
+        assert 4 == worker.commands
+    finally:
+        worker.close()
+
+
+def test_run_isolates_cwd_and_env(tmpdir):
+    with ShellPool(size=1) as pool:
+        assert str(tmpdir) == pool.run(clom.pwd, cwd=str(tmpdir))
+        assert "it's" == pool.run(clom.sh(c='echo "$GREETING"'), env={'GREETING': "it's"})
+        pool.run(clom.sh(c='cd /; X=1; export X'))
+        assert pool.run(clom.pwd) != '/'
+        assert '' == pool.run(clom.sh(c='echo "$X"'))
+        # exit only ends the operation's subshell
+        assert 4 == pool._run(clom.exit(4)).return_code
+        assert 'still here' == pool.run(clom.echo('still here'))
+
+        with pytest.raises(ValueError):
+            pool.run(clom.true, env={'not a name': '1'})
+
+
+def test_run_raises_like_shell():
+    with ShellPool(size=1) as pool:
+        with pytest.raises(CommandError) as e:
+            pool.run(clom.sh(c='echo nope >&2; exit 2'))
+        assert 2 == e.value.return_code
+        assert 'nope\n' == e.value.stderr
+
+
+def test_map_in_parallel():
+    with ShellPool(size=4) as pool:
+        pids = set(str(r) for r in pool.map([clom.sh(c='sleep 0.2; echo $PPID')] * 4))
+        results = pool.map([clom.echo(i) for i in range(20)] + [clom.false])
+    assert 4 == len(pids)
+    assert [str(i) for i in range(20)] == [str(r) for r in results[:20]]
+    assert isinstance(results[-1], CommandError)
+
+
+def test_map_keeps_results_when_a_shell_dies():
+    with ShellPool(size=2) as pool:
+        results = pool.map([clom.echo('a'), clom.sh(c='kill -9 $PPID'), clom.echo('b')])
+    assert ['a', 'b'] == [str(results[0]), str(results[2])]
+    assert isinstance(results[1], CommandError)
+    # The shell's status, or a stand in if it has none
+    assert isinstance(results[1].return_code, int) and results[1].return_code != 0
+
+
+def test_failed_start_closes_started_shells():
+    from clom.backend import LocalBackend
+
+    started = []
+
+    class Flaky(LocalBackend):
+        def popen(self, cmd, **kwargs):
+            if started:
+                raise OSError('no more shells')
+            p = super(Flaky, self).popen(cmd, **kwargs)
+            started.append(p)
+            return p
+
+    with pytest.raises(OSError):
+        ShellPool(size=2, backend=Flaky())
+    assert started[0].poll() is not None
+
+
+def test_replaces_dead_and_recycles():
+    with ShellPool(size=1, max_commands=3) as pool:
+        worker = pool._workers[0]
+        first = worker.pid
+        pool.run(clom.true)
+        pool.run(clom.true)
+        pool.run(clom.true)
+        pool.run(clom.true)
+        assert worker.pid != first
+        assert 1 == worker.commands
+
+        # Kill the shell itself, not the subshell running the operation
+        with pytest.raises(CommandError):
+            pool.run(clom.sh(c='kill -9 $PPID'))
+        assert 'back' == pool.run(clom.echo('back'))
+
+        pool._workers[0]._process.kill()
+        pool._workers[0]._process.wait()
+        assert 1 == pool.check()
+        assert 0 == pool.check()
+
+
+def test_strategies():
+    with pytest.raises(ValueError):
+        ShellPool(size=1, strategy='random')
+
+    with ShellPool(size=3, strategy='round_robin') as pool:
+        for _ in range(6):
+            pool.run(clom.true)
+        assert [2, 2, 2] == [w.commands for w in pool._workers]
@@ -0,0 +1,83 @@
+import pytest
+
+from clom import clom
+from clom.backend import FakeBackend
+from clom.shell import CommandError
+from clom.sinks import FileSink, LineCallback, Counter, Sink
+
+
+def test_fan_out(tmpdir):
+    log = str(tmpdir.join('out.log'))
+    errlog = str(tmpdir.join('err.log'))
+    lines = []
+    count = Counter()
+    cmd = clom.sh(c='seq 1 5000; echo oops >&2')
+
+    r = cmd.shell.with_sinks(
+        stdout=[FileSink(log), LineCallback(lines.append), count],
+        stderr=[FileSink(errlog)],
+    )()
+
+    assert r.stdout == ''
+    assert 5000 == count.lines == len(lines)
+    assert lines[-1] == '5000'
+    assert open(log).read() == ''.join('%d\n' % i for i in range(1, 5001))
+    assert open(errlog).read() == 'oops\n'
+
+
+def test_file_sink_append(tmpdir):
+    log = str(tmpdir.join('out.log'))
+    shell = clom.echo('a').shell.with_sinks(stdout=[FileSink(log, append=True)])
+    shell()
+    shell()
+    assert open(log).read() == 'a\na\n'
+
+
+def test_line_callback_partial_lines():
+    lines = []
+    sink = LineCallback(lines.append)
+    sink.open('UTF-8')
+    for chunk in (b'ab', b'c\nd\xc3', b'\xa9\n', b'tail'):
+        sink.write(chunk)
+    sink.close()
+    assert lines == ['abc', u'd\xe9', 'tail']
+
+
+def test_failure_still_closes_sinks(tmpdir):
+    log = str(tmpdir.join('out.log'))
+    sink = FileSink(log)
+    with pytest.raises(CommandError) as e:
+        clom.sh(c='echo partial; exit 2').shell.with_sinks(stdout=[sink])()
+    assert 2 == e.value.code
+    assert sink._file is None
+    assert open(log).read() == 'partial\n'
+
+
+def test_open_failure_closes_opened_sinks(tmpdir):
+    log = str(tmpdir.join('out.log'))
+    opened = FileSink(log)
+    missing = FileSink(str(tmpdir.join('missing', 'err.log')))
+    with pytest.raises(IOError):
+        clom.echo('x').shell.with_sinks(stdout=[opened], stderr=[missing])()
+    assert opened._file is None
+    assert open(log).read() == ''
+
+
+def test_sink_errors_stop_the_command():
+    class Broken(Sink):
+        def write(self, data):
+            raise RuntimeError('full')
+
+    with pytest.raises(RuntimeError):
+        clom.yes.shell.with_sinks(stdout=[Broken()])()
+
+
+def test_python_stages_and_fake_backend():
+    seen = []
+    (clom.printf('a\\nb\\n') | (lambda lines: (l.upper() for l in lines))).shell.with_sinks(
+        stdout=[LineCallback(seen.append)])()
+    assert seen == ['A', 'B']
+
+    count = Counter()
+    clom.ls.with_backend(FakeBackend(stdout='x\ny\n')).shell.with_sinks(stdout=[count])()
+    assert count.lines == 2
@@ -0,0 +1,134 @@
+import errno
+import os
+import subprocess
+
+import pytest
+
+from clom import clom
+from clom.backend import LocalBackend
+from clom.shell import CommandError
+from clom.spawn import PosixSpawner, PopenSpawner, SpawnedProcess
+
+posix_spawn = pytest.mark.skipif(not hasattr(os, 'posix_spawn'), reason='os.posix_spawn is not available')
+
+
+@posix_spawn
+def test_pipes_and_redirects(tmpdir):
+    spawner = PosixSpawner()
+
+    p = spawner.spawn(['cat'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert isinstance(p, SpawnedProcess)
+    assert (b'in', None) == p.communicate(b'in')
+    assert 0 == p.returncode
+
+    p = spawner.spawn('echo out; echo err >&2; exit 3', stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    assert (b'out\nerr\n', None) == p.communicate()
+    assert 3 == p.returncode
+
+    path = str(tmpdir.join('out'))
+    with open(path, 'wb') as f:
+        spawner.spawn(['echo', 'to file'], stdout=f, stderr=subprocess.DEVNULL).wait()
+    assert 'to file\n' == open(path).read()
+
+    p = spawner.spawn('echo $CLOM_VAR', stdout=subprocess.PIPE, env={'CLOM_VAR': 'x'})
+    assert (b'x\n', None) == p.communicate()
+
+
+@posix_spawn
+def test_sessions_signals_and_timeouts():
+    p = PosixSpawner().spawn(['sleep', '10'], start_new_session=True)
+    assert os.getpgid(p.pid) == p.pid
+    with pytest.raises(subprocess.TimeoutExpired):
+        p.wait(timeout=0.05)
+    p.kill()
+    assert -9 == p.wait()
+    assert -9 == p.poll()
+
+
+@posix_spawn
+def test_close_fds():
+    r, w = os.pipe()
+    os.set_inheritable(w, True)
+    try:
+        check = 'test -e /dev/fd/%d && echo open || echo closed' % w
+        for kwargs, expected in (({}, b'closed\n'), ({'close_fds': True}, b'closed\n'),
+                                 ({'close_fds': False}, b'open\n')):
+            p = PosixSpawner().spawn(check, stdout=subprocess.PIPE, **kwargs)
+            assert isinstance(p, SpawnedProcess)
+            assert (expected, None) == p.communicate()
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+@posix_spawn
+def test_lost_status_is_not_success():
+    from clom.spawn import UNKNOWN_STATUS
+    p = PosixSpawner().spawn(['true'])
+    os.waitpid(p.pid, 0)
+    assert UNKNOWN_STATUS == p.wait()
+    assert UNKNOWN_STATUS == p.poll()
+
+
+@posix_spawn
+def test_restores_signals_like_popen():
+    # yes gets SIGPIPE when head exits, if it's ignored yes complains on stderr
+    cmd = 'yes | head -1'
+    popen = clom.sh(c=cmd).shell.with_spawner(PopenSpawner())()
+    spawned = clom.sh(c=cmd).shell.with_spawner(PosixSpawner())()
+    assert 'y' == spawned
+    assert popen.stderr == spawned.stderr == ''
+
+
+@posix_spawn
+def test_program_found_on_the_child_path(tmpdir):
+    tool = tmpdir.join('clom-test-tool')
+    tool.write('#!/bin/sh\necho found\n')
+    tool.chmod(0o755)
+    env = dict(os.environ, PATH=str(tmpdir))
+    p = PosixSpawner().spawn(['clom-test-tool'], stdout=subprocess.PIPE, env=env)
+    assert (b'found\n', None) == p.communicate()
+
+    with pytest.raises(OSError) as e:
+        PosixSpawner().spawn(['clom-test-tool'])
+    assert errno.ENOENT == e.value.errno
+
+    tool.chmod(0o644)
+    with pytest.raises(OSError) as e:
+        PosixSpawner().spawn(['clom-test-tool'], env=env)
+    assert errno.EACCES == e.value.errno
+
+
+@posix_spawn
+def test_fallback():
+    spawner = PosixSpawner()
+    assert not spawner.can_spawn({'cwd': '/'})
+    p = spawner.spawn(['pwd'], stdout=subprocess.PIPE, cwd='/')
+    assert isinstance(p, subprocess.Popen)
+    assert b'/\n' == p.communicate()[0]
+
+
+@posix_spawn
+def test_shell_with_spawner():
+    shell = clom.sh(c='echo $GREETING; echo err >&2', GREETING='hi').shell.with_spawner(PosixSpawner())
+    assert isinstance(shell.backend.spawner, PosixSpawner)
+    r = shell()
+    assert 'hi' == r
+    assert 'err\n' == r.stderr
+    assert ['a', 'b'] == (clom.printf('b\\na\\n') | clom.sort).shell.with_spawner(PosixSpawner()).all()
+
+    with pytest.raises(CommandError) as e:
+        clom['not-a-real-command'].shell.with_spawner(PosixSpawner())()
+    assert 127 == e.value.code
+
+    # Missing programs are reported like the shell does when run directly
+    assert 127 == LocalBackend().with_spawner(PosixSpawner()).run(['not-a-real-command'])[0]
+
+
+def test_backend_with_spawner():
+    backend = LocalBackend()
+    spawner = PopenSpawner()
+    assert backend.with_spawner(None) is backend
+    other = backend.with_spawner(spawner)
+    assert other is not backend
+    assert other.spawner is spawner and backend.spawner is None
@@ -0,0 +1,106 @@
+import pytest
+
+from clom import clom
+from clom.backend import FakeBackend
+from clom.shell import CommandError, CommandResult
+from clom import streams
+
+
+def test_split_across_chunks():
+    assert ['ab', 'cd', 'e'] == list(streams.split(['a', 'b\nc', 'd\n', 'e']))
+    assert ['a', '', 'b'] == list(streams.split(['a\n\nb\n']))
+    assert [] == list(streams.split([]))
+
+
+def test_columns():
+    ps = [
+        '  PID TTY          TIME CMD',
+        '    1 ?        00:00:01 /sbin/init splash',
+        '',
+        '  412 pts/0    00:00:00 -bash',
+    ]
+    rows = list(streams.columns(ps))
+    assert [r['PID'] for r in rows] == ['1', '412']
+    assert rows[0]['CMD'] == '/sbin/init splash'
+
+    rows = list(streams.columns(['root:x:0:0', 'bin:x:1:1'], sep=':', header=['user', 'pw', 'uid', 'gid']))
+    assert rows[1] == {'user': 'bin', 'pw': 'x', 'uid': '1', 'gid': '1'}
+
+    assert [['total', '8'], ['a', 'b']] == list(streams.columns(['total 8', 'a b'], header=False))
+
+
+def test_result_parsers_are_lazy():
+    r = CommandResult(0, '{"n": 1}\n{"n": 2}\nnot json\n')
+    rows = r.jsonl()
+    assert {'n': 1} == next(rows)
+    assert {'n': 2} == next(rows)
+    with pytest.raises(ValueError):
+        next(rows)
+
+    r = CommandResult(0, 'sda1 10G\nsdb1 20G\n')
+    assert [('sda1', '10')] == list(r.records(r'^(sda\d) (\d+)G$'))
+
+
+def test_shell_stream():
+    assert ['a', 'b', 'c'] == list(clom.printf.shell.stream('a\\nb\\nc'))
+    assert [{'x': '1', 'y': '2'}] == list(clom.printf('x y\\n1 2\\n').shell.columns())
+    assert [[1, 2]] == list(clom.echo('[1, 2]').shell.jsonl())
+    assert ['x', 'y z'] == list(clom.printf('x\\0y z\\0').shell.split0())
+    assert ['x', 'y z'] == list(clom.printf.shell.split0('x\\0y z\\0'))
+    assert [[1, 2]] == list(clom.echo.shell.jsonl('[1, 2]'))
+    assert [{'n': '3'}] == list(clom.echo('n=3').shell.records('n=(?P<n>\\d+)'))
+
+
+def test_shell_stream_stops_early():
+    lines = clom.yes('y').shell.stream()
+    assert 'y' == next(lines)
+    # Closing kills the command instead of waiting on output nobody wants
+    lines.close()
+
+
+def test_shell_stream_error():
+    lines = clom.sh(c='echo partial; echo oops >&2; exit 3').shell.stream()
+    assert 'partial' == next(lines)
+    with pytest.raises(CommandError) as e:
+        next(lines)
+    assert 3 == e.value.code
+    assert 'oops\n' == e.value.stderr
+
+
+def test_shell_stream_without_processes():
+    fake = FakeBackend(stdout='a 1\nb 2\n')
+    assert [['a', '1'], ['b', '2']] == list(clom.ls.with_backend(fake).shell.columns(header=False))
+
+
+def test_result_line_index():
+    r = CommandResult(0, 'one\n two \r\nthree')
+    assert 3 == len(r)
+    assert ['one', 'two', 'three'] == list(r) == r.all() == r[:]
+    assert 'two' == r[1] == r[-2]
+    assert ['three', 'two', 'one'] == list(reversed(r))
+    assert ['one', 'three'] == r[::2]
+    assert ' two \r\n' == list(r.iter(strip=False))[1]
+    assert 'one' == r.first() and 'three' == r.last()
+    with pytest.raises(IndexError):
+        r[3]
+
+    # Lines are split like splitlines, the same as all()
+    for stdout in ('a\r\nb\rc\n', '10%\r50%\r100%\ndone\n', 'a\x0bb\x0cc\x1cd\u2028e\r\n\r\n',
+                   b'a\r\nb\rc\x0bd\n'):
+        r = CommandResult(0, stdout)
+        assert r.all() == list(r) == r[:]
+        assert len(r.all()) == len(r)
+        assert r.stdout.splitlines(True) == list(r.iter(strip=False))
+        if not isinstance(stdout, bytes):
+            assert r.all()[0] == r.first() and r.all()[-1] == r.last()
+
+    empty = CommandResult(1)
+    assert 0 == len(empty) and empty
+    assert '' == empty.first() == empty.last()
+    assert 1 == empty.last().return_code
+
+    # The index is a cache and doesn't affect equality
+    assert CommandResult(0, 'a\n') == r.__class__(0, 'a\n')
+    indexed = CommandResult(0, 'a\n')
+    len(indexed)
+    assert indexed == CommandResult(0, 'a\n')
@@ -0,0 +1,54 @@
+import pickle
+
+import pytest
+
+from clom import clom, Clom, AND, OR, STDERR, STDOUT
+from clom.arg import RawArg, LiteralArg, Arg, NOTSET
+from clom.backend import FakeBackend
+from clom.wire import dumps, loads, WireError, WIRE_VERSION
+from clom.fabric import FabAction
+
+OPERATIONS = [
+    clom.ls,
+    clom.git.commit('-a', m="don't", amend=True).with_env(GIT_DIR='/tmp/x'),
+    clom.echo(RawArg('$HOME'), LiteralArg('*'), Arg('a b'), None, 3, 1.5, NOTSET),
+    clom.echo(clom.date(u='')).redirect(STDERR, STDOUT).append_to_file('log'),
+    clom.cat.from_file('in').pipe_to(clom.sort).pipe_to(clom.uniq(c=True)).output_to_file('out', STDERR),
+    clom.sleep(10).background(),
+    clom.fab.with_opts('-a', hosts='h1,h2').test('doctest', 'unit').deploy('dev'),
+    AND(clom.make, OR(clom.make.test, clom.echo('failed'))).pipe_to(clom.tee('log')),
+]
+
+
+@pytest.mark.parametrize('op', OPERATIONS)
+def test_round_trip(op):
+    data = dumps(op)
+    copy = loads(data)
+    assert str(copy) == str(op)
+    assert type(copy) is type(op)
+    assert dumps(copy) == data
+    assert len(data) < len(pickle.dumps(op)) / 2
+
+
+def test_loads_clom():
+    fake = FakeBackend(stdout='faked')
+    remote = Clom(backend=fake)
+    op = loads(dumps(clom.fab.deploy('dev')), clom=remote)
+    assert isinstance(op, FabAction)
+    assert str(op.shell()) == 'faked'
+    assert fake.calls == ['fab deploy:dev']
+    # Still builds fab actions
+    assert op.restart == 'fab deploy:dev restart'
+
+
+def test_errors():
+    with pytest.raises(WireError):
+        loads(b'garbage')
+    import marshal
+    with pytest.raises(WireError):
+        loads(marshal.dumps((WIRE_VERSION + 1, ())))
+    # Version 1 trees, without a priority, are still read
+    from clom.wire import to_tree
+    assert 'ls -l' == loads(marshal.dumps((1, to_tree(clom.ls('-l')))))
+    with pytest.raises(TypeError):
+        dumps(object())